@@ -4,27 +4,198 @@
 # Build or re-build source text data structure
 
 from Phyme import Phyme
+from Phyme.IOUtil import load_word_phone_dict
+import bisect
+import collections
 import configparser
-import mariadb
+import contextlib
+import hashlib
+import itertools
+import json
+import logging
+import logging.handlers
+import marshal
+import multiprocessing
+import os
+import queue
+import random
+import sqlite3
+import struct
 import sys
 import re
 import syllables
+import tempfile
+import threading
 import time
 import string
+import zlib
+
+try:
+    import mariadb
+except ImportError:
+    # Only the MariaDB backend needs the connector.  The SQLite one gets by without it.
+    mariadb = None
+
+# Break Lines apart on: , . ! ? ; : tabspace newline
+#   IMO some of the most interesting magic happens on the comma split because it results in
+#   poetic sentence fragments
+sourceSplitter = re.compile('[,.!?;:\t\n]')
+
+# Track the rhymadex database schema in a simple way: an int incrementing from 1
+# Use this to track whether the target database schema matches what I expect as
+#   I add changes, features, and whatnot.  Every backend (and the explorer's corpus files) checks against it.
+schemaCurrentVersion = 6
+
+def lineHash(line):
+    # A compact 64-bit fingerprint of a piece of text, as a signed int so it fits a BIGINT column as-is.
+    # Good for dedupe and for "has this changed" checks without holding on to the text itself.
+    # Two different lines can share a lineHash.  Across n distinct lines the odds of any collision at all are about
+    #   n^2 / 2^65: 1 in 37 million for a million lines, still under 3% for a billion.  Where a duplicate lineHash
+    #   turns up with the text on hand to check (rhymadex.unstoredLines), the text is compared and a collision is
+    #   reported.  Where it isn't (the in-source fragment dedupe in rhymadex.uniqueFragments, and crossing off a
+    #   source's unchanged lines in an incremental build) the second line is dropped as a duplicate.  That's the
+    #   accepted cost of not holding every line's text in memory for the length of a build.
+    return int.from_bytes(hashlib.blake2b(line.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+def lookupRhymes(phyme, rhymeTarget):
+    # Ask Phyme for the perfect rhymes of rhymeTarget.  Pure CPU work and no DB, so it's safe to run in a
+    #   builder worker process.
+    # Returns the list of cleaned rhyme words, rhymeTarget itself included, or None if the word isn't rhymable.
+    try:
+        # RhymeTypes:
+        #   1 = same vowels and consonants of the same type regardless of voicing (HAWK, DOG)
+        #   2 = same vowels and consonants as well as any extra consonants (DUDES, DUES)
+        #   3 = same vowels and a subset of the same consonants (DUDE, DO)
+        #   4 = same vowels and some of the same consonants,
+        #       with some swapped for other consonants (FACTOR, FASTER)
+        #   5 = same vowels and arbitrary consonants (CASH, CATS)
+        #   6 = not the same vowels but the same consonants (CAT, BOT)
+        # What comes back is a dictionary of syllable counts with
+        #   corresponding lists of rhyme words.
+        rhymeTargetRhymeList = phyme.get_perfect_rhymes(rhymeTarget).values() # Type 1 rhymes
+    except KeyError:
+        # KeyError comes up if rhymeTarget isn't in the rhyme dictionary at all
+        return None
+
+    # rhymeTargetRhymeList is a list of lists, collapse to a single list of all the words
+    rhymeTargetRhymeList = [result for list in rhymeTargetRhymeList for result in list]
+
+    # Strip out non-characters.  Some of the returned results from Phyme have (1) and other crap
+    rhymeTargetRhymeList = [re.findall("[a-z]*", rhymeResult.lower())[0] for rhymeResult in rhymeTargetRhymeList]
+    rhymeTargetRhymeList = [rhymeResult for rhymeResult in rhymeTargetRhymeList if rhymeResult]
+
+    # And append it to the rhymeTargetRhymeList so it, itself, is added to the rhyme pool with all
+    #   of its friends and will be excluded automatically in the next run as well.
+    # Appended as-is rather than cleaned like the Phyme results, so a word like "don't" is stored as "don't" (what
+    #   actually turns up in tblLines) and not as "don".
+    rhymeTargetRhymeList.append(rhymeTarget)
+    return rhymeTargetRhymeList
+
+def rhymeHint(rhymeTarget):
+    # The rhymeHint is a right-handish segment of the word.
+    #   Optional-vowel-optional-const-required-vowel-optional-const-end-anchor.
+    #   This is a dumb chunky approach, but just for fun..
+    #   Might not be unique, might not be anything at all.  Just a hint.  Something to
+    #   look at when browsing the pool.
+    #   It's really only the rhymePool id that matters to me.
+    return (re.findall("[aeiou]*[qwrtypsdfghjklzxcvbnm]*[aeiouy]+[qwrtypsdfghjklzxcvbnm]*$",
+                       rhymeTarget) or ["Unknown"])[0]
+
+def firstLastWords(sourceLineWords):
+    # The (firstWord, lastWord) of a cleaned line's words, or None if either won't fit in the 34-char word columns
+    firstWord = sourceLineWords[0]
+    lastWord = sourceLineWords[-1]
+    if (len(firstWord) and len(lastWord) and (len(firstWord) <= 34) and (len(lastWord) <= 34)):
+        return firstWord, lastWord
+    return None
+
+def lineDetails(sourceLine, syllableCounter):
+    # Split a cleaned line in to words and work out what tblLines wants to know about it.
+    # Returns (wordCount, firstWord, lastWord, syllables).  syllables is None if the firstWord or lastWord
+    #   won't fit in the 34-char word columns (see firstLastWords), meaning the line should be discarded.
+    sourceLineWords = sourceLine.split()
+    if firstLastWords(sourceLineWords):
+        # Line Syllable Count
+        # Can only count syllables per-word, so look up every word in the line and accumulate.
+        #   Mostly these are CMU dictionary counts, only unknown words fall back to the estimator.
+        sourceLineSyllables = syllableCounter.countLine(sourceLineWords)
+        return len(sourceLineWords), sourceLineWords[0], sourceLineWords[-1], sourceLineSyllables
+
+    return len(sourceLineWords), sourceLineWords[0], sourceLineWords[-1], None
+
+# Per-process state for parallel builder workers, set up once by workerInit when the pool starts
+workerState = {}
+
+def workerInit(syllableCounts):
+    # Each worker gets a copy of the writer's word -> syllables memo to count lines with.
+    #   Its own Phyme is loaded later, only if it's asked to look up rhymes.
+    workerState["syllableCounter"] = syllableCounter(syllableCounts=syllableCounts)
+
+def workerLookupRhymes(rhymeTarget):
+    # Phyme lookup for one word, using this worker's Phyme (see rhymer.resolveWords)
+    if "phyme" not in workerState:
+        workerState["phyme"] = Phyme()
+    return lookupRhymes(workerState["phyme"], rhymeTarget)
+
+def workerProcessFragments(fragments):
+    # Clean and count syllables for a batch of fragments.
+    # Returns (results, newSyllableCounts, stageSeconds).  newSyllableCounts are the word -> syllables this worker
+    #   had to estimate for this batch, for the writer to remember and store.  stageSeconds is how long the
+    #   "clean" and "syllables" stages took, for the writer's debugger.
+    # results has one result per fragment, in order:
+    #   None if the cleaned line won't fit in tblLines, otherwise
+    #   (sourceLine, wordCount, firstWord, lastWord, syllables)
+    results = []
+    started = time.perf_counter()
+    sourceLines = lineCleanerEngine.cleanBatch(fragments)
+    cleaned = time.perf_counter()
+    for sourceLine in sourceLines:
+        if not (sourceLine and (len(sourceLine) < 256)):
+            results.append(None)
+            continue
+
+        results.append((sourceLine,) + lineDetails(sourceLine, workerState["syllableCounter"]))
+    stageSeconds = {"clean": cleaned - started, "syllables": time.perf_counter() - cleaned}
+    return results, workerState["syllableCounter"].takeNewWords(), stageSeconds
 
 class debugger:
-    def __init__(self):
+    # Upper bounds (in seconds) of the query latency histogram buckets, plus one more bucket for everything slower.
+    #   Same idea as a Prometheus histogram's "le" buckets.
+    latencyBuckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    # Message severities, lowest to highest.  Anything below the debugger's level is dropped the moment it's
+    #   passed in, before it's formatted or kept.  Severities not listed here count as INFO.
+    levels = {"QRYBLD": 10, "INFO": 20, "DEBUG SUMMARY": 30, "ERROR": 40}
+
+    def __init__(self, level="INFO", retainMessages=1000):
         self.stats = {}
-        self.messages = []
         self.printEnabled = True
+        self.progressPercent = None
+        self.setLevel(level)
+
+        # Only the last retainMessages messages are kept around, as (severity, text, timestamp).  The text is
+        #   formatted as the message comes in, so it says what the args were then, and the args themselves (songs'
+        #   dicts and lists that keep on changing) aren't held on to.
+        self.messages = collections.deque(maxlen=retainMessages)
+        self.started = time.time()
+
+        # Metrics, on top of the plain stats counters:
+        #   queries: statement text -> latency histogram, total seconds, count, rows and errors for that statement
+        #   stages: named stage ("clean", "insert", "lineSelection" ..) -> [total seconds, count]
+        # A debugger can be shared by threads (see rhymadexPool), so updates to these, and to the stats, go through
+        #   the lock.
+        self.queries = {}
+        self.stages = {}
+        self.metricsLock = threading.Lock()
 
     def logStat(self, statistic, increment, value=0):
         if not increment:
             increment = 0 # In case None gets pushed through
-        if not statistic in self.stats:
-            self.stats[statistic] = int(increment) or int(value)
-        else:
-            self.stats[statistic] += int(increment)
+        with self.metricsLock:
+            if not statistic in self.stats:
+                self.stats[statistic] = int(increment) or int(value)
+            else:
+                self.stats[statistic] += int(increment)
 
     def getStat(self, statistic):
         if not statistic in self.stats:
@@ -32,29 +203,247 @@ class debugger:
         else:
             return int(self.stats[statistic])
 
-    def message(self, severity, message):
-        messageString = "{}- {}".format(severity, message)
-        self.messages.append({"message": messageString, "timestamp": time.time()})
+    def setLevel(self, level):
+        # e.g. setLevel("QRYBLD") to see every query the explorer builds
+        if level not in self.levels:
+            raise ValueError("Unknown debugger level {!r}, expected one of {}".format(level,
+                                                                                 ", ".join(self.levels)))
+        self.level = level
+        self.levelNumber = self.levels[level]
+
+    def message(self, severity, message, *args):
+        # Pass the message's format() arguments in after it, rather than formatting it first:
+        #   message("INFO", "Song Line: {}", songLine)
+        # so that nothing gets formatted for a message below the level, which is most of them.
+        if self.levels.get(severity, 20) < self.levelNumber:
+            return
+        entry = (severity, message.format(*args) if args else message, time.time())
+        self.messages.append(entry)
         if self.printEnabled:
-            print(messageString)
+            print(self.formatMessage(entry))
+
+    @staticmethod
+    def formatMessage(entry):
+        severity, text, timestamp = entry
+        return "{}- {}".format(severity, text)
+
+    def recentMessages(self):
+        # The retained messages, oldest first, formatted as they'd have been printed
+        return [self.formatMessage(entry) for entry in list(self.messages)]
+
+    def logQuery(self, statement, seconds, rows=None, error=False):
+        # Record one run of statement.  rows is however many rows it matched/affected/returned, if known.
+        with self.metricsLock:
+            queryMetrics = self.queries.get(statement)
+            if not queryMetrics:
+                queryMetrics = self.queries[statement] = {"buckets": [0] * (len(self.latencyBuckets) + 1),
+                                                          "seconds": 0.0, "count": 0, "rows": 0, "errors": 0}
+            queryMetrics["buckets"][bisect.bisect_left(self.latencyBuckets, seconds)] += 1
+            queryMetrics["seconds"] += seconds
+            queryMetrics["count"] += 1
+            if rows and rows > 0:
+                queryMetrics["rows"] += rows
+            if error:
+                queryMetrics["errors"] += 1
+
+    def logTiming(self, stage, seconds, count=1):
+        # Add seconds (over count runs) to a named stage's total
+        with self.metricsLock:
+            stageMetrics = self.stages.setdefault(stage, [0.0, 0])
+            stageMetrics[0] += seconds
+            stageMetrics[1] += count
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        # with debugger.timer("insert"): ... times the block in to the "insert" stage
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.logTiming(stage, time.perf_counter() - started)
+
+    @staticmethod
+    def queryShape(statement):
+        # Short, stable id for a statement, to stand in for the whole text where that's too much
+        return "{:016x}".format(lineHash(statement) & 0xffffffffffffffff)
+
+    def metricsJSON(self):
+        # Every stat, stage and per-statement query metric as a JSON document.  Histogram buckets are cumulative
+        #   and keyed by their upper bound, like Prometheus has them.
+        with self.metricsLock:
+            metrics = {"stats": dict(self.stats),
+                       "stages": {stage: {"seconds": stageMetrics[0], "count": stageMetrics[1]}
+                                  for stage, stageMetrics in self.stages.items()},
+                       "queries": []}
+            for statement, queryMetrics in self.queries.items():
+                bucketBounds = [str(bound) for bound in self.latencyBuckets] + ["+Inf"]
+                metrics["queries"].append({"shape": self.queryShape(statement),
+                                           "statement": " ".join(statement.split()),
+                                           "count": queryMetrics["count"],
+                                           "seconds": queryMetrics["seconds"],
+                                           "rows": queryMetrics["rows"],
+                                           "errors": queryMetrics["errors"],
+                                           "buckets": dict(zip(bucketBounds,
+                                                               itertools.accumulate(queryMetrics["buckets"])))})
+        return json.dumps(metrics, indent=2)
+
+    def metricsPrometheus(self):
+        # The same metrics in Prometheus' text exposition format.  Queries are labelled with their queryShape
+        #   (the statement text is in metricsJSON).
+        lines = []
+        with self.metricsLock:
+            lines.append("# HELP rhymadex_stat rhymadex debugger stats")
+            lines.append("# TYPE rhymadex_stat gauge")
+            for stat, value in self.stats.items():
+                lines.append('rhymadex_stat{{stat="{}"}} {}'.format(stat, value))
+
+            lines.append("# HELP rhymadex_stage_seconds_total Time spent in each named stage")
+            lines.append("# TYPE rhymadex_stage_seconds_total counter")
+            for stage, stageMetrics in self.stages.items():
+                lines.append('rhymadex_stage_seconds_total{{stage="{}"}} {}'.format(stage, stageMetrics[0]))
+            lines.append("# HELP rhymadex_stage_runs_total Times each named stage ran")
+            lines.append("# TYPE rhymadex_stage_runs_total counter")
+            for stage, stageMetrics in self.stages.items():
+                lines.append('rhymadex_stage_runs_total{{stage="{}"}} {}'.format(stage, stageMetrics[1]))
+
+            lines.append("# HELP rhymadex_query_seconds Query latency by statement shape")
+            lines.append("# TYPE rhymadex_query_seconds histogram")
+            for statement, queryMetrics in self.queries.items():
+                shape = self.queryShape(statement)
+                bucketBounds = [str(bound) for bound in self.latencyBuckets] + ["+Inf"]
+                for bound, count in zip(bucketBounds, itertools.accumulate(queryMetrics["buckets"])):
+                    lines.append('rhymadex_query_seconds_bucket{{shape="{}",le="{}"}} {}'.format(shape, bound, count))
+                lines.append('rhymadex_query_seconds_sum{{shape="{}"}} {}'.format(shape, queryMetrics["seconds"]))
+                lines.append('rhymadex_query_seconds_count{{shape="{}"}} {}'.format(shape, queryMetrics["count"]))
+            lines.append("# HELP rhymadex_query_rows_total Rows matched, affected or returned by statement shape")
+            lines.append("# TYPE rhymadex_query_rows_total counter")
+            for statement, queryMetrics in self.queries.items():
+                lines.append('rhymadex_query_rows_total{{shape="{}"}} {}'.format(self.queryShape(statement),
+                                                                                queryMetrics["rows"]))
+            lines.append("# HELP rhymadex_query_errors_total Failed queries by statement shape")
+            lines.append("# TYPE rhymadex_query_errors_total counter")
+            for statement, queryMetrics in self.queries.items():
+                lines.append('rhymadex_query_errors_total{{shape="{}"}} {}'.format(self.queryShape(statement),
+                                                                                  queryMetrics["errors"]))
+        return "\n".join(lines) + "\n"
 
     def summary(self):
-        for stat in self.stats:
-            self.message("DEBUG SUMMARY", "{}: {}".format(stat, self.stats[stat]))
-        self.message("DEBUG SUMMARY", "Runtime: {} seconds".format((self.messages[-1]["timestamp"] -
-                                                                    self.messages[0]["timestamp"])))
+        with self.metricsLock:
+            stats = dict(self.stats)
+            stages = {stage: tuple(stageMetrics) for stage, stageMetrics in self.stages.items()}
+        for stat in stats:
+            self.message("DEBUG SUMMARY", "{}: {}".format(stat, stats[stat]))
+        for stage in stages:
+            self.message("DEBUG SUMMARY", "Stage {}: {:.3f} seconds over {} runs".format(stage, *stages[stage]))
+        self.message("DEBUG SUMMARY", "Runtime: {} seconds".format(time.time() - self.started))
 
     def progress(self, processed, total):
+        # Only redraws when the whole percentage moves, so it's cheap to call on every line
         if self.printEnabled:
-            if ((processed == 1) or (processed % 1000 == 0)):
-                percentComplete = int((processed/total)*100)
+            percentComplete = min(100, int((processed/total)*100)) if total else 100
+            if percentComplete != self.progressPercent:
+                self.progressPercent = percentComplete
                 print("\r", end="")
                 print("PROGRESS- Estimated build progress:", percentComplete, "%", end="")
-            if (processed == total):
-                print(" ... Done.")
-
-class rhymadexMariaDB:
-    def __init__(self, debugger, configfile="mariadb.cfg"):
+                if (percentComplete == 100):
+                    print(" ... Done.")
+
+class rhymadexConnectionError(SystemExit):
+    # What the backends exit with when the database itself can't be reached (can't connect, the connection drops,
+    #   the file's gone), as opposed to a query going wrong.  It's still a SystemExit, so anything that isn't
+    #   expecting it stops the same as on any other database error.  rhymadexReplicas catches it to fail over to
+    #   the next replica, and only it: a bad query would be just as bad on every replica and on the primary.
+    pass
+
+class rhymadexDatabase:
+    # What the builder and explorer expect of a database backend:
+    #   query(query, queryParams, queryIdentifier, commitNow, prepared) -> a cursor to fetchall() / rowcount /
+    #     lastrowid on.  prepared=True asks for the statement to be prepared once and reused from then on.
+    #   queryMany(query, queryParamsList, queryIdentifier, commitNow) -> one batch, one transaction
+    #   bulkLoad(query, queryParamsList, batchSize)
+    #   healthy() -> whether the connection still works, and close()
+    #   deferLineIndexes() and buildLineIndexes(), either side of bulk loading an empty tblLines (see rhymadexSnapshot)
+    #   refreshPoolStats(rhymePools) and rebuildPoolStats() to keep tblPoolStats up to date, shared by every backend
+    #   and a schema at schemaCurrentVersion, set up (or brought up to date) by the time __init__ is done.
+    #   Unless checkSchema=False, which skips straight to using the database (see rhymadexPool).
+    # Queries are written the MariaDB way (`backticks`, ? parameters, ON DUPLICATE KEY UPDATE, NOW(), RAND()) and
+    #   any other backend deals with the translating.
+    # Use connectRhymadexDB to get whichever one the configfile asks for.
+
+    # Opt-in slowQueryLog, and the second connection it runs its EXPLAINs on
+    slowLog = None
+    explainConnection = None
+
+    def execute(self, cursor, statement, queryParams, many=False):
+        # Run statement on cursor (executemany with many=True), timed in to the debugger's query metrics along
+        #   with how many rows it touched.  For a SELECT that's only known up front if the cursor is buffered.
+        started = time.perf_counter()
+        try:
+            if many:
+                cursor.executemany(statement, queryParams)
+            else:
+                cursor.execute(statement, queryParams)
+        except Exception:
+            self.debugger.logQuery(statement, time.perf_counter() - started, error=True)
+            raise
+        seconds = time.perf_counter() - started
+        self.debugger.logQuery(statement, seconds, len(queryParams) if many else cursor.rowcount)
+        if self.slowLog and (seconds >= self.slowLog.thresholdSeconds):
+            self.slowLog.record(self, statement, queryParams, seconds, many)
+
+    def bulkLoad(self, query, queryParamsList, batchSize=10000):
+        # Load a big pile of rows through queryMany, batchSize rows (one executemany round trip, one transaction)
+        #   at a time.  The connector sends each executemany to the server as a single bulk operation.
+        for i in range(0, len(queryParamsList), batchSize):
+            self.queryMany(query, queryParamsList[i:i + batchSize])
+
+    # tblPoolStats' wordPositions: lines by their firstPool, by their lastPool, and "Dual Position" lines whose
+    #   firstWord and lastWord are different words from the same rhymePool.  The tblLines column each one is by,
+    #   and any more WHERE it needs.
+    poolStatsPositions = ((0, "firstPool", ""),
+                          (1, "lastPool", ""),
+                          (2, "firstPool", "AND (`firstPool` = `lastPool`) AND (`firstWord` != `lastWord`) "))
+
+    def refreshPoolStats(self, rhymePools, commitNow=True, chunkSize=500):
+        # Work out tblPoolStats over again for just these rhymePools, from what's in tblLines now.
+        # For each wordPosition and rhymePool that has lines, one row per syllable count with how many lines there
+        #   are, and the distinct firstWord/lastWord counts of the rhymePool's lines as a whole on each of them.
+        #   That's all the explorer needs to pick rhymePools, without going anywhere near tblLines.
+        # The rhymePools go chunkSize at a time, IN lists padded out with repeats so it's always the same statements.
+        rhymePools = sorted(set(rhymePool for rhymePool in rhymePools if rhymePool is not None))
+        placeholders = ", ".join(["?"] * chunkSize)
+        for chunkStart in range(0, len(rhymePools), chunkSize):
+            chunkPools = rhymePools[chunkStart:chunkStart + chunkSize]
+            chunkPools = tuple(chunkPools + chunkPools[-1:] * (chunkSize - len(chunkPools)))
+            poolStats = []
+            for wordPosition, poolColumn, positionWhere in self.poolStatsPositions:
+                where = "FROM `tblLines` WHERE (`{}` IN ({})) {}".format(poolColumn, placeholders, positionWhere)
+                distinctWords = {}
+                for rhymePool, distinctFirstWords, distinctLastWords in self.query(
+                        "SELECT `{0}`, COUNT(DISTINCT `firstWord`), COUNT(DISTINCT `lastWord`) {1} \
+                         GROUP BY `{0}`".format(poolColumn, where), chunkPools, prepared=True).fetchall():
+                    distinctWords[rhymePool] = (distinctFirstWords, distinctLastWords)
+                for rhymePool, syllables, lineCount in self.query(
+                        "SELECT `{0}`, `syllables`, COUNT(*) {1} \
+                         GROUP BY `{0}`, `syllables`".format(poolColumn, where), chunkPools, prepared=True).fetchall():
+                    poolStats.append((wordPosition, rhymePool, syllables, lineCount) + distinctWords[rhymePool])
+
+            # Out with the old and in with the new in the one transaction, so the explorer never sees a pool half done
+            self.query("DELETE FROM `tblPoolStats` WHERE (`rhymePool` IN ({}))".format(placeholders), chunkPools,
+                       prepared=True)
+            self.queryMany("INSERT INTO `tblPoolStats` \
+                            (`wordPosition`, `rhymePool`, `syllables`, `lineCount`, \
+                             `distinctFirstWords`, `distinctLastWords`) \
+                            VALUES (?, ?, ?, ?, ?, ?)", poolStats, "", False)
+            if commitNow: self.query(None, None, "", True)
+
+    def rebuildPoolStats(self, commitNow=True):
+        # tblPoolStats for every rhymePool there is
+        self.refreshPoolStats([rhymePool[0] for rhymePool in
+                               self.query("SELECT `id` FROM `tblRhymePools`").fetchall()], commitNow)
+
+class rhymadexMariaDB(rhymadexDatabase):
+    def __init__(self, debugger, configfile="mariadb.cfg", checkSchema=True, section="mariadb"):
         # By default this expects mariadb.cfg in the same directory as this script
         # In the format:
         #
@@ -64,29 +453,95 @@ class rhymadexMariaDB:
         # host = mariadb_host
         # database = rhymadex
         # port = mariadb_port (typically 3306)
+        #
+        # section picks a different section to connect with, for a read replica (see rhymadexReplicas).  Anything
+        #   it leaves out is taken from [mariadb].
 
         dbConfig = configparser.ConfigParser()
 
-        # Track the rhymadexMariaDB schema in a simple way: an int incrementing from 1
-        # Use this to track whether the target database schema matches what I expect as
-        #   I add changes, features, and whatnot
-        self.schemaCurrentVersion = 1
+        # See schemaCurrentVersion at the top
+        self.schemaCurrentVersion = schemaCurrentVersion
+
+        # Schema migrations: for each version, the ordered steps that take a database up to it from the version
+        #   before.  A step is one of
+        #     ("ddl", query): run once.  Written with IF NOT EXISTS so a step that was cut off part way can just
+        #       be run again.  MariaDB does ADD COLUMN / ADD KEY online where it can.
+        #     ("backfill", table, query): an UPDATE run over table one primary key range at a time, to keep each
+        #       transaction (and any locks it holds) short.  query gets the low and high `id` of the range as its
+        #       two parameters.  Or query can be a method, for a backfill that has to be worked out in Python.
+        #   New columns go in, then get backfilled, then get their indexes, so each index is built just the once.
+        #   See migrateSchema.
+        self.migrations = {
+            # v2: hash columns for incremental builds.  Sources built before this have no fileHash, so they just
+            #   get a full rebuild the next time around, which fills in their line hashes.
+            2: [("ddl", "ALTER TABLE `tblSources` ADD COLUMN IF NOT EXISTS `fileHash` BIGINT NULL"),
+                ("ddl", "ALTER TABLE `tblLines` ADD COLUMN IF NOT EXISTS `lineHash` BIGINT NULL"),
+                ("ddl", "ALTER TABLE `tblLines` ADD KEY IF NOT EXISTS `idx_line_source_hash` (`source`, `lineHash`)")],
+            # v3: firstPool/lastPool copied in to tblLines for the explorer, filled in for the lines already there
+            3: [("ddl", "ALTER TABLE `tblLines` ADD COLUMN IF NOT EXISTS `firstPool` INT NULL, \
+                                             ADD COLUMN IF NOT EXISTS `lastPool` INT NULL"),
+                ("backfill", "tblLines",
+                 "UPDATE `tblLines` \
+                  INNER JOIN `tblRhymeWords` `firstWords` ON `tblLines`.`firstWord` = `firstWords`.`word` \
+                  INNER JOIN `tblRhymeWords` `lastWords` ON `tblLines`.`lastWord` = `lastWords`.`word` \
+                  SET `tblLines`.`firstPool` = `firstWords`.`rhymePool`, \
+                      `tblLines`.`lastPool` = `lastWords`.`rhymePool` \
+                  WHERE `tblLines`.`id` BETWEEN ? AND ?"),
+                ("ddl", "ALTER TABLE `tblLines` \
+                         ADD KEY IF NOT EXISTS `idx_line_lastpool` (`lastPool`, `syllables`), \
+                         ADD KEY IF NOT EXISTS `idx_line_pools` (`firstPool`, `lastPool`, `syllables`)")],
+            # v4: line uniqueness moves from the VARCHAR(255) `line` to its 64-bit lineHash.  Lines from before v2
+            #   get their lineHash first, and then it's made NOT NULL, the same as a new tblLines has it.  The new
+            #   unique key goes in after that, before the old one comes out.
+            4: [("backfill", "tblLines", self.rehashLines),
+                ("ddl", "ALTER TABLE `tblLines` MODIFY `lineHash` BIGINT NOT NULL"),
+                ("ddl", "ALTER TABLE `tblLines` ADD UNIQUE KEY IF NOT EXISTS `uniq_line_hash` (`lineHash`)"),
+                ("ddl", "ALTER TABLE `tblLines` DROP KEY IF EXISTS `line`")],
+            # v5: randomKey for the explorer's random line picks, dealt out to the lines already there
+            5: [("ddl", "ALTER TABLE `tblLines` ADD COLUMN IF NOT EXISTS `randomKey` INT NOT NULL DEFAULT 0"),
+                ("backfill", "tblLines",
+                 "UPDATE `tblLines` SET `randomKey` = FLOOR(RAND() * 2147483648) WHERE `id` BETWEEN ? AND ?"),
+                ("ddl", "ALTER TABLE `tblLines` \
+                         ADD KEY IF NOT EXISTS `idx_line_random` (`randomKey`), \
+                         ADD KEY IF NOT EXISTS `idx_line_firstpool_random` (`firstPool`, `randomKey`), \
+                         ADD KEY IF NOT EXISTS `idx_line_lastpool_random` (`lastPool`, `randomKey`)")],
+            # v6: tblPoolStats for the explorer's rhymePool picks, worked out for the rhymePools already there
+            6: [("ddl", "CREATE TABLE IF NOT EXISTS `tblPoolStats` \
+                         (`wordPosition` TINYINT NOT NULL, \
+                          `rhymePool` INT NOT NULL, \
+                          `syllables` SMALLINT NOT NULL, \
+                          `lineCount` INT NOT NULL, \
+                          `distinctFirstWords` INT NOT NULL, \
+                          `distinctLastWords` INT NOT NULL, \
+                          PRIMARY KEY (`wordPosition`, `rhymePool`, `syllables`), \
+                          KEY `idx_poolstats_pool` (`rhymePool`))"),
+                ("backfill", "tblRhymePools", self.backfillPoolStats)]
+        }
+
+        # Rows per backfill range (and per transaction)
+        self.migrationBatchSize = 10000
 
         self.debugger = debugger
 
         if dbConfig.read(configfile):
             try:
-                self.username = dbConfig['mariadb']['username']
-                self.password = dbConfig['mariadb']['password']
-                self.host = dbConfig['mariadb']['host']
-                self.database = dbConfig['mariadb']['database']
-                self.port = dbConfig['mariadb']['port']
-            except configparser.Error as e:
+                settings = dict(dbConfig['mariadb']) if dbConfig.has_section('mariadb') else {}
+                settings.update(dbConfig[section])
+                self.username = settings['username']
+                self.password = settings['password']
+                self.host = settings['host']
+                self.database = settings['database']
+                self.port = settings['port']
+            except (configparser.Error, KeyError) as e:
                 self.debugger.message("ERROR", "Configparser error: {}".format(e))
                 sys.exit("Could not find database credential attributes in configfile.  Exiting.")
         else:
             sys.exit("Could not open configfile to read database credentials.  Exiting.")
 
+        if not mariadb:
+            self.debugger.message("ERROR", "The mariadb connector module isn't installed")
+            sys.exit("Can't connect to MariaDB.  Exiting.")
+
         try:
             # Connect but don't open a database yet
             self.debugger.message("INFO",
@@ -100,15 +555,74 @@ class rhymadexMariaDB:
             )
         except mariadb.Error as e:
             self.debugger.message("ERROR", "MariaDB Connection error: {}".format(e))
-            sys.exit("Database connection error.  Exiting.")
+            raise rhymadexConnectionError("Database connection error.  Exiting.")
 
         self.cursor = self.connection.cursor()
 
-        if not self.initSchema():
+        # Prepared statement cache: statement text -> a prepared cursor for it, least recently used first.
+        #   The server parses and plans each statement just the once, and every execute after that only sends the
+        #   parameters.  Keyed on the text, so it only pays off for queries that keep their values in queryParams.
+        self.preparedCursors = collections.OrderedDict()
+        self.preparedCacheSize = 64
+
+        if not checkSchema:
+            # Somebody else has already checked the schema on this server, just open the database
+            self.query("USE `{}`", None, self.database)
+        elif not self.initSchema():
             self.debugger.message("ERROR", "Unexpected error while initiailizing DB schema")
             sys.exit("Could not initialize DB.  Exiting.")
 
-    def query(self, query, queryParams=None, queryIdentifier="", commitNow=False):
+    def healthy(self):
+        # Ping the server.  False if the connection has gone away.
+        try:
+            self.connection.ping()
+            return True
+        except mariadb.Error:
+            return False
+
+    def close(self):
+        try:
+            for preparedCursor in self.preparedCursors.values():
+                preparedCursor.close()
+            self.preparedCursors.clear()
+            self.connection.close()
+            if self.explainConnection:
+                self.explainConnection.close()
+        except mariadb.Error:
+            pass
+
+    def explain(self, statement, queryParams):
+        # EXPLAIN a statement for the slowQueryLog, as a list of dicts, one per row of the plan.
+        # It runs on a connection of its own, so it can't get mixed up with the results or the open transaction
+        #   of the connection that ran the statement.  Only SELECT/UPDATE/DELETE can be EXPLAINed.
+        if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            return None
+        try:
+            if not self.explainConnection:
+                self.explainConnection = mariadb.connect(user=self.username, password=self.password, host=self.host,
+                                                         port=int(self.port), database=self.database)
+            explainCursor = self.explainConnection.cursor()
+            explainCursor.execute("EXPLAIN " + statement, queryParams)
+            columns = [column[0] for column in explainCursor.description]
+            plan = [dict(zip(columns, row)) for row in explainCursor.fetchall()]
+            explainCursor.close()
+            return plan
+        except mariadb.Error as e:
+            return "EXPLAIN failed: {}".format(e)
+
+    def preparedCursor(self, statement):
+        # The prepared cursor for statement, prepared the first time it's asked for
+        if statement in self.preparedCursors:
+            self.preparedCursors.move_to_end(statement)
+            self.debugger.logStat("PreparedStatementHits", 1)
+        else:
+            self.preparedCursors[statement] = self.connection.cursor(prepared=True)
+            self.debugger.logStat("PreparedStatementMisses", 1)
+            if len(self.preparedCursors) > self.preparedCacheSize:
+                self.preparedCursors.popitem(last=False)[1].close()
+        return self.preparedCursors[statement]
+
+    def query(self, query, queryParams=None, queryIdentifier="", commitNow=False, prepared=False):
         # My little query wrapper method.
         # I want to wrap my queries with a db class method so I'm not using any particular DB's
         #   methods directly in my code.  This way I can more easily change DB technology later.
@@ -127,17 +641,143 @@ class rhymadexMariaDB:
         # For values (field values in SELECT / INSERT / UPDATES etc) use the queryParams.
         # If you wanna just commit after a batch of un-committed queries, send nothing as the query for ex.
         #   db.query(None, None, "", True)
+        # With prepared=True the query runs on a cached server-side prepared statement (see preparedCursor)
         try:
-            if query: self.cursor.execute(query.format(self.connection.escape_string(str(queryIdentifier))),
-                                          queryParams)
+            cursor = self.cursor
+            if query:
+                statement = query.format(self.connection.escape_string(str(queryIdentifier)))
+                if prepared:
+                    cursor = self.preparedCursor(statement)
+                self.execute(cursor, statement, queryParams)
             if commitNow: self.connection.commit() # Gotta commit after INSERTs, etc.  Or, DIY
-            return self.cursor
+            return cursor
         except mariadb.Error as e:
             # Stop immediately on an error
             self.debugger.message("ERROR", "MariaDB error: {}\n Query: {}\n Parameters: {}".format(e,
                                                                                                    query, queryParams))
+            if self.connectionLost(e):
+                raise rhymadexConnectionError("Database connection error.  Exiting.")
             sys.exit("Database query error.  Exiting.")
 
+    @staticmethod
+    def connectionLost(error):
+        # Whether a query failed because the server's gone or the connection dropped, rather than because of the
+        #   query itself (bad SQL, a constraint, ..)
+        return isinstance(error, (mariadb.OperationalError, mariadb.InterfaceError))
+
+    def queryMany(self, query, queryParamsList, queryIdentifier="", commitNow=True):
+        # Batch flavor of the query wrapper.  Same identifier rules as query() above, but queryParamsList is a list
+        #   of queryParams tuples and the whole list goes to the server in one executemany round trip.
+        # By default the batch is committed right away, so each batch is its own transaction: either every row
+        #   in the batch lands or, on an error, the batch is rolled back and we stop.
+        if not queryParamsList:
+            return self.cursor
+        try:
+            self.execute(self.cursor, query.format(self.connection.escape_string(str(queryIdentifier))),
+                         queryParamsList, True)
+            if commitNow: self.connection.commit()
+            return self.cursor
+        except mariadb.Error as e:
+            self.connection.rollback()
+            self.debugger.message("ERROR", "MariaDB error: {}\n Query: {}\n Batch size: {}".format(e,
+                                                                                                query,
+                                                                                                len(queryParamsList)))
+            if self.connectionLost(e):
+                raise rhymadexConnectionError("Database connection error.  Exiting.")
+            sys.exit("Database query error.  Exiting.")
+
+    def migrateSchema(self, fromVersion):
+        # Run the migrations from fromVersion up to schemaCurrentVersion, one version at a time, steps in order.
+        # tblMigrations records how far each version has got: a step once it's done, a backfill after every range
+        #   it commits.  A migration that gets interrupted carries on from there the next time the database is
+        #   opened.  A version only goes in to tblVersion once every one of its steps is done.
+        self.query("CREATE TABLE IF NOT EXISTS `tblMigrations` \
+                    (`versionNum` MEDIUMINT NOT NULL, \
+                     `step` INT NOT NULL, \
+                     `lastId` INT NULL, \
+                     `dtmDone` DATETIME NULL, \
+                     PRIMARY KEY (`versionNum`, `step`))", None, "", True)
+
+        for versionNum in range(fromVersion + 1, self.schemaCurrentVersion + 1):
+            self.debugger.message("INFO", "Migrating rhymadex schema to version {}".format(versionNum))
+            migrationProgress = {}
+            for step, lastId, dtmDone in self.query("SELECT `step`, `lastId`, `dtmDone` FROM `tblMigrations` \
+                                                     WHERE (`versionNum` = ?)", (versionNum,)).fetchall():
+                migrationProgress[step] = (lastId, dtmDone)
+
+            for step, migrationStep in enumerate(self.migrations[versionNum]):
+                lastId, dtmDone = migrationProgress.get(step, (None, None))
+                if dtmDone:
+                    self.debugger.message("INFO", ".. Step {} already done {}".format(step, dtmDone))
+                    continue
+
+                self.debugger.message("INFO", ".. Step {}: {}".format(step, migrationStep[0]))
+                if migrationStep[0] == "ddl":
+                    self.query(migrationStep[1])
+                elif migrationStep[0] == "backfill":
+                    self.backfill(versionNum, step, migrationStep[1], migrationStep[2], lastId or 0)
+
+                self.query("INSERT INTO `tblMigrations` (`versionNum`, `step`, `dtmDone`) VALUES (?, ?, NOW()) \
+                            ON DUPLICATE KEY UPDATE `dtmDone` = NOW()", (versionNum, step), "", True)
+
+            # Record the rhymadex database schema version
+            self.query("INSERT INTO `tblVersion` (versionNum, dtmInit) VALUES (?, NOW())", (versionNum,), "", True)
+
+    def backfill(self, versionNum, step, table, query, lastId):
+        # Run a backfill step's UPDATE over table migrationBatchSize primary keys at a time, starting after lastId.
+        # Each range is committed along with the new lastId, so the two can never disagree.
+        maxId = self.query("SELECT COALESCE(MAX(`id`), 0) FROM `{}`", None, table).fetchall()[0][0]
+        self.debugger.progressPercent = None
+        for lowId in range(lastId + 1, maxId + 1, self.migrationBatchSize):
+            highId = min(lowId + self.migrationBatchSize - 1, maxId)
+            if callable(query):
+                query(lowId, highId)
+            else:
+                self.query(query, (lowId, highId))
+            self.query("INSERT INTO `tblMigrations` (`versionNum`, `step`, `lastId`) VALUES (?, ?, ?) \
+                        ON DUPLICATE KEY UPDATE `lastId` = ?", (versionNum, step, highId, highId), "", True)
+            self.debugger.progress(highId, maxId)
+        # Anything added since maxId was read was written by an up-to-date builder and doesn't need the backfill
+        self.debugger.progress(maxId, maxId)
+
+    def deferLineIndexes(self):
+        # Drop tblLines' secondary keys, so a bulk load in to an empty tblLines doesn't keep them up row by row, and
+        #   turn off the unique and foreign key checks for this session.  buildLineIndexes puts it all back, each
+        #   key built in one sorted pass.  `idx_line_source_hash` stays, fk_line_source can't do without it.
+        self.query("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+        self.query("ALTER TABLE `tblLines` \
+                    DROP KEY IF EXISTS `uniq_line_hash`, \
+                    DROP KEY IF EXISTS `lastWord`, \
+                    DROP KEY IF EXISTS `idx_line_lastpool`, \
+                    DROP KEY IF EXISTS `idx_line_pools`, \
+                    DROP KEY IF EXISTS `idx_line_random`, \
+                    DROP KEY IF EXISTS `idx_line_firstpool_random`, \
+                    DROP KEY IF EXISTS `idx_line_lastpool_random`")
+
+    def buildLineIndexes(self):
+        self.query("ALTER TABLE `tblLines` \
+                    ADD UNIQUE KEY IF NOT EXISTS `uniq_line_hash` (`lineHash`), \
+                    ADD KEY IF NOT EXISTS `lastWord` (`lastWord`), \
+                    ADD KEY IF NOT EXISTS `idx_line_lastpool` (`lastPool`, `syllables`), \
+                    ADD KEY IF NOT EXISTS `idx_line_pools` (`firstPool`, `lastPool`, `syllables`), \
+                    ADD KEY IF NOT EXISTS `idx_line_random` (`randomKey`), \
+                    ADD KEY IF NOT EXISTS `idx_line_firstpool_random` (`firstPool`, `randomKey`), \
+                    ADD KEY IF NOT EXISTS `idx_line_lastpool_random` (`lastPool`, `randomKey`)")
+        self.query("SET SESSION unique_checks = 1, foreign_key_checks = 1")
+
+    def rehashLines(self, lowId, highId):
+        # Backfill for v4: fill in the lineHash of any line in the id range that doesn't have one yet.  Left
+        #   uncommitted, backfill commits it along with its progress.
+        unhashedLines = self.query("SELECT `id`, `line` FROM `tblLines` \
+                                    WHERE (`id` BETWEEN ? AND ?) AND (`lineHash` IS NULL)", (lowId, highId)).fetchall()
+        if unhashedLines:
+            self.queryMany("UPDATE `tblLines` SET `lineHash` = ? WHERE (`id` = ?)",
+                           [(lineHash(line), lineId) for lineId, line in unhashedLines], "", False)
+
+    def backfillPoolStats(self, lowId, highId):
+        # Backfill for v6: tblPoolStats for the rhymePools in the id range, left uncommitted like rehashLines
+        self.refreshPoolStats(range(lowId, highId + 1), False)
+
     def initSchema(self):
         # Check if the target database already exists
         self.debugger.message("INFO", "Checking for database {}".format(self.database))
@@ -148,13 +788,15 @@ class rhymadexMariaDB:
             self.query("CREATE DATABASE `{}`", None, self.database)
             self.query("USE `{}`", None, self.database)
 
-            # rhymadex DB schema v1
+            # rhymadex DB schema v6
 
             # tblSources holds info about each text data source
+            # fileHash is the sourceHash of the file as of its last completed build (see rhymadex.sourceHash)
             self.query("CREATE TABLE `tblSources` \
                         (`id` INT AUTO_INCREMENT NOT NULL, \
                          `sourceName` VARCHAR(255) NOT NULL, \
                          `dtmInit` DATETIME NOT NULL, \
+                         `fileHash` BIGINT NULL, \
                          UNIQUE KEY (`sourceName`), \
                          PRIMARY KEY (`id`))")
 
@@ -162,7 +804,17 @@ class rhymadexMariaDB:
             # Use a surrogate PRIMARY KEY `id`
             # lastWord is VARCHAR(34) ("Supercalifragilisticexpialidocious")
             #   The largest English "word" I'd ever expect to encounter and store ..
-            # line is VARCHAR(255), the longest lyric line we'll consider.  Make it unique.
+            # line is VARCHAR(255), the longest lyric line we'll consider.
+            # lineHash is the lineHash of line, and it's what keeps the lines unique: a BIGINT key is a fraction
+            #   of the size of one on the VARCHAR(255) line, and that much cheaper for every insert to check and
+            #   keep up.  The builder checks the full text before it relies on it (see rhymadex.unstoredLines).
+            #   It also lets a source be diffed against what's stored for it without dragging all the line text
+            #   back out of the database.
+            # firstPool/lastPool are the tblRhymePools ids of firstWord/lastWord, copied in at build time so the
+            #   explorer can pick lines by rhymePool straight off tblLines, no JOINing tblRhymeWords on VARCHARs.
+            # randomKey is a random number dealt to each line when it goes in.  To pick a line at random, the
+            #   explorer seeks to a random randomKey in the index and takes the first line from there that fits,
+            #   rather than sorting every line that fits with ORDER BY RAND().
             self.query("CREATE TABLE `tblLines` \
                         (`id` INT NOT NULL AUTO_INCREMENT, \
                          `firstWord` VARCHAR(34) NOT NULL, \
@@ -170,9 +822,19 @@ class rhymadexMariaDB:
                          `line` VARCHAR(255) NOT NULL, \
                          `syllables` SMALLINT NOT NULL, \
                          `source` INT NOT NULL, \
+                         `lineHash` BIGINT NOT NULL, \
+                         `firstPool` INT NULL, \
+                         `lastPool` INT NULL, \
+                         `randomKey` INT NOT NULL DEFAULT 0, \
                          PRIMARY KEY (`id`), \
-                         UNIQUE KEY (`line`), \
+                         UNIQUE KEY `uniq_line_hash` (`lineHash`), \
                          KEY (`lastWord`), \
+                         KEY `idx_line_source_hash` (`source`, `lineHash`), \
+                         KEY `idx_line_lastpool` (`lastPool`, `syllables`), \
+                         KEY `idx_line_pools` (`firstPool`, `lastPool`, `syllables`), \
+                         KEY `idx_line_random` (`randomKey`), \
+                         KEY `idx_line_firstpool_random` (`firstPool`, `randomKey`), \
+                         KEY `idx_line_lastpool_random` (`lastPool`, `randomKey`), \
                          CONSTRAINT `fk_line_source` FOREIGN KEY (`source`) REFERENCES `tblSources` (`id`) \
                          ON DELETE CASCADE \
                          ON UPDATE RESTRICT)")
@@ -202,6 +864,20 @@ class rhymadexMariaDB:
                          CONSTRAINT `fk_rhyme_pool` FOREIGN KEY (`rhymePool`) REFERENCES `tblRhymePools` (`id`) \
                          ON UPDATE RESTRICT)")
 
+            # tblPoolStats is what the explorer picks rhymePools from, kept up to date by the builder (see
+            #   rhymadexDatabase.refreshPoolStats).  For each wordPosition (0 firstWord, 1 lastWord, 2 both, with
+            #   different words) and rhymePool, how many lines it has of each syllable count, and how many distinct
+            #   firstWords and lastWords among all those lines.  A few small rows per pool, instead of every line.
+            self.query("CREATE TABLE `tblPoolStats` \
+                        (`wordPosition` TINYINT NOT NULL, \
+                         `rhymePool` INT NOT NULL, \
+                         `syllables` SMALLINT NOT NULL, \
+                         `lineCount` INT NOT NULL, \
+                         `distinctFirstWords` INT NOT NULL, \
+                         `distinctLastWords` INT NOT NULL, \
+                         PRIMARY KEY (`wordPosition`, `rhymePool`, `syllables`), \
+                         KEY `idx_poolstats_pool` (`rhymePool`))")
+
             # tblVersions stores the version of the overall database schema
             # If we've made it this far, ostensibly the database schema is set up and ready to go
             #   I'm so optimistic that I'll use a MEDIUMINT
@@ -229,6 +905,11 @@ class rhymadexMariaDB:
             self.debugger.message("INFO", "Found rhymadex version {} created {}".format(currentVersion[0],
                                                                                    currentVersion[1]))
 
+            if int(currentVersion[0]) < int(self.schemaCurrentVersion):
+                # Older schema, bring it up to date in place
+                self.migrateSchema(int(currentVersion[0]))
+                currentVersion = (self.schemaCurrentVersion, currentVersion[1])
+
             if not int(currentVersion[0]) == int(self.schemaCurrentVersion):
                 self.debugger.message("ERROR",
                                  "Schema version doesn't match expected version: {}".format(self.schemaCurrentVersion))
@@ -241,25 +922,1000 @@ class rhymadexMariaDB:
         # Should never reach this point of execution.  If so, something unexpected has happened.
         return False
 
+class rhymadexSQLite(rhymadexDatabase):
+    # The rhymadex in an embedded SQLite database file.  No server needed, for building or exploring.
+    # Same tables as rhymadexMariaDB, same queries: `backticks` are fine in SQLite already, NOW() and RAND() are
+    #   supplied as SQL functions, and ON DUPLICATE KEY UPDATE is rewritten as SQLite's ON CONFLICT DO UPDATE SET.
+
+    # ON CONFLICT needs to be told which unique key to watch, where ON DUPLICATE KEY UPDATE goes for any of them.
+    #   Leaving it out is only allowed from SQLite 3.35, and plenty of Pythons still ship an older one.  So here's
+    #   the one unique key (besides the rowid) of each table that gets upserted in to.
+    conflictTargets = {"tblSources": "`sourceName`",
+                       "tblRhymeWords": "`word`, `rhymeType`",
+                       "tblSyllables": "`word`",
+                       "tblLines": "`lineHash`"}
+
+    # Upserts with a conflict target arrived in SQLite 3.24
+    minimumVersion = (3, 24, 0)
+
+    def __init__(self, debugger, path="rhymadex.db", readOnly=False, checkSchema=True):
+        self.schemaCurrentVersion = schemaCurrentVersion
+        # SQLite databases started out at schema version 3.  See migrateSchema for getting them up to date.
+        self.debugger = debugger
+        self.path = path
+        self.readOnly = readOnly
+
+        # query -> query translated to SQLite's dialect, so each one is only translated the once
+        self.dialect = {}
+
+        if sqlite3.sqlite_version_info < self.minimumVersion:
+            self.debugger.message("ERROR", "SQLite {} is too old, the rhymadex needs {} or later".format(
+                                  sqlite3.sqlite_version, ".".join(str(part) for part in self.minimumVersion)))
+            sys.exit("SQLite library too old.  Exiting.")
+
+        try:
+            self.debugger.message("INFO", "Opening SQLite database: {}{}".format(self.path,
+                                                                                " (read only)" if readOnly else ""))
+            # check_same_thread is off so a rhymadexPool can hand the connection to whichever thread needs it next.
+            #   It's still only ever used by one thread at a time.
+            # sqlite3 keeps its own cache of prepared statements keyed on the statement text, so every query is
+            #   "prepared" here.  cached_statements is just how many of them it holds on to.
+            if readOnly:
+                # For explorer nodes shipping a local copy of the rhymadex: nothing can write to it by accident
+                self.connection = sqlite3.connect("file:{}?mode=ro".format(self.path), uri=True,
+                                                  check_same_thread=False, cached_statements=256)
+            else:
+                self.connection = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        except sqlite3.Error as e:
+            self.debugger.message("ERROR", "SQLite error opening {}: {}".format(self.path, e))
+            raise rhymadexConnectionError("Database connection error.  Exiting.")
+
+        self.addFunctions(self.connection)
+        self.cursor = self.connection.cursor()
+
+        if not readOnly:
+            # WAL: readers don't block the writer or the other way around, and with synchronous NORMAL a commit
+            #   doesn't wait on an fsync, only checkpoints do.  Still crash safe, a power cut might lose the
+            #   last few commits.
+            self.query("PRAGMA journal_mode = WAL")
+            self.query("PRAGMA synchronous = NORMAL")
+        self.query("PRAGMA foreign_keys = ON")
+        # 256MB page cache (negative is in KiB), temp tables and sorts in memory, and read the file through mmap
+        self.query("PRAGMA cache_size = -262144")
+        self.query("PRAGMA temp_store = MEMORY")
+        self.query("PRAGMA mmap_size = 1073741824")
+
+        if checkSchema and not self.initSchema():
+            self.debugger.message("ERROR", "Unexpected error while initiailizing DB schema")
+            sys.exit("Could not initialize DB.  Exiting.")
+
+    @staticmethod
+    def addFunctions(connection):
+        # Stand-ins for the MariaDB functions the queries use
+        connection.create_function("NOW", 0, lambda: time.strftime("%Y-%m-%d %H:%M:%S"))
+        connection.create_function("RAND", 0, random.random)
+
+    def healthy(self):
+        try:
+            self.cursor.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        try:
+            self.connection.close()
+            if self.explainConnection:
+                self.explainConnection.close()
+        except sqlite3.Error:
+            pass
+
+    def explain(self, statement, queryParams):
+        # Same as rhymadexMariaDB.explain, with SQLite's EXPLAIN QUERY PLAN, on a read only connection of its own
+        if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            return None
+        try:
+            if not self.explainConnection:
+                self.explainConnection = sqlite3.connect("file:{}?mode=ro".format(self.path), uri=True,
+                                                         check_same_thread=False)
+                self.addFunctions(self.explainConnection)
+            explainCursor = self.explainConnection.execute("EXPLAIN QUERY PLAN " + statement, queryParams or ())
+            columns = [column[0] for column in explainCursor.description]
+            return [dict(zip(columns, row)) for row in explainCursor.fetchall()]
+        except sqlite3.Error as e:
+            return "EXPLAIN failed: {}".format(e)
+
+    def translate(self, query):
+        if query not in self.dialect:
+            translated = query
+            upsert = re.search(r"ON\s+DUPLICATE\s+KEY\s+UPDATE", query)
+            if upsert:
+                upsertTable = re.match(r"\s*INSERT\s+INTO\s+`(\w+)`", query)
+                if not (upsertTable and (upsertTable.group(1) in self.conflictTargets)):
+                    self.debugger.message("ERROR", "No SQLite conflict target for upsert: {}".format(query))
+                    sys.exit("Database query error.  Exiting.")
+                translated = "{}ON CONFLICT ({}) DO UPDATE SET{}".format(
+                             query[:upsert.start()], self.conflictTargets[upsertTable.group(1)], query[upsert.end():])
+            self.dialect[query] = translated
+        return self.dialect[query]
+
+    def query(self, query, queryParams=None, queryIdentifier="", commitNow=False, prepared=False):
+        # Same as rhymadexMariaDB.query.  Identifiers go in backticks, so doubling up any backticks in them is
+        #   all the escaping they need.  prepared makes no difference, see cached_statements above.
+        try:
+            if query: self.execute(self.cursor, self.translate(query).format(str(queryIdentifier).replace("`", "``")),
+                                   queryParams or ())
+            if commitNow: self.connection.commit()
+            return self.cursor
+        except sqlite3.Error as e:
+            self.debugger.message("ERROR", "SQLite error: {}\n Query: {}\n Parameters: {}".format(e,
+                                                                                                  query, queryParams))
+            if self.connectionLost(e):
+                raise rhymadexConnectionError("Database connection error.  Exiting.")
+            sys.exit("Database query error.  Exiting.")
+
+    @staticmethod
+    def connectionLost(error):
+        # SQLite has no server connection to lose, but the file can go missing or bad underneath it, or the
+        #   connection can have been closed.  Anything else (bad SQL, a constraint, a missing table) is the query's
+        #   fault.  sqlite3 only gives error codes from Python 3.11, so it's the message that tells them apart.
+        return str(error).startswith(("unable to open database file", "disk I/O error",
+                                      "database disk image is malformed", "file is not a database",
+                                      "Cannot operate on a closed database"))
+
+    def queryMany(self, query, queryParamsList, queryIdentifier="", commitNow=True):
+        # Same as rhymadexMariaDB.queryMany
+        if not queryParamsList:
+            return self.cursor
+        try:
+            self.execute(self.cursor, self.translate(query).format(str(queryIdentifier).replace("`", "``")),
+                         queryParamsList, True)
+            if commitNow: self.connection.commit()
+            return self.cursor
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            self.debugger.message("ERROR", "SQLite error: {}\n Query: {}\n Batch size: {}".format(e,
+                                                                                                 query,
+                                                                                                 len(queryParamsList)))
+            if self.connectionLost(e):
+                raise rhymadexConnectionError("Database connection error.  Exiting.")
+            sys.exit("Database query error.  Exiting.")
+
+    def createLines(self, table="tblLines"):
+        # tblLines and its indexes, as of the current schema.  Under another name for migrateSchema to copy in to.
+        self.query("CREATE TABLE `{}` \
+                    (`id` INTEGER PRIMARY KEY, \
+                     `firstWord` VARCHAR(34) NOT NULL, \
+                     `lastWord` VARCHAR(34) NOT NULL, \
+                     `line` VARCHAR(255) NOT NULL, \
+                     `syllables` SMALLINT NOT NULL, \
+                     `source` INT NOT NULL, \
+                     `lineHash` BIGINT NOT NULL, \
+                     `firstPool` INT NULL, \
+                     `lastPool` INT NULL, \
+                     `randomKey` INT NOT NULL DEFAULT 0, \
+                     CONSTRAINT `fk_line_source` FOREIGN KEY (`source`) REFERENCES `tblSources` (`id`) \
+                     ON DELETE CASCADE \
+                     ON UPDATE RESTRICT)", None, table)
+
+    def createPoolStats(self):
+        self.query("CREATE TABLE IF NOT EXISTS `tblPoolStats` \
+                    (`wordPosition` TINYINT NOT NULL, \
+                     `rhymePool` INT NOT NULL, \
+                     `syllables` SMALLINT NOT NULL, \
+                     `lineCount` INT NOT NULL, \
+                     `distinctFirstWords` INT NOT NULL, \
+                     `distinctLastWords` INT NOT NULL, \
+                     PRIMARY KEY (`wordPosition`, `rhymePool`, `syllables`))")
+        self.query("CREATE INDEX IF NOT EXISTS `idx_poolstats_pool` ON `tblPoolStats` (`rhymePool`)")
+
+    def indexLines(self):
+        # Any that are already there are left alone
+        self.query("CREATE UNIQUE INDEX IF NOT EXISTS `uniq_line_hash` ON `tblLines` (`lineHash`)")
+        self.query("CREATE INDEX IF NOT EXISTS `idx_line_lastword` ON `tblLines` (`lastWord`)")
+        self.query("CREATE INDEX IF NOT EXISTS `idx_line_source_hash` ON `tblLines` (`source`, `lineHash`)")
+        self.query("CREATE INDEX IF NOT EXISTS `idx_line_lastpool` ON `tblLines` (`lastPool`, `syllables`)")
+        self.query("CREATE INDEX IF NOT EXISTS `idx_line_pools` ON `tblLines` (`firstPool`, `lastPool`, `syllables`)")
+        self.query("CREATE INDEX IF NOT EXISTS `idx_line_random` ON `tblLines` (`randomKey`)")
+        self.query("CREATE INDEX IF NOT EXISTS `idx_line_firstpool_random` ON `tblLines` (`firstPool`, `randomKey`)")
+        self.query("CREATE INDEX IF NOT EXISTS `idx_line_lastpool_random` ON `tblLines` (`lastPool`, `randomKey`)")
+
+    def deferLineIndexes(self):
+        # Same as rhymadexMariaDB.deferLineIndexes.  SQLite can drop every one of them.
+        self.query("PRAGMA foreign_keys = OFF")
+        for index in ("uniq_line_hash", "idx_line_lastword", "idx_line_source_hash", "idx_line_lastpool",
+                      "idx_line_pools", "idx_line_random", "idx_line_firstpool_random", "idx_line_lastpool_random"):
+            self.query("DROP INDEX IF EXISTS `{}`", None, index)
+
+    def buildLineIndexes(self):
+        self.indexLines()
+        self.query("PRAGMA foreign_keys = ON")
+
+    def migrateSchema(self, fromVersion):
+        # Bring an older database up to schemaCurrentVersion.  Unlike MariaDB, SQLite does DDL in transactions, so
+        #   the whole thing is one transaction that either all happens or doesn't happen at all.
+        self.query("BEGIN")
+        if fromVersion < 4:
+            # v4: line uniqueness moves from `line` to `lineHash`.  SQLite can't drop a UNIQUE constraint, so
+            #   tblLines is copied in to a new table without it.
+            self.debugger.message("INFO", "Migrating rhymadex schema to version 4")
+            unhashedLines = self.query("SELECT `id`, `line` FROM `tblLines` WHERE (`lineHash` IS NULL)").fetchall()
+            self.queryMany("UPDATE `tblLines` SET `lineHash` = ? WHERE (`id` = ?)",
+                           [(lineHash(line), lineId) for lineId, line in unhashedLines], "", False)
+            self.createLines("tblLinesV4")
+            self.query("INSERT INTO `tblLinesV4` \
+                        (`id`, `firstWord`, `lastWord`, `line`, `syllables`, `source`, `lineHash`, \
+                         `firstPool`, `lastPool`) \
+                        SELECT `id`, `firstWord`, `lastWord`, `line`, `syllables`, `source`, `lineHash`, \
+                               `firstPool`, `lastPool` FROM `tblLines`")
+            self.query("DROP TABLE `tblLines`")
+            self.query("ALTER TABLE `tblLinesV4` RENAME TO `tblLines`")
+            self.query("INSERT INTO `tblVersion` (versionNum, dtmInit) VALUES (?, NOW())", (4,))
+        if fromVersion < 5:
+            # v5: randomKey for the explorer's random line picks.  Coming from before v4, the table copied in above
+            #   already has the column.
+            self.debugger.message("INFO", "Migrating rhymadex schema to version 5")
+            linesColumns = [column[0] for column in self.query("SELECT * FROM `tblLines` LIMIT 0").description]
+            if "randomKey" not in linesColumns:
+                self.query("ALTER TABLE `tblLines` ADD COLUMN `randomKey` INT NOT NULL DEFAULT 0")
+            self.query("UPDATE `tblLines` SET `randomKey` = ABS(RANDOM() % 2147483648)")
+            self.query("INSERT INTO `tblVersion` (versionNum, dtmInit) VALUES (?, NOW())", (5,))
+        self.indexLines()
+        if fromVersion < 6:
+            # v6: tblPoolStats for the explorer's rhymePool picks, worked out for the rhymePools already there
+            self.debugger.message("INFO", "Migrating rhymadex schema to version 6")
+            self.createPoolStats()
+            self.rebuildPoolStats(False)
+            self.query("INSERT INTO `tblVersion` (versionNum, dtmInit) VALUES (?, NOW())", (6,))
+        self.query(None, None, "", True)
+
+    def initSchema(self):
+        if not self.query("SELECT `name` FROM `sqlite_master` \
+                           WHERE (`type` = 'table') AND (`name` = 'tblVersion')").fetchall():
+            if self.readOnly:
+                self.debugger.message("ERROR", "No rhymadex found in {}".format(self.path))
+                sys.exit("Nothing to read.  Exiting.")
+
+            # Empty file, so set up the schema.  See rhymadexMariaDB.initSchema for what everything's for.
+            self.debugger.message("INFO", "Database not found.  Creating.")
+
+            # rhymadex DB schema v6
+            # INTEGER PRIMARY KEYs are SQLite's rowid, and count up by themselves like AUTO_INCREMENT
+            self.query("CREATE TABLE `tblSources` \
+                        (`id` INTEGER PRIMARY KEY, \
+                         `sourceName` VARCHAR(255) NOT NULL UNIQUE, \
+                         `dtmInit` DATETIME NOT NULL, \
+                         `fileHash` BIGINT NULL)")
+
+            self.createLines()
+            self.indexLines()
+
+            self.query("CREATE TABLE `tblRhymePools` \
+                        (`id` INTEGER PRIMARY KEY, \
+                         `rhymeHint` VARCHAR(34), \
+                         `seedWord` VARCHAR(34))")
+
+            self.query("CREATE TABLE `tblRhymeWords` \
+                        (`id` INTEGER PRIMARY KEY, \
+                         `word` VARCHAR(34) NOT NULL, \
+                         `syllables` INT NOT NULL, \
+                         `rhymeType` INT NOT NULL, \
+                         `rhymePool` INT NOT NULL, \
+                         UNIQUE (`word`, `rhymeType`), \
+                         CONSTRAINT `fk_rhyme_pool` FOREIGN KEY (`rhymePool`) REFERENCES `tblRhymePools` (`id`) \
+                         ON UPDATE RESTRICT)")
+
+            self.createPoolStats()
+
+            self.query("CREATE TABLE `tblVersion` \
+                        (`versionNum` MEDIUMINT NOT NULL, \
+                         `dtmInit` DATETIME NOT NULL, \
+                         PRIMARY KEY (`versionNum`))")
+
+            # Record the rhymadex database schema version
+            self.query("INSERT INTO `tblVersion` (versionNum, dtmInit) VALUES (?, NOW())",
+                       (self.schemaCurrentVersion,), "", True)
+            return True
+
+        else:
+            self.debugger.message("INFO", "Database found.  Opening.")
+            currentVersion = self.query("SELECT max(`versionNum`) AS `versionNum`, \
+                                         `dtmInit` FROM `tblVersion`").fetchall()[0]
+            self.debugger.message("INFO", "Found rhymadex version {} created {}".format(currentVersion[0],
+                                                                                   currentVersion[1]))
+            if (int(currentVersion[0]) < int(self.schemaCurrentVersion)) and not self.readOnly:
+                # Older schema, bring it up to date in place
+                self.migrateSchema(int(currentVersion[0]))
+                currentVersion = (self.schemaCurrentVersion, currentVersion[1])
+
+            if not int(currentVersion[0]) == int(self.schemaCurrentVersion):
+                self.debugger.message("ERROR",
+                                 "Schema version doesn't match expected version: {}".format(self.schemaCurrentVersion))
+                exit("Won't continue with mismatching schema.  Exiting.")
+            return True
+
+        # Should never reach this point of execution.  If so, something unexpected has happened.
+        return False
+
+def connectRhymadexDB(debugger, configfile="mariadb.cfg", readOnly=False, checkSchema=True):
+    # Open whichever database backend the configfile asks for.  A [sqlite] section means an embedded SQLite
+    #   database file:
+    #
+    # [sqlite]
+    # path = rhymadex.db
+    #
+    # otherwise it's the MariaDB server in its [mariadb] section.
+    # readOnly is for the explorer, which never writes.  Only the SQLite backend does anything with it.
+    # If the configfile lists any read replicas, readOnly connections get a rhymadexReplicas that spreads their
+    #   queries over them.  Writes (the builder) always go to the primary.
+    # A [slowlog] section turns on the slowQueryLog for it (see slowQueryLog.fromConfig).
+    dbConfig = configparser.ConfigParser()
+    dbConfig.read(configfile)
+    replicaSections = [section for section in dbConfig.sections() if section.startswith("replica:")]
+    if readOnly and replicaSections:
+        return rhymadexReplicas(debugger, configfile, replicaSections, checkSchema)
+    return openRhymadexDB(debugger, configfile, None, readOnly, checkSchema)
+
+def openRhymadexDB(debugger, configfile="mariadb.cfg", section=None, readOnly=False, checkSchema=True):
+    # One connection to the primary database (section None) or to the read replica in one [replica:...] section
+    dbConfig = configparser.ConfigParser()
+    dbConfig.read(configfile)
+    if dbConfig.has_section("sqlite"):
+        rhymadexDB = rhymadexSQLite(debugger, dbConfig[section or "sqlite"].get("path", "rhymadex.db"), readOnly,
+                                    checkSchema)
+    else:
+        rhymadexDB = rhymadexMariaDB(debugger, configfile, checkSchema, section or "mariadb")
+    if dbConfig.has_section("slowlog"):
+        rhymadexDB.slowLog = slowQueryLog.fromConfig(dbConfig["slowlog"])
+    return rhymadexDB
+
+def databaseIdentity(configfile="mariadb.cfg"):
+    # Which rhymadex the configfile points at, for telling apart what came from one database and what came from
+    #   another (see the explorer's poolLineCache): the SQLite file's full path, or the MariaDB server, port and
+    #   database.  Read replicas are copies of the primary, so they don't change it.
+    dbConfig = configparser.ConfigParser()
+    dbConfig.read(configfile)
+    if dbConfig.has_section("sqlite"):
+        return "sqlite:{}".format(os.path.abspath(dbConfig["sqlite"].get("path", "rhymadex.db")))
+    settings = dbConfig["mariadb"] if dbConfig.has_section("mariadb") else {}
+    return "mariadb://{}:{}/{}".format(settings.get("host"), settings.get("port"), settings.get("database"))
+
+class rhymadexReplicas(rhymadexDatabase):
+    # A read-only connection for the explorer that sends its queries to the read replicas listed in the
+    #   configfile, so song traffic isn't competing with the builder on the primary:
+    #
+    # [replica:one]
+    # host = replica1_host
+    #
+    # [replica:two]
+    # host = replica2_host
+    #
+    # A MariaDB replica section only needs whatever's different from [mariadb].  With SQLite, a replica is a copy
+    #   of the database file: a section with its own path.
+    # Each rhymadexReplicas starts on a different replica from the last one, so the connections in a rhymadexPool
+    #   (or a process full of songs) are spread evenly over them.  It sticks with that one while it works.  If it
+    #   stops working (it can't connect, fails a health check or loses its connection mid-query) the next replica
+    #   takes over, and the primary if none of them are up.  A replica that failed gets another try after
+    #   retryInterval seconds.  A query that fails on its own (bad SQL, ..) isn't the replica's fault, and exits
+    #   like it would on any other connection.
+    # Schema work only happens on the primary.  Replicas get their schema by replicating it (or by being copied).
+
+    # Shared, so each new one starts on the next replica along
+    nextStart = itertools.count()
+
+    def __init__(self, debugger, configfile="mariadb.cfg", replicaSections=(), checkSchema=True, retryInterval=30):
+        self.debugger = debugger
+        self.configfile = configfile
+        self.retryInterval = retryInterval
+        self.schemaCurrentVersion = schemaCurrentVersion
+
+        # Where queries can go, in the order they're tried: every replica, starting from a different one each time,
+        #   and then the primary (None)
+        replicaSections = list(replicaSections)
+        start = next(self.nextStart) % len(replicaSections) if replicaSections else 0
+        self.targets = replicaSections[start:] + replicaSections[:start] + [None]
+
+        # target -> its open connection, and target -> when it can be tried again after failing
+        self.connections = {}
+        self.downUntil = {}
+
+        if checkSchema:
+            self.connections[None] = openRhymadexDB(self.debugger, self.configfile, None, True, True)
+
+        self.current = None
+        self.currentDB = None
+        self.retryAt = None
+        self.pick()
+
+    def open(self, target):
+        # The connection to target, opened if it isn't already.  None if it can't be.
+        if target in self.connections:
+            return self.connections[target]
+        self.debugger.message("INFO", "Connecting to {}", target or "the primary database")
+        try:
+            rhymadexDB = openRhymadexDB(self.debugger, self.configfile, target, True, False)
+        except rhymadexConnectionError:
+            # The backends exit on a connection error.  Here that's just one less place to send queries.
+            return None
+        self.connections[target] = rhymadexDB
+        return rhymadexDB
+
+    def markDown(self, target):
+        self.debugger.message("INFO", "{} is unavailable, failing over", target or "The primary database")
+        self.debugger.logStat("ReplicaFailovers", 1)
+        self.downUntil[target] = time.time() + self.retryInterval
+        rhymadexDB = self.connections.pop(target, None)
+        if rhymadexDB:
+            rhymadexDB.close()
+
+    def pick(self):
+        # Switch to the first target that's up, replicas first.  Anything that failed less than retryInterval
+        #   seconds ago is skipped, unless it's all there is left.
+        now = time.time()
+        for target in sorted(self.targets, key=lambda target: self.downUntil.get(target, 0) > now):
+            rhymadexDB = self.open(target)
+            if rhymadexDB and rhymadexDB.healthy():
+                self.downUntil.pop(target, None)
+                self.current, self.currentDB = target, rhymadexDB
+                # Not on the first choice?  Then try to get back to it later on.
+                self.retryAt = None if target == self.targets[0] else now + self.retryInterval
+                return rhymadexDB
+            self.markDown(target)
+        self.debugger.message("ERROR", "None of the replicas or the primary database can be reached")
+        raise rhymadexConnectionError("Database connection error.  Exiting.")
+
+    @property
+    def connection(self):
+        # For rhymadexPool.release
+        return self.currentDB.connection
+
+    def query(self, query, queryParams=None, queryIdentifier="", commitNow=False, prepared=False):
+        # Same as rhymadexMariaDB.query, on the current target.  If that can't be reached, it's retried on each of
+        #   the others.  Any other error is the query's own, and stops here like it would anywhere else.
+        if self.retryAt and time.time() >= self.retryAt:
+            self.pick()
+        for attempt in range(len(self.targets)):
+            try:
+                return self.currentDB.query(query, queryParams, queryIdentifier, commitNow, prepared)
+            except rhymadexConnectionError:
+                self.markDown(self.current)
+                self.pick()
+        return self.currentDB.query(query, queryParams, queryIdentifier, commitNow, prepared)
+
+    def queryMany(self, query, queryParamsList, queryIdentifier="", commitNow=True):
+        # Nothing should be writing through here, but if it does it has to be to the primary
+        return self.open(None).queryMany(query, queryParamsList, queryIdentifier, commitNow)
+
+    def healthy(self):
+        # For rhymadexPool's health checks.  A current target that's gone bad is swapped for the next one.
+        if self.currentDB.healthy():
+            return True
+        self.markDown(self.current)
+        try:
+            self.pick()
+            return True
+        except rhymadexConnectionError:
+            return False
+
+    def close(self):
+        for rhymadexDB in self.connections.values():
+            rhymadexDB.close()
+        self.connections.clear()
+
+class slowQueryLog:
+    # Opt-in log of slow statements: anything that takes thresholdSeconds or longer is written out with its
+    #   parameters, how long it took, and its EXPLAIN plan, one JSON document per line.
+    # Only sampleRate (0 - 1) of the slow statements are logged, so a burst of slow queries can't turn in to a
+    #   burst of EXPLAINs too.  The log file rotates at maxBytes, keeping backupCount old ones.
+    # Turn it on with a [slowlog] section in the configfile:
+    #
+    # [slowlog]
+    # path = rhymadex_slow.log
+    # threshold = 0.5
+    # sample = 1.0
+    #
+    # or hand one to a backend directly: rhymadexDB.slowLog = slowQueryLog(...)
+    def __init__(self, path="rhymadex_slow.log", thresholdSeconds=0.5, sampleRate=1.0, maxBytes=10485760,
+                 backupCount=3):
+        self.path = path
+        self.thresholdSeconds = float(thresholdSeconds)
+        self.sampleRate = float(sampleRate)
+
+        # Loggers are one per name per process, so every connection logging to the same file (say, everything
+        #   in a rhymadexPool) shares the one rotating handler
+        self.logger = logging.getLogger("rhymadex.slowlog.{}".format(os.path.abspath(path)))
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            self.logger.addHandler(logging.handlers.RotatingFileHandler(path, maxBytes=int(maxBytes),
+                                                                        backupCount=int(backupCount)))
+
+    @classmethod
+    def fromConfig(cls, slowlogConfig):
+        return cls(slowlogConfig.get("path", "rhymadex_slow.log"),
+                   slowlogConfig.getfloat("threshold", 0.5),
+                   slowlogConfig.getfloat("sample", 1.0),
+                   slowlogConfig.getint("maxbytes", 10485760),
+                   slowlogConfig.getint("backups", 3))
+
+    def record(self, rhymadexDB, statement, queryParams, seconds, many=False):
+        if random.random() >= self.sampleRate:
+            return
+        slowQuery = {"time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                     "seconds": round(seconds, 6),
+                     "shape": debugger.queryShape(statement),
+                     "statement": " ".join(statement.split())}
+        if many:
+            # A whole executemany batch.  Just say how big it was rather than log every row of it.
+            slowQuery["batchSize"] = len(queryParams)
+        else:
+            slowQuery["parameters"] = list(queryParams or ())
+            slowQuery["explain"] = rhymadexDB.explain(statement, queryParams)
+        rhymadexDB.debugger.logStat("SlowQueries", 1)
+        self.logger.info(json.dumps(slowQuery, default=str))
+
+class rhymadexPool:
+    # A process-wide pool of database connections, for running lots of songs (say, one per web request) without
+    #   each one connecting and checking the schema all over again.
+    # Connections are opened as they're needed, up to poolSize of them, and the schema is checked just the once,
+    #   by the first one.  acquire() hands out an idle connection (or waits for one, up to acquireTimeout seconds)
+    #   and release() puts it back.  Or use "with pool.connection() as rhymadexDB:" to do both.
+    # A connection that's sat idle longer than healthCheckInterval seconds is checked before it's handed out, and
+    #   replaced with a fresh one if it's gone bad.  One that drops in the middle of a query through fetchAll() is
+    #   replaced too, and the query run again on the new one.
+    # Each connection has its own cursor and only one thread at a time ever has it, so nothing's shared.
+    def __init__(self, debugger, configfile="mariadb.cfg", poolSize=8, readOnly=False, healthCheckInterval=30,
+                 acquireTimeout=None):
+        self.debugger = debugger
+        self.configfile = configfile
+        self.databaseIdentity = databaseIdentity(configfile)
+        self.poolSize = max(1, int(poolSize))
+        self.readOnly = readOnly
+        self.healthCheckInterval = healthCheckInterval
+        self.acquireTimeout = acquireTimeout
+
+        # Idle connections, with when they were last put back.  Last in first out, so the busy connections are the
+        #   ones that get reused and the spare ones are left to go idle.
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+        # The first connection is opened straight away and does the pool's one schema check
+        self.debugger.message("INFO", "Starting rhymadexPool of up to {} connections".format(self.poolSize))
+        self.opened = 1
+        self.idle.put((self.connect(checkSchema=True), time.time()))
+
+    def connect(self, checkSchema=False):
+        # Open another connection, already counted in self.opened
+        try:
+            return connectRhymadexDB(self.debugger, self.configfile, self.readOnly, checkSchema)
+        except BaseException:
+            with self.lock:
+                self.opened -= 1
+            raise
+
+    def acquire(self):
+        try:
+            rhymadexDB, lastUsed = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                openAnother = self.opened < self.poolSize
+                if openAnother:
+                    self.opened += 1
+            if openAnother:
+                return self.connect()
+            try:
+                rhymadexDB, lastUsed = self.idle.get(timeout=self.acquireTimeout)
+            except queue.Empty:
+                self.debugger.message("ERROR", "No pooled connection came free within {} seconds".format(
+                                                                                                 self.acquireTimeout))
+                sys.exit("Database connection pool exhausted.  Exiting.")
+
+        if (time.time() - lastUsed > self.healthCheckInterval) and not rhymadexDB.healthy():
+            self.debugger.message("INFO", "Pooled connection failed its health check.  Reconnecting.")
+            rhymadexDB.close()
+            rhymadexDB = self.connect()
+        return rhymadexDB
+
+    def release(self, rhymadexDB):
+        # Drop anything left uncommitted so the next borrower starts clean
+        try:
+            rhymadexDB.connection.rollback()
+        except Exception:
+            # Broken connection.  Throw it away and let the next acquire() open a new one.
+            self.discard(rhymadexDB)
+            return
+        self.idle.put((rhymadexDB, time.time()))
+
+    def discard(self, rhymadexDB):
+        # Close a connection that's gone bad, and stop counting it
+        try:
+            rhymadexDB.close()
+        except Exception:
+            pass
+        with self.lock:
+            self.opened -= 1
+
+    def fetchAll(self, query, queryParams=None, queryIdentifier="", prepared=False):
+        # Run a query on a pooled connection and return all of its rows.  If the connection drops while it's at it,
+        #   it's thrown away and the query gets one more go on a newly opened connection.  Only if that fails as
+        #   well does the rhymadexConnectionError go any further.
+        rhymadexDB = self.acquire()
+        try:
+            try:
+                return rhymadexDB.query(query, queryParams, queryIdentifier, prepared=prepared).fetchall()
+            except rhymadexConnectionError:
+                self.debugger.message("INFO", "Pooled connection dropped during a query.  Reconnecting to retry it.")
+                self.debugger.logStat("PoolReconnects", 1)
+                self.discard(rhymadexDB)
+                rhymadexDB = None
+            with self.lock:
+                self.opened += 1
+            rhymadexDB = self.connect()
+            try:
+                return rhymadexDB.query(query, queryParams, queryIdentifier, prepared=prepared).fetchall()
+            except rhymadexConnectionError:
+                self.discard(rhymadexDB)
+                rhymadexDB = None
+                raise
+        finally:
+            # Back in the pool whichever way it went, unless it's already been thrown away
+            if rhymadexDB is not None:
+                self.release(rhymadexDB)
+
+    @contextlib.contextmanager
+    def connection(self):
+        rhymadexDB = self.acquire()
+        try:
+            yield rhymadexDB
+        finally:
+            self.release(rhymadexDB)
+
+    def close(self):
+        # Close every idle connection.  Anything still out on loan is closed when it comes back... or not at all.
+        while True:
+            try:
+                rhymadexDB, lastUsed = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            rhymadexDB.close()
+            with self.lock:
+                self.opened -= 1
+
+class rhymadexSnapshot:
+    # Everything an explorer needs (tblSources, tblLines, tblRhymePools and tblRhymeWords) in one compressed file,
+    #   for setting up a new explorer node in minutes without building anything or doing a generic dump:
+    #
+    #   python rhymadex_builder.py --export-snapshot rhymadex.snapshot   (on a built node)
+    #   python rhymadex_builder.py --import-snapshot rhymadex.snapshot   (on the new one)
+    #
+    # The file is the magic line and then frames, each a 4 byte length followed by that much zlib compressed JSON:
+    #   a header with the schema version and each table's columns, then each table chunkRows rows at a time, and
+    #   a footer with every table's row count.  Chunks are stored column by column, which compresses a lot
+    #   better than row by row: a column of syllable counts or rhymePool ids is mostly the same few numbers.
+    # tblPoolStats is left out.  It's all worked out from tblLines, so load does that once tblLines is in.
+    # tblSyllables is left out too.  It's the syllableCounter's cache, and the first build on the new node
+    #   makes it again.
+    magic = b"RHYMADEX SNAPSHOT\n"
+
+    # Table -> columns, in load order: anything a table references comes before it
+    tables = {"tblSources": ("id", "sourceName", "dtmInit", "fileHash"),
+              "tblRhymePools": ("id", "rhymeHint", "seedWord"),
+              "tblRhymeWords": ("id", "word", "syllables", "rhymeType", "rhymePool"),
+              "tblLines": ("id", "firstWord", "lastWord", "line", "syllables", "source", "lineHash", "firstPool",
+                           "lastPool", "randomKey")}
+
+    def __init__(self, rhymadexDB, debugger, chunkRows=50000):
+        self.rhymadexDB = rhymadexDB
+        self.debugger = debugger
+        self.chunkRows = chunkRows
+
+    @staticmethod
+    def writeFrame(snapshotFile, frame):
+        # DATETIMEs come back from MariaDB as datetimes, which go in as their "YYYY-MM-DD HH:MM:SS" text
+        frameBytes = zlib.compress(json.dumps(frame, default=str, separators=(",", ":")).encode("utf-8"))
+        snapshotFile.write(struct.pack(">I", len(frameBytes)))
+        snapshotFile.write(frameBytes)
+
+    def readFrame(self, snapshotFile, decompress=True):
+        # The next frame, or just its size if not decompress (it's skipped over)
+        frameLength = snapshotFile.read(4)
+        if len(frameLength) < 4:
+            self.debugger.message("ERROR", "Snapshot file ends part way through")
+            sys.exit("Incomplete snapshot.  Exiting.")
+        frameLength = struct.unpack(">I", frameLength)[0]
+        if not decompress:
+            snapshotFile.seek(frameLength, os.SEEK_CUR)
+            return frameLength
+        frameBytes = snapshotFile.read(frameLength)
+        if len(frameBytes) < frameLength:
+            self.debugger.message("ERROR", "Snapshot file ends part way through")
+            sys.exit("Incomplete snapshot.  Exiting.")
+        return json.loads(zlib.decompress(frameBytes))
+
+    def export(self, path):
+        # Write the whole rhymadex out to path.  It's written alongside first and only moved in to place once it's
+        #   complete, so there's never a half-written snapshot at path.
+        self.debugger.message("INFO", "Exporting rhymadex snapshot to {}", path)
+        rowCounts = {}
+        with self.debugger.timer("snapshotExport"), open(path + ".partial", "wb") as snapshotFile:
+            snapshotFile.write(self.magic)
+            self.writeFrame(snapshotFile, {"schemaVersion": self.rhymadexDB.schemaCurrentVersion,
+                                           "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                                           "tables": self.tables})
+            for table, columns in self.tables.items():
+                # A page at a time by primary key, so it's an index range scan however far in it gets
+                selectChunk = "SELECT {} FROM `{{}}` WHERE (`id` > ?) ORDER BY `id` LIMIT ?".format(
+                                                                ", ".join("`{}`".format(column) for column in columns))
+                rowCounts[table] = 0
+                lastId = 0
+                while True:
+                    rows = self.rhymadexDB.query(selectChunk, (lastId, self.chunkRows), table).fetchall()
+                    if not rows:
+                        break
+                    self.writeFrame(snapshotFile, {"table": table, "columns": [list(column) for column in zip(*rows)]})
+                    lastId = rows[-1][0]
+                    rowCounts[table] += len(rows)
+                self.debugger.message("INFO", ".. {}: {} rows", table, rowCounts[table])
+                self.debugger.logStat("SnapshotRowsExported", rowCounts[table])
+            self.writeFrame(snapshotFile, {"rows": rowCounts})
+        os.replace(path + ".partial", path)
+        self.debugger.message("INFO", "Snapshot written: {} bytes", os.path.getsize(path))
+
+    def load(self, path):
+        # Load a snapshot in to this (empty) rhymadex
+        self.debugger.message("INFO", "Importing rhymadex snapshot from {}", path)
+        try:
+            snapshotFile = open(path, "rb")
+        except OSError as e:
+            self.debugger.message("ERROR", "OSError when opening snapshot for reading: {}\nOSError: {}", path, e)
+            sys.exit("Nothing more to do.  Exiting.")
+
+        with snapshotFile, self.debugger.timer("snapshotImport"):
+            if snapshotFile.read(len(self.magic)) != self.magic:
+                self.debugger.message("ERROR", "{} isn't a rhymadex snapshot", path)
+                sys.exit("Not a snapshot.  Exiting.")
+            header = self.readFrame(snapshotFile)
+            if header["schemaVersion"] != self.rhymadexDB.schemaCurrentVersion:
+                self.debugger.message("ERROR", "Snapshot is schema version {}, this rhymadex is version {}",
+                                      header["schemaVersion"], self.rhymadexDB.schemaCurrentVersion)
+                sys.exit("Won't load a snapshot with a mismatching schema.  Exiting.")
+            if {table: tuple(columns) for table, columns in header["tables"].items()} != self.tables:
+                self.debugger.message("ERROR", "Snapshot tables don't match: {}", header["tables"])
+                sys.exit("Won't load a snapshot with a mismatching schema.  Exiting.")
+
+            # Skip through to the footer before touching the database, so a cut-off file is caught up front
+            framesStart = snapshotFile.tell()
+            while True:
+                frameStart = snapshotFile.tell()
+                self.readFrame(snapshotFile, False)
+                if snapshotFile.tell() >= os.fstat(snapshotFile.fileno()).st_size:
+                    snapshotFile.seek(frameStart)
+                    footer = self.readFrame(snapshotFile)
+                    break
+            if "rows" not in footer:
+                self.debugger.message("ERROR", "Snapshot file has no footer")
+                sys.exit("Incomplete snapshot.  Exiting.")
+            totalRows = sum(footer["rows"].values())
+            snapshotFile.seek(framesStart)
+
+            for table in self.tables:
+                if self.rhymadexDB.query("SELECT 1 FROM `{}` LIMIT 1", None, table).fetchall():
+                    self.debugger.message("ERROR", "{} already has rows.  Snapshots only go in to an empty rhymadex.",
+                                          table)
+                    sys.exit("Won't load over an existing rhymadex.  Exiting.")
+
+            # Bulk load with tblLines' indexes out of the way, then build them once it's all in
+            self.rhymadexDB.deferLineIndexes()
+            rowCounts = dict.fromkeys(self.tables, 0)
+            rowsLoaded = 0
+            self.debugger.progressPercent = None
+            while True:
+                frame = self.readFrame(snapshotFile)
+                if "rows" in frame:
+                    break
+                table = frame["table"]
+                if table not in self.tables:
+                    self.debugger.message("ERROR", "Snapshot has rows for an unknown table: {}", table)
+                    sys.exit("Won't load a snapshot with a mismatching schema.  Exiting.")
+                rows = list(zip(*frame["columns"]))
+                self.rhymadexDB.bulkLoad("INSERT INTO `{}` ({}) VALUES ({})".format(table,
+                                                        ", ".join("`{}`".format(column) for column in self.tables[table]),
+                                                        ", ".join(["?"] * len(self.tables[table]))), rows)
+                rowCounts[table] += len(rows)
+                rowsLoaded += len(rows)
+                self.debugger.progress(rowsLoaded, totalRows)
+            self.debugger.progress(totalRows, totalRows)
+
+            self.debugger.message("INFO", "Building tblLines indexes")
+            self.rhymadexDB.buildLineIndexes()
+
+            # tblPoolStats isn't in the snapshot, it's quicker to work it out again from tblLines than to ship it
+            self.debugger.message("INFO", "Building tblPoolStats")
+            self.rhymadexDB.rebuildPoolStats()
+
+        if rowCounts != footer["rows"]:
+            self.debugger.message("ERROR", "Loaded {} rows, snapshot says {}", rowCounts, footer["rows"])
+            sys.exit("Incomplete snapshot.  Exiting.")
+        for table in self.tables:
+            self.debugger.message("INFO", ".. {}: {} rows", table, rowCounts[table])
+            self.debugger.logStat("SnapshotRowsImported", rowCounts[table])
+
+class cleaner:
+    # The lineCleaner, with everything compiled up-front so cleaning a line is a handful of C-level passes:
+    #   one bytes.translate to keep printables, lower and drop junk punctuation, one regex to trim the ends, and
+    #   one str.translate for the punctuation-to-text substitutions.
+    # Output is character-for-character what the original step-by-step re.sub cleaner produced.
+
+    # Bump this whenever a change to clean() changes what comes out of it, so incremental builds know that every
+    #   source needs another look even though the files themselves haven't changed.
+    version = 1
+
+    def __init__(self):
+        # Only deal in printables.  Anything outside ASCII is dropped by the encode, the non-printable ASCII
+        #   control chars by the delete list below.
+        # Remove almost all non-grammatical punctuation.  The old pattern also listed a pile of non-ASCII
+        #   characters (€ ƒ „ … etc), but those are already gone by the time we get here.
+        nonGrammatical = b"~`#^*_[]{}|\\<>/()$"
+        printables = string.printable.encode("ascii")
+        self.deleteChars = bytes(aChar for aChar in range(128)
+                                 if (aChar not in printables) or (aChar in nonGrammatical))
+
+        # Only deal in lowers.
+        self.lowerTable = bytes.maketrans(string.ascii_uppercase.encode("ascii"),
+                                          string.ascii_lowercase.encode("ascii"))
+
+        # Starts with a letter, then whatever, then ends in a letter
+        # Truncates all non-letter junk at the start and end, including punctuation
+        self.trimmer = re.compile(r"[a-z]+.*[a-z]+")
+
+        # Pretty up with some substitutions.  The dashes/fractions the old cleaner also swapped out are
+        #   non-ASCII and can never make it this far, so only the ASCII ones are left.
+        self.substitutions = str.maketrans({"@": "at", "&": "and", "=": "equals", "%": "percent", "+": "plus"})
+
+        # Fingerprint of everything that decides what a cleaned line looks like.  Changes to the tables above are
+        #   picked up by themselves, changes to the logic in clean() need the version bumped.
+        self.signature = repr((self.version, self.deleteChars, self.trimmer.pattern,
+                               sorted(self.substitutions.items()))).encode("ascii")
+
+    def clean(self, line):
+        line = line.encode("ascii", "ignore").translate(self.lowerTable, self.deleteChars).decode("ascii")
+
+        line = "".join(self.trimmer.findall(line))
+
+        # The "and" coordinating conjunction at the beginning of a line is redundant in my opinion,
+        #   resulting from the comma-split logic.  There are an enormous amount of lines with "and"
+        #   as the first word.  Lets just remove them to make for more intesting output.  Some day,
+        #   if this is calculating every rhymepool for every word in a line, could make "and" optional.
+        #   Other coordinating conjunctions like but, for, or, nor etc imply "non-additive" logic.
+        #   Leave those in for now.
+        if line.startswith("and "):
+            line = line[4:]
+
+        line = line.replace("--", " ").translate(self.substitutions)
+
+        return line or None
+
+    def cleanBatch(self, lines):
+        # Clean a whole list of lines in one call.  Returns a list of the same length, None where a line
+        #   cleaned down to nothing.
+        clean = self.clean
+        return [clean(line) for line in lines]
+
+# One shared, precompiled cleaner for everybody (including builder worker processes)
+lineCleanerEngine = cleaner()
+
+class syllableCounter:
+    def __init__(self, rhymadexDB=None, debugger=None, syllableCounts=None):
+        # Per-word syllable counts.
+        # syllables.estimate is a guess, and a slow-ish one to be calling on every word of every line.  So:
+        #   an in-process memo dict of word -> syllables, backed by tblSyllables in the DB.  tblSyllables is seeded
+        #   once from the CMU pronouncing dictionary that ships with Phyme (counting the stressed/unstressed vowel
+        #   phones, which is exactly the syllable count), and any word CMU doesn't know gets estimated the first time
+        #   it's seen and stored so it's never estimated again.
+        # With no rhymadexDB it's a plain memo (builder worker processes hand in a copy of the writer's memo instead)
+        self.rhymadexDB = rhymadexDB
+        self.debugger = debugger
+        self.syllableCounts = syllableCounts if syllableCounts is not None else {}
+
+        # Words counted by the estimator that haven't been written to tblSyllables (or handed back to the writer) yet
+        self.newWords = {}
+
+        if self.rhymadexDB:
+            self.debugger.message("INFO", "Initializing syllableCounter")
+            # tblSyllables is a disposable cache, not part of the rhymadex proper: it's created on demand here
+            #   rather than as part of the versioned schema (so schema versions and migrations don't cover it), and
+            #   rhymadexSnapshot leaves it out.  Dropping it, or starting from a snapshot without it, costs nothing
+            #   but time.  It gets seeded from CMU again, and the estimator gives the same counts for the rest
+            #   the next time it sees them.  Nothing outside the builder reads it.
+            self.rhymadexDB.query("CREATE TABLE IF NOT EXISTS `tblSyllables` \
+                                   (`word` VARCHAR(34) NOT NULL, \
+                                    `syllables` SMALLINT NOT NULL, \
+                                    `estimated` BOOL NOT NULL, \
+                                    PRIMARY KEY (`word`))", None, "", True)
+            self.syllableCounts.update(self.rhymadexDB.query("SELECT `word`, `syllables` FROM `tblSyllables`").fetchall())
+            if not self.syllableCounts:
+                self.seedFromCMU()
+            self.debugger.logStat("SyllableWordsKnown", len(self.syllableCounts))
+            self.debugger.message("INFO", "Syllable counts known: {}".format(len(self.syllableCounts)))
+
+    def seedFromCMU(self):
+        # Fill tblSyllables with every word in the CMU dictionary Phyme uses.
+        # CMU keys are upper case, with alternate pronunciations as WORD(1), WORD(2)..  Only take the main one.
+        # Vowel phones carry a stress digit (AH0, EY1, ..) and there's one per syllable.
+        self.debugger.message("INFO", "Seeding tblSyllables from the CMU pronouncing dictionary")
+        cmuCounts = []
+        for cmuWord, cmuPhones in load_word_phone_dict().items():
+            if "(" not in cmuWord and len(cmuWord) <= 34:
+                wordSyllables = sum(1 for phone in cmuPhones if phone[-1].isdigit())
+                self.syllableCounts[cmuWord.lower()] = wordSyllables
+                cmuCounts.append((cmuWord.lower(), wordSyllables, wordSyllables))
+
+        self.rhymadexDB.bulkLoad("INSERT INTO `tblSyllables` (`word`, `syllables`, `estimated`) \
+                                  VALUES (?, ?, FALSE) \
+                                  ON DUPLICATE KEY UPDATE `syllables` = ?", cmuCounts)
+        self.debugger.logStat("DbInsertsSyllables", len(cmuCounts))
+
+    def count(self, word):
+        # Syllables in one word.  A dict hit almost every time.
+        try:
+            return self.syllableCounts[word]
+        except KeyError:
+            # Try the word without any quotes/hyphens/etc stuck to it first, maybe CMU knows that
+            wordSyllables = self.syllableCounts.get(word.strip(string.punctuation))
+            if wordSyllables is None:
+                wordSyllables = syllables.estimate(word)
+                if len(word) <= 34:
+                    self.newWords[word] = wordSyllables
+            self.syllableCounts[word] = wordSyllables
+            return wordSyllables
+
+    def countLine(self, words):
+        count = self.count
+        return sum(count(word) for word in words)
+
+    def takeNewWords(self):
+        # Hand over (and forget about) the words estimated since the last time
+        newWords = self.newWords
+        self.newWords = {}
+        return newWords
+
+    def learn(self, wordSyllables):
+        # Take on word -> syllables counted somewhere else (a builder worker) so they're remembered and stored
+        for word in wordSyllables:
+            if word not in self.syllableCounts:
+                self.syllableCounts[word] = wordSyllables[word]
+                self.newWords[word] = wordSyllables[word]
+
+    def flush(self):
+        # Store any newly estimated words in tblSyllables
+        newWords = self.takeNewWords()
+        if newWords:
+            self.rhymadexDB.queryMany("INSERT INTO `tblSyllables` (`word`, `syllables`, `estimated`) \
+                                       VALUES (?, ?, TRUE) \
+                                       ON DUPLICATE KEY UPDATE `syllables` = ?",
+                                      [(word, newWords[word], newWords[word]) for word in newWords])
+            self.debugger.logStat("DbInsertsSyllables", len(newWords))
+
 class rhymer:
-    def __init__(self, rhymadexDB, debugger):
+    def __init__(self, rhymadexDB, debugger, syllableCounter):
         self.debugger = debugger
         self.debugger.message("INFO", "Initializing Rhymer")
 
         self.rhymadexDB = rhymadexDB
-        self.rhyme = Phyme()
+        self.syllableCounter = syllableCounter
+        # Phyme takes a few seconds to build its rhyme trie, so it's only loaded if a lookup is actually needed
+        self.rhyme = None
 
-        # Keep a new list of words we couldn't rhyme on this run to minimize redundant lookups during this execution.
+        # Keep a new set of words we couldn't rhyme on this run to minimize redundant lookups during this execution.
         # This means that on subsequent executions on the same sourceTxt, these words will be re-looked-up.
         # But that's good in case the rhyme dictionary or word filtering logic has been updated since the last run
         #   and we some new matches.
-        self.seenUnrhymableWords = []
+        # A set (and the dict below) so membership checks are hashed lookups rather than a scan of every known word.
+        self.seenUnrhymableWords = set()
 
         # Pull all currently-known rhymewords from the DB to minimize redundant lookups and INSERTs between executions.
-        self.seenRhymeWords = [list(result) for result in
-                               self.rhymadexDB.query("SELECT `word` FROM `tblRhymeWords`").fetchall()]
-        # Collapse to a single list of results
-        self.seenRhymeWords = [result for list in self.seenRhymeWords for result in list]
+        # Stored as a dict of word -> rhymePool id, so it doubles as the word's pool lookup.
+        self.seenRhymeWords = dict(self.rhymadexDB.query("SELECT `word`, `rhymePool` FROM `tblRhymeWords`").fetchall())
         self.debugger.logStat("SeenRhymeWords", len(self.seenRhymeWords))
         self.debugger.message("INFO",
                               "seenRhymeWords pulled from DB: {}".format(self.debugger.getStat("SeenRhymeWords")))
@@ -269,73 +1925,10 @@ class rhymer:
             if (rhymeTarget not in self.seenUnrhymableWords):
                 # Haven't found this word to be rhymable in the past (seenRhymeWords) and
                 # haven't found this word to be unrhymable during this execution (seenUnrhymableWords),
-                # so give it a try:
-                try:
-                    # RhymeTypes:
-                    #   1 = same vowels and consonants of the same type regardless of voicing (HAWK, DOG)
-                    #   2 = same vowels and consonants as well as any extra consonants (DUDES, DUES)
-                    #   3 = same vowels and a subset of the same consonants (DUDE, DO)
-                    #   4 = same vowels and some of the same consonants,
-                    #       with some swapped for other consonants (FACTOR, FASTER)
-                    #   5 = same vowels and arbitrary consonants (CASH, CATS)
-                    #   6 = not the same vowels but the same consonants (CAT, BOT)
-                    # What comes back is a dictionary of syllable counts with
-                    #   corresponding lists of rhyme words.
-                    rhymeTargetRhymeList = self.rhyme.get_perfect_rhymes(rhymeTarget).values() # Type 1 rhymes
-                    # KeyError exception will come up if this is empty, caught below.
-                    # rhymeTargetRhymeList is a list of lists, collapse to a single list of all the words
-                    rhymeTargetRhymeList = [result for list in rhymeTargetRhymeList for result in list]
-
-                    # And append it to the rhymeTargetRhymeList so it, itself, is added to the rhyme pool with all
-                    #   of its friends and will be excluded automatically in the next run as well.
-                    rhymeTargetRhymeList.append(rhymeTarget)
-
-                    # The rhymeHint is a right-handish segment of the word.
-                    #   Optional-vowel-optional-const-required-vowel-optional-const-end-anchor.
-                    #   This is a dumb chunky approach, but just for fun..
-                    #   Might not be unique, might not be anything at all.  Just a hint.  Something to
-                    #   look at when browsing the pool.
-                    #   It's really only the rhymePool id that matters to me.
-                    rhymeHint = (re.findall(
-                        "[aeiou]*[qwrtypsdfghjklzxcvbnm]*[aeiouy]+[qwrtypsdfghjklzxcvbnm]*$",
-                        rhymeTarget) or ["Unknown"])[0]
-                    
-                    # Establish a new RhymePool for our words to chill out in
-                    rhymePoolId = self.rhymadexDB.query("INSERT INTO `tblRhymePools` \
-                                                         (`rhymeHint`, `seedWord`) VALUES \
-                                                         (?, ?)", (rhymeHint, rhymeTarget), "", True).lastrowid
-
-                    for rhymeResult in rhymeTargetRhymeList:
-                        # Iterate through each rhymeResult
-
-                        # Strip out non-characters.  Some of the returned results from Phyme have (1) and other crap
-                        rhymeResult = re.findall("[a-z]*", rhymeResult.lower())[0]
-
-                        if (rhymeResult and rhymeResult not in self.seenRhymeWords):
-                            # Check that each cleaned result from Phyme hasn't been seen yet, and
-                            # record that we've seen it so we don't re-calculate rhymes on this again later
-                            self.seenRhymeWords.append(rhymeResult)
-
-                            # Estimate syllables
-                            rhymeResultSyllables = syllables.estimate(rhymeResult)
-                            # And insert to our rhymeList
-                            self.rhymadexDB.query("INSERT INTO `tblRhymeWords` \
-                                                   (`word`, `syllables`, `rhymeType`, `rhymePool`) VALUES \
-                                                   (?, ?, 1, ?) \
-                                                   ON DUPLICATE KEY UPDATE `word` = ?",
-                                                  (rhymeResult, rhymeResultSyllables, rhymePoolId,
-                                                   rhymeResult), "", True)
-                            self.debugger.logStat("DbInsertsRhymeWords", 1)
-
-                    # It was rhymable, it's been recorded along with its friends.  It's good to go.
-                    return True
-                except KeyError:
-                    # This word isn't rhymable, e.g.
-                    #   can't find any rhyming words in the dictionary for this word,
-                    #   so just discard this line entirely and move along.
-                    self.debugger.logStat("TotalUnrhymable", 1)
-                    self.seenUnrhymableWords.append(rhymeTarget)
-                    return False
+                # so give it a try.  Normally the builder has already run every firstWord/lastWord of the
+                #   source through resolveWords before it gets here, so this is just the fallback.
+                self.resolveWords([rhymeTarget])
+                return rhymeTarget in self.seenRhymeWords
             else:
                 # rhymeTarget is in seenUnrhymableWords, so we've seen it before and it was not rhymable.
                 # It is not good to go.
@@ -347,66 +1940,412 @@ class rhymer:
         # Should never reach this point of execution.  If so, something unexpected has happened.
         return False
 
+    def phyme(self):
+        if not self.rhyme:
+            self.rhyme = Phyme()
+        return self.rhyme
+
+    def resolveWords(self, words, workerPool=None):
+        # Work out rhymePools for a whole list of words at once and bulk load the results:
+        #   one executemany for the new tblRhymePools rows, one SELECT to get their ids back, then the new
+        #   tblRhymeWords rows in big executemany batches.  Rather than 1 + n committed INSERTs per word.
+        # Words are handled in the order given, and a word that turns up in an earlier word's rhymes is already
+        #   taken care of by that earlier pool, just like looking them up one at a time.
+        # With a workerPool the Phyme lookups are all done up front, in parallel.
+        # Phyme only knows the words in its CMU dictionary, and everything else comes back as unrhymable.  So a
+        #   word that isn't in there is settled with a dict lookup, no need to ask Phyme.  Once the whole
+        #   dictionary has been loaded with precomputePools, that means ordinary builds never touch Phyme at all.
+        cmuWords = load_word_phone_dict()
+        newWords = []
+        for word in dict.fromkeys(words):
+            if (word not in self.seenRhymeWords) and (word not in self.seenUnrhymableWords):
+                if word.upper() in cmuWords:
+                    newWords.append(word)
+                else:
+                    self.debugger.logStat("TotalUnrhymable", 1)
+                    self.seenUnrhymableWords.add(word)
+        if not newWords:
+            return
+
+        # With a worker pool every word is looked up in parallel, results streaming back in order.
+        #   Without one, each word is looked up as it's reached below, and only if it's still needed.
+        if workerPool:
+            self.debugger.message("INFO", "Looking up rhymes for {} new words".format(len(newWords)))
+            rhymeLookups = workerPool.imap(workerLookupRhymes, newWords, chunksize=64)
+        else:
+            rhymeLookups = itertools.repeat(False)
+
+        newPools = []       # (rhymeHint, seedWord) for each new rhymePool
+        newPoolWords = {}   # word -> seedWord of the new rhymePool it's going in to
+        for rhymeTarget, rhymeTargetRhymeList in zip(newWords, rhymeLookups):
+            if rhymeTarget in newPoolWords:
+                # Already picked up in the rhymes of an earlier word in this batch
+                continue
+
+            if rhymeTargetRhymeList is False:
+                rhymeTargetRhymeList = lookupRhymes(self.phyme(), rhymeTarget)
+
+            if rhymeTargetRhymeList is None:
+                # This word isn't rhymable, e.g.
+                #   can't find any rhyming words in the dictionary for this word,
+                #   so lines using it will be discarded.
+                self.debugger.logStat("TotalUnrhymable", 1)
+                self.seenUnrhymableWords.add(rhymeTarget)
+                continue
+
+            # Establish a new RhymePool for our words to chill out in
+            newPools.append((rhymeHint(rhymeTarget), rhymeTarget))
+            for rhymeResult in rhymeTargetRhymeList:
+                # Check that each cleaned result from Phyme hasn't been seen yet
+                if (rhymeResult not in self.seenRhymeWords) and (rhymeResult not in newPoolWords):
+                    newPoolWords[rhymeResult] = rhymeTarget
+
+        if not newPools:
+            return
+
+        # Bulk insert the pools, then pull their ids back by seedWord.  Every new pool has a different seedWord,
+        #   and this process is the only writer, so anything past the old max id is ours.
+        lastPoolId = self.rhymadexDB.query("SELECT COALESCE(MAX(`id`), 0) FROM `tblRhymePools`").fetchall()[0][0]
+        self.rhymadexDB.queryMany("INSERT INTO `tblRhymePools` (`rhymeHint`, `seedWord`) VALUES (?, ?)", newPools)
+        rhymePoolIds = dict((seedWord, rhymePoolId) for rhymePoolId, seedWord in
+                            self.rhymadexDB.query("SELECT `id`, `seedWord` FROM `tblRhymePools` \
+                                                   WHERE (`id` > ?)", (lastPoolId,)).fetchall())
+        self.debugger.logStat("DbInsertsRhymePools", len(newPools))
+
+        newRhymeWords = []
+        for rhymeResult in newPoolWords:
+            rhymePoolId = rhymePoolIds[newPoolWords[rhymeResult]]
+            # Record that we've seen it so we don't re-calculate rhymes on this again later
+            self.seenRhymeWords[rhymeResult] = rhymePoolId
+            newRhymeWords.append((rhymeResult, self.syllableCounter.count(rhymeResult), rhymePoolId, rhymeResult))
+
+        self.rhymadexDB.bulkLoad("INSERT INTO `tblRhymeWords` \
+                                  (`word`, `syllables`, `rhymeType`, `rhymePool`) VALUES \
+                                  (?, ?, 1, ?) \
+                                  ON DUPLICATE KEY UPDATE `word` = ?", newRhymeWords)
+        self.debugger.logStat("DbInsertsRhymeWords", len(newRhymeWords))
+
+    def precomputePools(self, workerPool=None):
+        # One-shot: walk the entire CMU dictionary behind Phyme and work out and bulk load the rhymePool of every
+        #   word in it.  Afterwards every word Phyme could ever rhyme is already in tblRhymeWords, so building
+        #   sources never needs a Phyme lookup again.
+        # Alternate pronunciations (WORD(1) ..) are skipped, same as the syllable seeding.
+        dictionaryWords = [cmuWord.lower() for cmuWord in load_word_phone_dict()
+                           if "(" not in cmuWord and len(cmuWord) <= 34]
+        self.debugger.message("INFO", "Precomputing rhymePools for {} dictionary words".format(len(dictionaryWords)))
+        with self.debugger.timer("rhymeLookup"):
+            self.resolveWords(dictionaryWords, workerPool)
+        self.debugger.message("INFO", "rhymeWords known after precompute: {}".format(len(self.seenRhymeWords)))
+
+    def rhymePool(self, word):
+        # The tblRhymePools id a known rhymeWord belongs to, or None if it hasn't been seen (or isn't rhymable)
+        return self.seenRhymeWords.get(word)
+
 class rhymadex:
-    def __init__(self, sourceFile):
-        self.sourceFile = sourceFile
+    def __init__(self, sourceFiles, lineBatchSize=1000, readChunkSize=1048576, workers=1, workerBatchSize=500,
+                 precomputeRhymes=False, incremental=True):
+        # sourceFiles can be a single path or a list of paths, which are built one after another in this run
+        if isinstance(sourceFiles, str):
+            sourceFiles = [sourceFiles]
+        self.sourceFiles = list(sourceFiles)
+        self.sourceFile = None
         self.debugger = debugger()
-        self.rhymadexDB = rhymadexMariaDB(self.debugger)
-        self.rhymer = rhymer(self.rhymadexDB, self.debugger)
+        self.rhymadexDB = connectRhymadexDB(self.debugger)
+        self.syllableCounter = syllableCounter(self.rhymadexDB, self.debugger)
+        self.rhymer = rhymer(self.rhymadexDB, self.debugger, self.syllableCounter)
+
+        # Cleaned lines are buffered here and written to tblLines this many at a time, one transaction per batch.
+        #   A lineBatchSize of 1 gets back the old one-INSERT-one-commit-per-line behavior.
+        self.lineBatchSize = max(1, int(lineBatchSize))
+        self.lineBatch = []
+
+        # How many lineHashes to look up at a time when checking a batch against what's already stored
+        self.lineLookupSize = 500
+
+        # Cleaned lines are spooled out to a temporary file this many at a time while the source is read, so the
+        #   rhymer can resolve every firstWord/lastWord in the source in one go before any line is stored, without
+        #   reading and cleaning the source twice or holding all of it in memory (see spoolLines)
+        self.spoolBatchSize = 10000
+
+        # rhymePools whose lines have changed while building the current source, for its tblPoolStats refresh
+        self.touchedPools = set()
+
+        # The source file is streamed in this many characters at a time rather than read in whole
+        self.readChunkSize = max(1, int(readChunkSize))
+        self.sourceCharsRead = 0
+
+        # With more than 1 worker, cleaning, syllable counting and Phyme lookups are farmed out to a pool of
+        #   worker processes, workerBatchSize fragments at a time.  This process stays the one and only DB writer.
+        self.workers = max(1, int(workers))
+        self.workerBatchSize = max(1, int(workerBatchSize))
+        self.workerPool = None
+
+        # Precompute rhymePools for the whole rhyme dictionary before building any sources (see rhymer.precomputePools)
+        self.precomputeRhymes = precomputeRhymes
+
+        # Incremental builds skip sources that haven't changed since they were last built, and only insert and
+        #   delete the lines that actually changed in the ones that have.  Otherwise every source is wiped and
+        #   rebuilt from scratch.
+        self.incremental = incremental
+
         self.buildRhymadex()
 
-    def lineCleaner(self, line):
+    def flushLines(self):
+        # Write out whatever is sitting in the line batch with a single executemany + commit.
+        # Lines already in tblLines (from any source) are left as they are.  The upsert is only there in case one
+        #   gets in between unstoredLines and the INSERT.
+        if self.lineBatch:
+            with self.debugger.timer("insert"):
+                newLines = self.unstoredLines(self.lineBatch)
+                self.rhymadexDB.queryMany("INSERT INTO `tblLines` \
+                                           (`firstWord`, `lastWord`, `line`, `syllables`, `source`, `lineHash`, \
+                                            `firstPool`, `lastPool`, `randomKey`) \
+                                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) \
+                                           ON DUPLICATE KEY UPDATE `lineHash` = `lineHash`", newLines)
+            # Only count the lines once their batch has actually been committed
+            self.debugger.logStat("DbInsertsLines", len(newLines))
+            for newLine in newLines:
+                self.touchedPools.update(newLine[6:8])
+            self.lineBatch = []
+        self.syllableCounter.flush()
+
+    def unstoredLines(self, lineBatch):
+        # The lines in lineBatch that aren't in tblLines yet.
+        # tblLines is kept unique on lineHash alone, so a lineHash that's already stored is checked against the
+        #   stored line's full text.  The same text is the same line, stored by another source.  Different text is
+        #   a 64-bit hash collision: that line can't be stored, but it's counted and reported rather than quietly
+        #   treated as a duplicate.
+        lineHashes = [batchLine[5] for batchLine in lineBatch]
+        storedLines = {}
+        for lookupStart in range(0, len(lineHashes), self.lineLookupSize):
+            lookupHashes = lineHashes[lookupStart:lookupStart + self.lineLookupSize]
+            # Padded out to lineLookupSize with repeats, so it's always the same statement
+            lookupHashes += lookupHashes[-1:] * (self.lineLookupSize - len(lookupHashes))
+            storedLines.update(self.rhymadexDB.query("SELECT `lineHash`, `line` FROM `tblLines` \
+                                                      WHERE `lineHash` IN ({})".format(
+                                                                           ", ".join(["?"] * self.lineLookupSize)),
+                                                     tuple(lookupHashes), prepared=True).fetchall())
+
+        newLines = []
+        for batchLine in lineBatch:
+            storedLine = storedLines.get(batchLine[5])
+            if storedLine is None:
+                newLines.append(batchLine)
+                # Anything further along the batch with the same lineHash is checked against this one
+                storedLines[batchLine[5]] = batchLine[2]
+            elif storedLine == batchLine[2]:
+                self.debugger.logStat("LinesAlreadyStored", 1)
+            else:
+                self.debugger.message("INFO", "lineHash collision, not storing \"{}\" (same lineHash as \"{}\")",
+                                      batchLine[2], storedLine)
+                self.debugger.logStat("LineHashCollisions", 1)
+        return newLines
+
+    @staticmethod
+    def lineCleaner(line):
         # Clean up a line of text before inserting it to the database
         # Return a nice, clean line
+        # The actual work is done by the precompiled module-level lineCleanerEngine
+        return lineCleanerEngine.clean(line)
+
+    def sourceFragments(self, sourceTextFile):
+        # Generator: read the source text a chunk at a time and yield each fragment as it's split off.
+        # Whatever follows the last delimiter in a chunk may be only part of a fragment, so it's carried over
+        #   and glued on to the front of the next chunk.  At the end of the file the carry is the last fragment.
+        carry = ""
+        while True:
+            chunk = sourceTextFile.read(self.readChunkSize)
+            if not chunk:
+                break
+            fragments = sourceSplitter.split(carry + chunk)
+            carry = fragments.pop()
+            for fragment in fragments:
+                # Track how far through the file we are, +1 for the delimiter, for the progress meter
+                self.sourceCharsRead += len(fragment) + 1
+                yield fragment
+        self.sourceCharsRead += len(carry)
+        yield carry
+
+    def uniqueFragments(self, fragments):
+        # Generator: pass along only the first occurrence of each fragment.
+        # Dedupe on a 64-bit lineHash of each fragment rather than the fragment text, so the memory cost is a
+        #   small int per distinct fragment no matter how long the fragments are.  A fragment whose lineHash
+        #   collides with an earlier, different one is dropped with it (see lineHash for the odds).
+        seenFragmentHashes = set()
+        for fragment in fragments:
+            fragmentHash = lineHash(fragment)
+            if fragmentHash not in seenFragmentHashes:
+                seenFragmentHashes.add(fragmentHash)
+                yield fragment
+
+    def fragmentBatches(self, fragments):
+        # Generator: group fragments in to lists of workerBatchSize to hand to the worker pool
+        fragmentBatch = []
+        for fragment in fragments:
+            fragmentBatch.append(fragment)
+            if len(fragmentBatch) >= self.workerBatchSize:
+                yield fragmentBatch
+                fragmentBatch = []
+        if fragmentBatch:
+            yield fragmentBatch
+
+    def workerMap(self, workerFunction, fragments):
+        # Generator: run workerFunction over batches of fragments and yield what comes back for each batch, in
+        #   source order.  In the worker pool if there is one, only a couple of batches per worker in flight at
+        #   once so the source is still streamed rather than queued up in memory all at once.  Otherwise right here.
+        if not self.workerPool:
+            for fragmentBatch in self.fragmentBatches(fragments):
+                yield workerFunction(fragmentBatch)
+            return
+
+        pendingBatches = collections.deque()
+        for fragmentBatch in self.fragmentBatches(fragments):
+            pendingBatches.append(self.workerPool.apply_async(workerFunction, (fragmentBatch,)))
+            if len(pendingBatches) >= self.workers * 2:
+                yield pendingBatches.popleft().get()
+        while pendingBatches:
+            yield pendingBatches.popleft().get()
+
+    def workerResults(self, fragments):
+        # Generator: per-fragment results from the worker pool, in source order
+        for results, newSyllableCounts, stageSeconds in self.workerMap(workerProcessFragments, fragments):
+            # Remember any syllable counts the worker had to estimate, so they get stored
+            self.syllableCounter.learn(newSyllableCounts)
+            for stage in stageSeconds:
+                self.debugger.logTiming(stage, stageSeconds[stage], len(results))
+            yield from results
+
+    def serialResults(self, fragments):
+        # Generator: the same per-fragment results as workerResults, just worked out right here in this process.
+        # The clean and syllables stage times are added up here and handed to the debugger at the end, rather than
+        #   going through the debugger's lock on every line.
+        cleanSeconds = syllableSeconds = 0.0
+        fragmentCount = 0
+        for fragment in fragments:
+            # Use the lineCleaner on each line first.
+            # What comes back will be only printable ANSI with the ends trimmed, everything lowered,
+            #   and some common punctuation-to-text replacements done
+            started = time.perf_counter()
+            sourceLine = self.lineCleaner(fragment)
+            cleaned = time.perf_counter()
+            cleanSeconds += cleaned - started
+            fragmentCount += 1
 
-        # Only deal in printables.
-        line = "".join(aChar for aChar in line if aChar in string.printable)
-
-        # Only deal in lowers.
-        line = line.lower()
+            # Anything longer than 255 won't fit in the DB with this schema.
+            if (sourceLine and (len(sourceLine) < 256)):
+                result = (sourceLine,) + lineDetails(sourceLine, self.syllableCounter)
+                syllableSeconds += time.perf_counter() - cleaned
+                yield result
+            else:
+                yield None
+        self.debugger.logTiming("clean", cleanSeconds, fragmentCount)
+        self.debugger.logTiming("syllables", syllableSeconds, fragmentCount)
+
+    def cleanFragments(self, fragments):
+        # Generator: clean each fragment, either in the worker pool or right here, and yield
+        #   (sourceLine, wordCount, firstWord, lastWord, syllables) for each line that will fit.
+        if self.workerPool:
+            results = self.workerResults(fragments)
+        else:
+            results = self.serialResults(fragments)
 
-        # Starts with a letter, then whatever, then ends in a letter
-        # Truncates all non-letter junk at the start and end, including punctuation
-        line = "".join(re.findall(r"[a-z]+.*[a-z]+", line))
+        for result in results:
+            self.debugger.logStat("TotalLinesSeen", 1)
+            self.debugger.logStat("TotalLinesProcessed", 1)
 
-        # Remove almost all non-grammatical punctuation
-        line = re.sub(r"[~`#^*_\[\]{}|\\<>/()$€ƒ„…†‡ˆ‰‹Œ‘’“”•˜™›¢£¤¥¦§¨©ª«¬®¯°±²³´µ¶·¸¹º»¿×÷]+", "", line)
+            if result:
+                yield result
+            else:
+                # Line is less than 1 or greater than 255, so pass it by and nothing happens.
+                self.debugger.logStat("WontFitLines", 1)
+                self.debugger.logStat("TotalDiscardedLines", 1)
 
-        # The "and" coordinating conjunction at the beginning of a line is redundant in my opinion,
-        #   resulting from the comma-split logic.  There are an enormous amount of lines with "and"
-        #   as the first word.  Lets just remove them to make for more intesting output.  Some day,
-        #   if this is calculating every rhymepool for every word in a line, could make "and" optional.
-        #   Other coordinating conjunctions like but, for, or, nor etc imply "non-additive" logic.
-        #   Leave those in for now.
-        line = re.sub(r"^and ", "", line)
-
-        # Pretty up with some substitutions
-        line = re.sub(r"--", " ", line)
-        line = re.sub(r"–", " ", line)
-        line = re.sub(r"—", " ", line)
-        line = re.sub(r"@", "at", line)
-        line = re.sub(r"&", "and", line)
-        line = re.sub(r"=", "equals", line)
-        line = re.sub(r"%", "percent", line)
-        line = re.sub(r"¼", "one quarter", line)
-        line = re.sub(r"½", "one half", line)
-        line = re.sub(r"¾", "three quarters", line)
-        line = re.sub(r"\+", "plus", line)
+    def buildRhymadex(self):
+        # Build each source in turn, then one summary for the whole run.
+        # The worker pool, if there is one, lives for the whole run.  Workers start with a copy of the syllable
+        #   memo as it is now, and don't need anything else from this process.
+        if self.workers > 1:
+            self.workerPool = multiprocessing.Pool(self.workers, initializer=workerInit,
+                                                   initargs=(self.syllableCounter.syllableCounts,))
+        try:
+            if self.precomputeRhymes:
+                self.rhymer.precomputePools(self.workerPool)
+            for sourceFile in self.sourceFiles:
+                self.sourceFile = sourceFile
+                self.buildSource()
+        finally:
+            if self.workerPool:
+                self.workerPool.close()
+                self.workerPool.join()
+                self.workerPool = None
 
-        return line or None
+        self.debugger.summary()
 
-    def buildRhymadex(self):
+    def spoolLines(self, cleanedLines, spoolFile):
+        # The one read & clean pass over the source: write cleanFragments' lines out to spoolFile, spoolBatchSize
+        #   at a time (each batch with how far through the source it got, for the progress meter), and collect up
+        #   the firstWords/lastWords of the ones that will fit.
+        # Returns those words, distinct and in first-seen order, for the rhymer to resolve before the spooled
+        #   lines are read back by spooledLines and stored.
+        sourceWords = {}
+        spoolBatch = []
+        for cleanedLine in cleanedLines:
+            spoolBatch.append(cleanedLine)
+            sourceLine, sourceLineWordCount, firstWord, lastWord, sourceLineSyllables = cleanedLine
+            if sourceLineSyllables is not None:
+                sourceWords[firstWord] = None
+                sourceWords[lastWord] = None
+            if len(spoolBatch) >= self.spoolBatchSize:
+                marshal.dump((self.sourceCharsRead, spoolBatch), spoolFile)
+                spoolBatch = []
+        marshal.dump((self.sourceCharsRead, spoolBatch), spoolFile)
+        return list(sourceWords)
+
+    def spooledLines(self, spoolFile):
+        # Generator: the lines spoolLines wrote out, in the same order, a batch at a time
+        spoolFile.seek(0)
+        while True:
+            try:
+                self.sourceCharsRead, spoolBatch = marshal.load(spoolFile)
+            except EOFError:
+                return
+            yield from spoolBatch
+
+    def sourceHash(self):
+        # A 64-bit fingerprint of the source file's bytes together with the lineCleaner's signature, read through
+        #   readChunkSize at a time.  If this matches what was stored at the last build, the build would come out
+        #   exactly the same again.
+        fileHasher = hashlib.blake2b(lineCleanerEngine.signature, digest_size=8)
+        with open(self.sourceFile, 'rb') as sourceBinaryFile:
+            for chunk in iter(lambda: sourceBinaryFile.read(self.readChunkSize), b""):
+                fileHasher.update(chunk)
+        return int.from_bytes(fileHasher.digest(), "big", signed=True)
+
+    def buildSource(self):
         self.debugger.message("INFO", "Opening file for processing: {}".format(self.sourceFile))
         try:
             sourceTextFile = open(self.sourceFile, 'r', encoding = "ISO-8859-1")
-            # sourceTextBlob = sourceTextFile.read().replace('\n', ' ')
-            sourceTextBlob = sourceTextFile.read()
-            sourceTextFile.close()
+            # ISO-8859-1 is one byte per character, so the file size is also the character count
+            self.sourceSize = os.path.getsize(self.sourceFile)
+            sourceFileHash = self.sourceHash()
         except OSError as e:
             self.debugger.message("ERROR", "OSError when opening file for reading: {}\nOSError: {}".format(
                                                                                                     self.sourceFile, e))
             exit("Nothing more to do.  Exiting.")
 
+        # What does the database think this source looked like last time it was built, if ever?
+        storedSource = self.rhymadexDB.query("SELECT `fileHash` FROM `tblSources` \
+                                              WHERE \
+                                              (`sourceName` = ?) \
+                                              LIMIT 1", (self.sourceFile,)).fetchall()
+        storedFileHash = storedSource[0][0] if storedSource else None
+
+        if self.incremental and (storedFileHash == sourceFileHash):
+            self.debugger.message("INFO", "Source unchanged since it was last built.  Skipping.")
+            self.debugger.logStat("SourcesSkipped", 1)
+            sourceTextFile.close()
+            return
+
         # Capture the data source and get the source primary key ID from the database
         self.rhymadexDB.query("INSERT INTO `tblSources` \
                               (`sourceName`, `dtmInit`) \
@@ -423,71 +2362,138 @@ class rhymadex:
                                           (`sourceName` = ?) \
                                           LIMIT 1", (self.sourceFile,)).fetchall()[0][0]
 
-        # Remove any existing source lines 'cause we're gunna rebuild them now
-        deletedLines = self.rhymadexDB.query("DELETE FROM `tblLines` \
-                                              WHERE (`source` = ?)", (sourceId,), "", True).rowcount
-        if deletedLines:
-            self.debugger.message("INFO", "Deleted {} existing source lines from tblLines.".format(deletedLines))
-
-        # Break Lines apart on: , . ! ? ; : tabspace newline
-        #   IMO some of the most interesting magic happens on the comma split because it results in
-        #   poetic sentence fragments
-        sourceLines = re.split('[,.!?;:\t\n]', sourceTextBlob)
-
-        # Do that little to-dict and back to-list trick to dedupe all the list items
-        sourceLines = list(dict.fromkeys(sourceLines))
-        self.debugger.logStat("TotalLinesSeen", None, len(sourceLines))
-        self.debugger.logStat("TotalDiscardedLines",
-                              (self.debugger.getStat("TotalLinesSeen")-self.debugger.getStat("TotalLinesSeen")))
-        self.debugger.message("INFO", "Line entries found: {}".format(self.debugger.getStat("TotalLinesSeen")))
-
-        for sourceLine in sourceLines:
-            self.debugger.logStat("TotalLinesProcessed", 1)
-
-            # Use the lineCleaner on each line first.
-            # What comes back will be only printable ANSI with the ends trimmed, everything lowered,
-            #   and some common punctuation-to-text replacements done
-            sourceLine = self.lineCleaner(sourceLine)
-
-            # Anything longer than 255 won't fit in the DB with this schema.
-            if (sourceLine and (len(sourceLine) < 256)):
-                sourceLineWords = sourceLine.split()
-                self.debugger.logStat("TotalWordsProcessed", len(sourceLineWords))
-                firstWord = sourceLineWords[0]
-                lastWord = sourceLineWords[-1]
-
-                if (len(firstWord) and len(lastWord) and (len(firstWord) <= 34) and (len(lastWord) <= 34)):
-                    # Line Syllable Estimation
-                    # Can only estimate syllable count per-word, so run the estimator on every word in
-                    #   the line and accumulate.  The estimator is really inaccurate but good for POC
-                    sourceLineSyllables = 0
-                    for sourceLineWord in sourceLineWords:
-                        sourceLineSyllables += syllables.estimate(sourceLineWord)
-
-                    self.debugger.logStat("TotalSyllablesSeen", sourceLineSyllables)
-
-                    # Look up rhymes for the firstWord and the lastWord
-                    if (self.rhymer.findRhymes(firstWord) and self.rhymer.findRhymes(lastWord)):
-                        # If everything came out rhymable, insert the line
-                        self.rhymadexDB.query("INSERT INTO `tblLines` \
-                                                (`firstWord`, `lastWord`, `line`, `syllables`, `source`) \
-                                                VALUES (?, ?, ?, ?, ?) \
-                                                ON DUPLICATE KEY UPDATE `line` = ?",
-                                              (firstWord, lastWord, sourceLine, int(sourceLineSyllables),
-                                               int(sourceId), sourceLine), "", True)
-                        self.debugger.logStat("DbInsertsLines", 1)
-                else:
-                    # firstWord or lastWord is under 1 or over 34 chars long, so pass it by and nothing happens.
-                    self.debugger.logStat("TotalDiscardedLines", 1)
+        # tblPoolStats gets refreshed at the end for every rhymePool the source has lines in, before and after.
+        #   Not just the ones with lines going in or out this time: lines stored by a build that fell over part way
+        #   through come up as unchanged next time, and their rhymePools still need doing.
+        self.touchedPools = set()
+
+        if self.incremental and (storedFileHash is not None):
+            # Built before, with hashes.  Hold on to the lineHash of every line stored for it.  Lines that come up
+            #   again are left alone and crossed off, and whatever's left at the end is gone from the source.
+            storedLineHashes = set()
+            for storedLineHash, firstPool, lastPool in self.rhymadexDB.query("SELECT `lineHash`, `firstPool`, \
+                                                                              `lastPool` FROM `tblLines` \
+                                                                              WHERE (`source` = ?)",
+                                                                             (sourceId,)).fetchall():
+                storedLineHashes.add(storedLineHash)
+                self.touchedPools.update((firstPool, lastPool))
+            self.debugger.message("INFO", "Source changed.  Comparing against {} stored source lines.".format(
+                                                                                              len(storedLineHashes)))
+        else:
+            # Remove any existing source lines 'cause we're gunna rebuild them now
+            storedLineHashes = set()
+            for sourcePools in self.rhymadexDB.query("SELECT DISTINCT `firstPool`, `lastPool` FROM `tblLines` \
+                                                      WHERE (`source` = ?)", (sourceId,)).fetchall():
+                self.touchedPools.update(sourcePools)
+            deletedLines = self.rhymadexDB.query("DELETE FROM `tblLines` \
+                                                  WHERE (`source` = ?)", (sourceId,), "", True).rowcount
+            if deletedLines:
+                self.debugger.message("INFO", "Deleted {} existing source lines from tblLines.".format(deletedLines))
+
+        self.debugger.logStat("TotalLinesSeen", 0)
+        self.debugger.logStat("TotalDiscardedLines", 0)
+
+        self.sourceCharsRead = 0
+        linesSeenBefore = self.debugger.getStat("TotalLinesSeen")
+
+        # Stream the source through the pipeline: read & split -> dedupe -> clean -> spool, then resolve rhymes for
+        #   every firstWord/lastWord in the source in one go, then read the spool back and store.  Nothing but the
+        #   current chunk (or spool batch), the batches in flight to the workers, the source's distinct words and
+        #   the dedupe hashes is ever held in memory.
+        spoolFile = tempfile.TemporaryFile()
+        sourceWords = self.spoolLines(self.cleanFragments(self.uniqueFragments(self.sourceFragments(sourceTextFile))),
+                                      spoolFile)
+        sourceTextFile.close()
+        self.debugger.message("INFO", "Distinct firstWords/lastWords found: {}".format(len(sourceWords)))
+        with self.debugger.timer("rhymeLookup"):
+            self.rhymer.resolveWords(sourceWords, self.workerPool)
+
+        self.debugger.progressPercent = None
+        for sourceLine, sourceLineWordCount, firstWord, lastWord, sourceLineSyllables in self.spooledLines(spoolFile):
+            self.debugger.logStat("TotalWordsProcessed", sourceLineWordCount)
+
+            if sourceLineSyllables is not None:
+                self.debugger.logStat("TotalSyllablesSeen", sourceLineSyllables)
+
+                # Check the firstWord and the lastWord are rhymable.  They've all been resolved already, so this
+                #   is just a couple of dict lookups.
+                if (self.rhymer.findRhymes(firstWord) and self.rhymer.findRhymes(lastWord)):
+                    sourceLineHash = lineHash(sourceLine)
+                    if sourceLineHash in storedLineHashes:
+                        # Already stored from the last build, nothing to do but cross it off
+                        storedLineHashes.discard(sourceLineHash)
+                        self.debugger.logStat("LinesUnchanged", 1)
+                    else:
+                        # If everything came out rhymable, queue the line up for the next batch insert
+                        self.lineBatch.append((firstWord, lastWord, sourceLine, int(sourceLineSyllables),
+                                               int(sourceId), sourceLineHash, self.rhymer.rhymePool(firstWord),
+                                               self.rhymer.rhymePool(lastWord), random.getrandbits(31)))
+                        if len(self.lineBatch) >= self.lineBatchSize:
+                            self.flushLines()
             else:
-                # Line is less than 1 or greater than 255, so pass it by and nothing happens.
-                self.debugger.logStat("WontFitLines", 1)
+                # firstWord or lastWord is under 1 or over 34 chars long, so pass it by and nothing happens.
                 self.debugger.logStat("TotalDiscardedLines", 1)
 
-            self.debugger.progress(self.debugger.getStat("TotalLinesProcessed"),
-                                   self.debugger.getStat("TotalLinesSeen"))
+            self.debugger.progress(self.sourceCharsRead, self.sourceSize)
 
-        self.debugger.summary()
+        spoolFile.close()
+        self.debugger.progress(self.sourceSize, self.sourceSize)
+        self.debugger.message("INFO", "Line entries found: {}".format(
+                                                        self.debugger.getStat("TotalLinesSeen") - linesSeenBefore))
+
+        # Write out the last partial batch
+        self.flushLines()
+
+        # Stored lines that never came up this time around aren't in the source any more
+        if storedLineHashes:
+            self.rhymadexDB.bulkLoad("DELETE FROM `tblLines` \
+                                      WHERE (`source` = ?) AND (`lineHash` = ?)",
+                                     [(sourceId, storedLineHash) for storedLineHash in storedLineHashes])
+            self.debugger.message("INFO", "Deleted {} stale source lines from tblLines.".format(
+                                                                                              len(storedLineHashes)))
+            self.debugger.logStat("DbDeletesLines", len(storedLineHashes))
+
+        # Bring tblPoolStats up to date for the rhymePools this source has changed
+        with self.debugger.timer("poolStats"):
+            self.rhymadexDB.refreshPoolStats(self.touchedPools)
+        self.debugger.message("INFO", "Refreshed tblPoolStats for {} rhymePools.", len(self.touchedPools))
+        self.debugger.logStat("PoolStatsRefreshed", len(self.touchedPools))
+
+        # Only now that everything is in is the source marked as built from this version of the file.  A build
+        #   that falls over part way through will be picked up again next time.
+        self.rhymadexDB.query("UPDATE `tblSources` SET `fileHash` = ? \
+                              WHERE (`id` = ?)", (sourceFileHash, sourceId), "", True)
 
 if __name__ == "__main__":
-    rhymadex = rhymadex("textsources/bible/bible.txt")
\ No newline at end of file
+    # Source files to build can be given on the command line, and are farmed out to one worker process per core.
+    #   --precompute-rhymes loads the rhymePools for the whole rhyme dictionary first (only needs doing once).
+    #   --full-rebuild wipes and rebuilds every source given, changed or not.
+    #   --export-snapshot PATH / --import-snapshot PATH write the rhymadex out to, or load it in from, a snapshot
+    #     file instead of building anything (see rhymadexSnapshot).
+    #   --export-corpus PATH writes a corpus file for explorer workers to map (see the explorer's corpusEngine).
+    for snapshotFlag in ("--export-snapshot", "--import-snapshot"):
+        if snapshotFlag in sys.argv[1:-1]:
+            snapshotPath = sys.argv[sys.argv.index(snapshotFlag) + 1]
+            snapshotDebugger = debugger()
+            snapshot = rhymadexSnapshot(connectRhymadexDB(snapshotDebugger), snapshotDebugger)
+            if snapshotFlag == "--export-snapshot":
+                snapshot.export(snapshotPath)
+            else:
+                snapshot.load(snapshotPath)
+            snapshotDebugger.summary()
+            sys.exit()
+    if "--export-corpus" in sys.argv[1:-1]:
+        # Imported here rather than up top, as the explorer imports from this module
+        from rhymadex_explorer import corpusEngine
+        corpusPath = sys.argv[sys.argv.index("--export-corpus") + 1]
+        corpusDebugger = debugger()
+        corpusEngine(corpusDebugger, connectRhymadexDB(corpusDebugger, readOnly=True)).save(corpusPath)
+        corpusDebugger.summary()
+        sys.exit()
+    precomputeRhymes = "--precompute-rhymes" in sys.argv[1:]
+    fullRebuild = "--full-rebuild" in sys.argv[1:]
+    sourceFiles = [arg for arg in sys.argv[1:] if arg not in ("--precompute-rhymes", "--full-rebuild")]
+    if not (sourceFiles or precomputeRhymes):
+        sourceFiles = ["textsources/bible/bible.txt"]
+    rhymadex = rhymadex(sourceFiles, workers=os.cpu_count(), precomputeRhymes=precomputeRhymes,
+                        incremental=not fullRebuild)
\ No newline at end of file
@@ -1,17 +1,476 @@
 # rhymadex_explorer.py
 # Generate pairs and sequences of matching lines from the Rhymadex DB
 
-import mariadb
+import bisect
+import collections
+import json
+import mmap
+import os
+import random
+import struct
 import sys
+import threading
+import time
 from rhymadex_builder import debugger
-from rhymadex_builder import rhymadexMariaDB
+from rhymadex_builder import connectRhymadexDB
+from rhymadex_builder import databaseIdentity
+from rhymadex_builder import rhymadexPool
+from rhymadex_builder import schemaCurrentVersion
+
+try:
+    import numpy
+except ImportError:
+    # Only the corpusEngine needs numpy.  Songs picked straight from the database get by without it.
+    numpy = None
+
+class poolLineCache:
+    # The lines of recently used rhymePools, held in memory for picking song lines from (see song.poolLines).
+    # Fetching a rhymePool's lines is one query.  After that, every line of every song that uses the rhymePool is
+    # picked in Python, until more recently used rhymePools push it out, or it's older than maxAge seconds.
+    # It holds at most maxLines lines all told, so a few huge rhymePools can't take up all the memory.  A rhymePool
+    # with more lines than that on its own isn't kept at all.
+    # maxAge is so a long running process still sees what the builder has changed since.
+    # One is shared by every song in the process (sharedPoolLineCache below), threads and all.  The songs can be
+    # using different databases, so the keys have the databaseIdentity in them.
+    def __init__(self, maxLines=250000, maxAge=600):
+        self.maxLines = maxLines
+        self.maxAge = maxAge
+
+        # (databaseIdentity, poolColumn, rhymePool) -> (when it was fetched, its lines' syllables, its lines), least
+        #   recently used first, and how many lines that is all together
+        self.pools = collections.OrderedDict()
+        self.lineCount = 0
+        self.lock = threading.Lock()
+
+    def get(self, poolKey):
+        with self.lock:
+            cachedPool = self.pools.get(poolKey)
+            if cachedPool is None:
+                return None
+            if (time.monotonic() - cachedPool[0]) > self.maxAge:
+                self.remove(poolKey)
+                return None
+            self.pools.move_to_end(poolKey)
+            return cachedPool
+
+    def put(self, poolKey, cachedPool):
+        with self.lock:
+            if poolKey in self.pools:
+                self.remove(poolKey)
+            if len(cachedPool[2]) > self.maxLines:
+                return
+            self.pools[poolKey] = cachedPool
+            self.lineCount += len(cachedPool[2])
+            while self.lineCount > self.maxLines:
+                self.remove(next(iter(self.pools)))
+
+    def remove(self, poolKey):
+        # Only with the lock held
+        self.lineCount -= len(self.pools.pop(poolKey)[2])
+
+    def clear(self):
+        with self.lock:
+            self.pools.clear()
+            self.lineCount = 0
+
+sharedPoolLineCache = poolLineCache()
+
+class stringTable:
+    # A list of strings packed in to two arrays for a corpusEngine: text, every string's UTF-8 bytes end to end, and
+    #   offsets, where each one starts (and one more for where the last one ends).  Indexing it decodes just the one
+    #   string, so it works the same straight out of a mapped corpus file as in memory.
+    def __init__(self, offsets, text):
+        self.offsets = offsets
+        self.text = text
+
+    @classmethod
+    def fromStrings(cls, strings):
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(string) for string in encoded], out=offsets[1:])
+        return cls(offsets, numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.text[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+class corpusEngine:
+    # The whole of tblLines held in memory as NumPy arrays, for explorer nodes that make a lot of songs: one
+    # corpusEngine loaded at startup and handed to every song (song(..., engine=engine)).  Picking rhymePools and
+    # lines is then all done with array operations on it, and never touches the database.
+    # Each line is its syllables, firstPool and lastPool, and its firstWord and lastWord as word ids (indexes in to
+    # words, which are in sorted order).  The line text and the words are stringTables, only decoded for the lines
+    # that get picked.  The lines are also kept in randomKey order, for picking a line with no rhymePool the same
+    # way the database does.
+    # It's a snapshot of tblLines as of when it was loaded.  load() again to pick up the builder's changes since.
+    #
+    # Everything it works from is in self.arrays, so it can be saved to a corpus file (save(), or the builder's
+    #   --export-corpus) and then opened with corpusEngine(debugger, corpusFile=path) instead of loaded.  Opening
+    #   maps the file read only, and the arrays are views straight on to it: nothing is read or copied up front,
+    #   and every worker on the host that opens the same file shares the one copy of it in the page cache.
+    # The file is the magic line, a 4 byte length and that much JSON header (the corpus file format version, the
+    #   schema version from tblVersion it was built from, and each array's dtype, shape and offset), then the
+    #   arrays, each starting on an arrayAlignment boundary.
+    corpusMagic = b"RHYMADEX CORPUS\n"
+    corpusVersion = 2
+    arrayAlignment = 64
+
+    # How many lines at a time pickLine checks along randomOrder for one that fits
+    randomChunk = 4096
+
+    wordPositions = (0, 1, 2)
+    wordIndexes = ("firstWord", "lastWord")
+
+    def __init__(self, debugger, rhymadexDB=None, chunkRows=100000, corpusFile=None):
+        self.debugger = debugger
+        self.chunkRows = chunkRows
+        self.corpusMap = None
+
+        if numpy is None:
+            self.debugger.message("ERROR", "The numpy module isn't installed")
+            sys.exit("Can't use a corpusEngine without numpy.  Exiting.")
+
+        if corpusFile is not None:
+            self.open(corpusFile)
+        else:
+            self.load(rhymadexDB or connectRhymadexDB(self.debugger, readOnly=True))
+
+    def load(self, rhymadexDB):
+        # Read tblLines in to the arrays, a page at a time by primary key
+        lineIds, lineSyllables, firstPools, lastPools, firstWords, lastWords, randomKeys = [], [], [], [], [], [], []
+        lines = []
+        words = []
+        wordIds = {}
+        lastId = 0
+        with self.debugger.timer("engineLoad"):
+            schemaVersion = int(rhymadexDB.query("SELECT max(`versionNum`) FROM `tblVersion`").fetchall()[0][0])
+            while True:
+                rows = rhymadexDB.query("SELECT `id`, `line`, `firstWord`, `lastWord`, `syllables`, `firstPool`, \
+                                         `lastPool`, `randomKey` FROM `tblLines` WHERE (`id` > ?) \
+                                         ORDER BY `id` LIMIT ?",
+                                        (lastId, self.chunkRows)).fetchall()
+                if not rows:
+                    break
+                for lineId, line, firstWord, lastWord, syllables, firstPool, lastPool, randomKey in rows:
+                    if firstWord not in wordIds:
+                        wordIds[firstWord] = len(words)
+                        words.append(firstWord)
+                    if lastWord not in wordIds:
+                        wordIds[lastWord] = len(words)
+                        words.append(lastWord)
+                    lineIds.append(lineId)
+                    lines.append(line)
+                    firstWords.append(wordIds[firstWord])
+                    lastWords.append(wordIds[lastWord])
+                    lineSyllables.append(syllables)
+                    # A line from before its words had rhymePools gets -1, which is never picked
+                    firstPools.append(-1 if firstPool is None else firstPool)
+                    lastPools.append(-1 if lastPool is None else lastPool)
+                    randomKeys.append(randomKey)
+                lastId = rows[-1][0]
+
+            # Renumber the words in sorted order, so a word's id can be found by bisecting words (see wordId)
+            wordOrder = sorted(range(len(words)), key=words.__getitem__)
+            wordRanks = numpy.zeros(len(words), dtype=numpy.int32)
+            wordRanks[wordOrder] = numpy.arange(len(words), dtype=numpy.int32)
+
+            arrays = {"schemaVersion": schemaVersion,
+                      "lineIds": numpy.array(lineIds, dtype=numpy.int64),
+                      "syllables": numpy.array(lineSyllables, dtype=numpy.int16),
+                      "firstWordPools": numpy.array(firstPools, dtype=numpy.int32),
+                      "lastWordPools": numpy.array(lastPools, dtype=numpy.int32),
+                      "firstWordIds": wordRanks[numpy.array(firstWords, dtype=numpy.int64)],
+                      "lastWordIds": wordRanks[numpy.array(lastWords, dtype=numpy.int64)]}
+            # The lines in (randomKey, id) order, and their randomKeys to searchsorted for where to start from
+            randomKeys = numpy.array(randomKeys, dtype=numpy.int32)
+            arrays["randomOrder"] = numpy.lexsort((arrays["lineIds"], randomKeys))
+            arrays["randomKeys"] = randomKeys[arrays["randomOrder"]]
+            del randomKeys
+
+            for name, strings in (("lines", lines), ("words", [words[word] for word in wordOrder])):
+                strings = stringTable.fromStrings(strings)
+                arrays[name + "Offsets"] = strings.offsets
+                arrays[name + "Text"] = strings.text
+            del lines, words, wordIds
+
+            poolCount = int(max(arrays["firstWordPools"].max(initial=-1),
+                                arrays["lastWordPools"].max(initial=-1))) + 1
+
+            # For each of tblPoolStats' wordPositions (0 firstWord, 1 lastWord, 2 both with different words):
+            #   positionLines: the lines that count towards it sorted by rhymePool, then syllables, then id (the
+            #     order song.poolLines keeps a rhymePool's lines in), and positionPools their rhymePools.  One
+            #     rhymePool's lines are then a searchsorted slice.
+            #   syllableCounts: a rhymePools x syllables matrix of line counts, and its running total along the
+            #     syllables, so the lines in a syllable window are one subtraction for every rhymePool at once.
+            #   poolWords: for firstWord and lastWord, each distinct (rhymePool, word) pair's rhymePool and a bit
+            #     for each syllable count the word has lines with (counts over 63 share the top bit).  Distinct
+            #     words in the syllable windows are then the pairs with any of the windows' bits, counted up.
+            syllableCount = int(arrays["syllables"].max(initial=0)) + 1
+            wordCount = len(arrays["wordsOffsets"]) - 1
+            dualLines = ((arrays["firstWordPools"] == arrays["lastWordPools"]) &
+                         (arrays["firstWordIds"] != arrays["lastWordIds"]))
+            for wordPosition, poolWord, positionFilter in ((0, "firstWord", None), (1, "lastWord", None),
+                                                           (2, "firstWord", dualLines)):
+                positionMask = arrays[poolWord + "Pools"] >= 0
+                if positionFilter is not None:
+                    positionMask &= positionFilter
+                # lexsort is stable, and flatnonzero's lines are already in id order
+                positionLines = numpy.flatnonzero(positionMask)
+                positionLines = positionLines[numpy.lexsort((arrays["syllables"][positionLines],
+                                                             arrays[poolWord + "Pools"][positionLines]))]
+                pools = arrays[poolWord + "Pools"][positionLines].astype(numpy.int64)
+                arrays["positionLines{}".format(wordPosition)] = positionLines
+                arrays["positionPools{}".format(wordPosition)] = pools
+
+                positionSyllables = arrays["syllables"][positionLines].astype(numpy.int64)
+                syllableCounts = numpy.bincount(pools * syllableCount + positionSyllables,
+                                                minlength=poolCount * syllableCount).reshape(poolCount, syllableCount)
+                arrays["syllableCounts{}".format(wordPosition)] = syllableCounts
+                arrays["syllableTotals{}".format(wordPosition)] = numpy.concatenate(
+                                        (numpy.zeros((poolCount, 1), dtype=numpy.int64),
+                                         numpy.cumsum(syllableCounts, axis=1)), axis=1)
+
+                syllableBits = numpy.left_shift(numpy.uint64(1),
+                                                numpy.minimum(positionSyllables, 63).astype(numpy.uint64))
+                for wordIndex in self.wordIndexes:
+                    poolWordKeys, poolWordLines = numpy.unique(pools * wordCount +
+                                                               arrays[wordIndex + "Ids"][positionLines],
+                                                               return_inverse=True)
+                    poolWordBits = numpy.zeros(len(poolWordKeys), dtype=numpy.uint64)
+                    numpy.bitwise_or.at(poolWordBits, poolWordLines, syllableBits)
+                    arrays["poolWordPools{}{}".format(wordPosition, wordIndex)] = poolWordKeys // wordCount
+                    arrays["poolWordBits{}{}".format(wordPosition, wordIndex)] = poolWordBits
+
+        self.useArrays(arrays)
+        self.debugger.message("INFO", "corpusEngine loaded {} lines, {} words, {} rhymePools", len(self.lines),
+                              len(self.words), self.poolCount)
+
+    def useArrays(self, arrays):
+        # Point the engine at arrays, from load() or mapped from a corpus file by open()
+        self.arrays = arrays
+        self.schemaVersion = arrays["schemaVersion"]
+        self.lineIds = arrays["lineIds"]
+        self.syllables = arrays["syllables"]
+        self.pools = {wordIndex: arrays[wordIndex + "Pools"] for wordIndex in self.wordIndexes}
+        self.wordArrays = {wordIndex: arrays[wordIndex + "Ids"] for wordIndex in self.wordIndexes}
+        self.lines = stringTable(arrays["linesOffsets"], arrays["linesText"])
+        self.words = stringTable(arrays["wordsOffsets"], arrays["wordsText"])
+        self.randomOrder = arrays["randomOrder"]
+        self.randomKeys = arrays["randomKeys"]
+        self.positionLines = {}
+        self.positionPools = {}
+        self.syllableCounts = {}
+        self.syllableTotals = {}
+        self.poolWords = {}
+        for wordPosition in self.wordPositions:
+            self.positionLines[wordPosition] = arrays["positionLines{}".format(wordPosition)]
+            self.positionPools[wordPosition] = arrays["positionPools{}".format(wordPosition)]
+            self.syllableCounts[wordPosition] = arrays["syllableCounts{}".format(wordPosition)]
+            self.syllableTotals[wordPosition] = arrays["syllableTotals{}".format(wordPosition)]
+            self.poolWords[wordPosition] = {wordIndex: (arrays["poolWordPools{}{}".format(wordPosition, wordIndex)],
+                                                        arrays["poolWordBits{}{}".format(wordPosition, wordIndex)])
+                                            for wordIndex in self.wordIndexes}
+        self.poolCount, self.syllableCount = self.syllableCounts[0].shape
+
+    def save(self, path):
+        # Write the engine out to a corpus file at path.  Written alongside first and moved in to place once it's
+        #   complete, so a worker opening path never maps a half-written file, and one that has the old file mapped
+        #   keeps it until it opens again.
+        self.debugger.message("INFO", "Writing corpus file to {}", path)
+        header = {"corpusVersion": self.corpusVersion, "schemaVersion": self.schemaVersion,
+                  "created": time.strftime("%Y-%m-%d %H:%M:%S"), "arrays": {}}
+        arrayOffset = 0
+        for name, array in self.arrays.items():
+            if name == "schemaVersion":
+                continue
+            header["arrays"][name] = (array.dtype.str, array.shape, arrayOffset)
+            arrayOffset += -(-array.nbytes // self.arrayAlignment) * self.arrayAlignment
+
+        with self.debugger.timer("corpusSave"), open(path + ".partial", "wb") as corpusFile:
+            headerBytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+            corpusFile.write(self.corpusMagic)
+            corpusFile.write(struct.pack(">I", len(headerBytes)))
+            corpusFile.write(headerBytes)
+            for name, (dtype, shape, arrayOffset) in header["arrays"].items():
+                corpusFile.write(b"\0" * (-corpusFile.tell() % self.arrayAlignment))
+                corpusFile.write(numpy.ascontiguousarray(self.arrays[name]).tobytes())
+        os.replace(path + ".partial", path)
+        self.debugger.message("INFO", "Corpus file written: {} bytes", os.path.getsize(path))
+
+    def open(self, path):
+        # Map the corpus file at path read only, and use the arrays in it where they are
+        with self.debugger.timer("corpusOpen"):
+            try:
+                with open(path, "rb") as corpusFile:
+                    corpusMap = mmap.mmap(corpusFile.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as error:
+                self.debugger.message("ERROR", "Can't map corpus file {}: {}", path, error)
+                sys.exit("Can't open the corpus file.  Exiting.")
+
+            headerStart = len(self.corpusMagic) + 4
+            if (len(corpusMap) < headerStart) or (corpusMap[:len(self.corpusMagic)] != self.corpusMagic):
+                self.debugger.message("ERROR", "{} isn't a rhymadex corpus file", path)
+                sys.exit("Not a corpus file.  Exiting.")
+            headerLength = struct.unpack(">I", corpusMap[len(self.corpusMagic):headerStart])[0]
+            header = json.loads(corpusMap[headerStart:headerStart + headerLength])
+            if header["corpusVersion"] != self.corpusVersion:
+                self.debugger.message("ERROR", "Corpus file format is version {}, expected {}",
+                                      header["corpusVersion"], self.corpusVersion)
+                sys.exit("Won't continue with a mismatching corpus file.  Exiting.")
+            if header["schemaVersion"] != schemaCurrentVersion:
+                self.debugger.message("ERROR", "Corpus file is from schema version {}, expected {}.  Export it again.",
+                                      header["schemaVersion"], schemaCurrentVersion)
+                sys.exit("Won't continue with a mismatching corpus file.  Exiting.")
+
+            # Same alignment as save: each array starts on the next arrayAlignment boundary after the last one
+            arrayStart = headerStart + headerLength
+            arrayStart += -arrayStart % self.arrayAlignment
+            arrays = {"schemaVersion": header["schemaVersion"]}
+            for name, (dtype, shape, arrayOffset) in header["arrays"].items():
+                dtype = numpy.dtype(dtype)
+                arrayCount = int(numpy.prod(shape, dtype=numpy.int64))
+                if arrayStart + arrayOffset + arrayCount * dtype.itemsize > len(corpusMap):
+                    self.debugger.message("ERROR", "Corpus file {} ends part way through", path)
+                    sys.exit("Incomplete corpus file.  Exiting.")
+                arrays[name] = numpy.frombuffer(corpusMap, dtype=dtype, count=arrayCount,
+                                                offset=arrayStart + arrayOffset).reshape(shape)
+
+        # Swap over before letting go of any file this engine had open already
+        self.useArrays(arrays)
+        self.corpusMap = corpusMap
+        self.debugger.message("INFO", "corpusEngine mapped {} lines, {} words, {} rhymePools from {} (created {})",
+                              len(self.lines), len(self.words), self.poolCount, path, header["created"])
+
+    def wordId(self, word):
+        # word's id, or None if no line has it.  words is sorted, so it's a bisect.
+        wordId = bisect.bisect_left(self.words, word)
+        if (wordId < len(self.words)) and (self.words[wordId] == word):
+            return wordId
+        return None
+
+    def poolLines(self, wordPosition, rhymePool):
+        # The lines of rhymePool in wordPosition, as line indexes
+        low, high = numpy.searchsorted(self.positionPools[wordPosition], (rhymePool, rhymePool + 1))
+        return self.positionLines[wordPosition][low:high]
+
+    def poolCandidates(self, wordPosition, syllableWindows, pastRhymePoolIds, totLines, distinctWords):
+        # The same answer as song.poolSelectionQuery, worked out from the arrays for wordPosition:
+        #   (totalLines, rhymePoolId) for every rhymePool with at least totLines lines in the syllableWindows, at
+        #   least totLines in each one of them, and at least totLines distinct words in each of distinctWords,
+        #   in rhymePoolId order.
+        # The distinct word counts here are of just the lines in the syllableWindows, same as the query over
+        #   tblLines used to be, rather than tblPoolStats' counts for the whole rhymePool.
+        syllableTotals = self.syllableTotals[wordPosition]
+
+        # Which syllable counts are in any of the windows, clipped to the ones there are
+        inWindows = numpy.zeros(self.syllableCount, dtype=bool)
+        windowBits = numpy.uint64(0)
+        windowCounts = []
+        for low, high in syllableWindows:
+            low, high = max(int(low), 0), min(int(high), self.syllableCount - 1)
+            if low > high:
+                windowCounts.append(numpy.zeros(self.poolCount, dtype=numpy.int64))
+                continue
+            inWindows[low:high + 1] = True
+            windowCounts.append(syllableTotals[:, high + 1] - syllableTotals[:, low])
+            for syllables in range(low, high + 1):
+                windowBits |= numpy.uint64(1) << numpy.uint64(min(syllables, 63))
+
+        if syllableWindows:
+            totalLines = self.syllableCounts[wordPosition][:, inWindows].sum(axis=1)
+        else:
+            totalLines = syllableTotals[:, -1]
+        eligible = (totalLines > 0) & (totalLines >= totLines)
+        for windowCount in windowCounts:
+            eligible &= windowCount >= totLines
+
+        for wordIndex in distinctWords:
+            poolWordPools, poolWordBits = self.poolWords[wordPosition][wordIndex]
+            if syllableWindows:
+                poolWordPools = poolWordPools[(poolWordBits & windowBits) != 0]
+            eligible &= numpy.bincount(poolWordPools, minlength=self.poolCount) >= totLines
+
+        pastRhymePoolIds = [rhymePool for rhymePool in pastRhymePoolIds if 0 <= rhymePool < self.poolCount]
+        eligible[pastRhymePoolIds] = False
+
+        rhymePools = numpy.flatnonzero(eligible)
+        return list(zip(totalLines[rhymePools].tolist(), rhymePools.tolist()))
+
+    def lineMask(self, lines, rhymePools, syllableWindow, pastWordIds):
+        # Which of lines fit: in each of rhymePools, inside the syllableWindow, and no word in pastWordIds
+        lineMask = numpy.ones(len(lines), dtype=bool)
+        for wordIndex in rhymePools:
+            lineMask &= self.pools[wordIndex][lines] == rhymePools[wordIndex]
+        if syllableWindow:
+            lineSyllables = self.syllables[lines]
+            lineMask &= (lineSyllables >= syllableWindow[0]) & (lineSyllables <= syllableWindow[1])
+        for wordIndex, wordIds in pastWordIds.items():
+            if wordIds:
+                lineMask &= ~numpy.isin(self.wordArrays[wordIndex][lines], wordIds)
+        return lineMask
+
+    def pickLine(self, rhymePools, syllableWindow, pastFirstWords, pastLastWords, randomSource):
+        # A random line out of the ones that fit, picked the way song.pickLine and song.queryLine pick it, so with
+        # the same rhymePools and randomSource (the song's random) in the same state it's the same line:
+        #   With a rhymePool, the lastWord's (or else the firstWord's) lines in (syllables, id) order like
+        #     song.poolLines has them, masked down, and randomSource.choice of what's left.
+        #   With none, a random randomKey from randomSource, then the first line that fits from there on in
+        #     (randomKey, id) order, wrapping around past the end, like song.queryLine's seek along the index.
+        #     It's checked randomChunk lines at a time, since there's usually one that fits close by.
+        pastWordIds = {wordIndex: [wordId for wordId in map(self.wordId, pastWords) if wordId is not None]
+                       for wordIndex, pastWords in (("firstWord", pastFirstWords), ("lastWord", pastLastWords))}
+
+        if rhymePools:
+            if "lastWord" in rhymePools:
+                lines = self.poolLines(1, rhymePools["lastWord"])
+            else:
+                lines = self.poolLines(0, rhymePools["firstWord"])
+            lines = lines[self.lineMask(lines, rhymePools, syllableWindow, pastWordIds)]
+            if not len(lines):
+                return None
+            return self.lineColumns(int(randomSource.choice(lines)))
+
+        startLine = int(numpy.searchsorted(self.randomKeys, randomSource.getrandbits(31)))
+        for randomLines in (self.randomOrder[startLine:], self.randomOrder[:startLine]):
+            for chunkStart in range(0, len(randomLines), self.randomChunk):
+                lines = randomLines[chunkStart:chunkStart + self.randomChunk]
+                fits = numpy.flatnonzero(self.lineMask(lines, rhymePools, syllableWindow, pastWordIds))
+                if len(fits):
+                    return self.lineColumns(int(lines[fits[0]]))
+        return None
+
+    def lineColumns(self, line):
+        # The same columns as a line from the database (song.poolLineColumns), with None again for no rhymePool
+        linePools = [int(self.pools[wordIndex][line]) for wordIndex in self.wordIndexes]
+        return ((int(self.lineIds[line]), self.lines[line], self.words[self.wordArrays["firstWord"][line]],
+                 self.words[self.wordArrays["lastWord"][line]], int(self.syllables[line])) +
+                tuple(None if linePool < 0 else linePool for linePool in linePools))
 
 class song:
-    def __init__(self, songDef, rhymeGroupPoolSize=10):
+    def __init__(self, songDef, rhymeGroupPoolSize=10, dbPool=None, seed=None, lineCache=None, engine=None):
 
         self.debugger = debugger()
         self.debugger.printEnabled = False
-        self.rhymadexDB = rhymadexMariaDB(self.debugger)
+
+        # Given an engine (a corpusEngine shared by every song in the process), rhymePools and lines are all picked
+        # from it in memory, and the song never touches the database.
+        self.engine = engine
+
+        # Given a dbPool (a rhymadexPool shared by every song in the process), each query borrows a pooled
+        # connection for just as long as it runs.  Otherwise the song opens a connection of its own.
+        self.dbPool = dbPool
+        self.rhymadexDB = None if (dbPool or engine) else connectRhymadexDB(self.debugger, readOnly=True)
+
+        # Stage timings (and, through the connections, query metrics) go to the pool's debugger when there is one,
+        # so they add up across every song in the process
+        self.metrics = dbPool.debugger if dbPool else self.debugger
+
+        # Where the lines of each rhymePool picked for a rhymeGroup are kept, sharedPoolLineCache unless told otherwise,
+        # filed under the database they came from
+        self.lineCache = sharedPoolLineCache if lineCache is None else lineCache
+        self.databaseIdentity = dbPool.databaseIdentity if dbPool else databaseIdentity()
 
         # Quality of selection settings
 
@@ -32,6 +491,11 @@ class song:
         # Grab and store this many candidate pools for each RhymeGroup at once
         self.rhymeGroupPoolSize = rhymeGroupPoolSize
 
+        # Every random choice (candidate pools, and where to look for each line) comes from here.  The same seed
+        # against the same rhymadex makes the same songs.
+        self.seed = seed
+        self.random = random.Random(seed)
+
         # Song attributes
         # The songDef is a list containing the definition settings for each line of the song
         self.songDef = songDef
@@ -56,6 +520,18 @@ class song:
                                  }
                             }
 
+        # The tblLines column holding the rhymePool ID of each word position
+        self.poolColumns = {"firstWord": "firstPool", "lastWord": "lastPool"}
+
+        # The columns of each line in a poolLineCache, and where each word position's rhymePool ID is among them
+        self.poolLineColumns = ("id", "line", "firstWord", "lastWord", "syllables", "firstPool", "lastPool")
+        self.poolLineIndices = {"firstWord": 5, "lastWord": 6}
+
+        # tblPoolStats' wordPosition for a rhymeGroup used as a firstWord, a lastWord or both, and its distinct word
+        # count column for each word position (see rhymadexDatabase.refreshPoolStats)
+        self.poolStatsPositions = {"firstWord": 0, "lastWord": 1, "dualPosition": 2}
+        self.distinctColumns = {"firstWord": "distinctFirstWords", "lastWord": "distinctLastWords"}
+
         # ** BACKREFERENCES OVERRIDE EVERYTHING **
         #  If a songdef line has a firstword/fullline/and-or-lastword backreference, exclude that firstword/fullline/etc
         #    portion from the top level song rhymeGroup definition.
@@ -73,6 +549,30 @@ class song:
 
         self.rhymeGroups = self.generateRhymeGroups(self.songDef)
 
+    def fetch(self, query, queryParams, stage):
+        # Run a query and return all of its rows.
+        # Every value in the explorer's queries is a bound ? parameter, so the query text only depends on the shape
+        # of the songDef, not on the pools/syllables/words picked.  Each shape is prepared once per connection and
+        # then reused.
+        # The time it takes, waiting for a pooled connection included, goes to the named stage.
+        with self.metrics.timer(stage):
+            if self.dbPool:
+                return self.dbPool.fetchAll(query, tuple(queryParams), prepared=True)
+            return self.rhymadexDB.query(query, tuple(queryParams), prepared=True).fetchall()
+
+    @staticmethod
+    def inList(values, queryParams):
+        # Placeholders for an IN ( ) list of values, with the values added to queryParams.
+        # The list is padded out to the next power of two by repeating the last value, so however many values
+        # there are, only a handful of different query shapes ever come out of it.
+        values = list(values)
+        paddedLength = 1
+        while paddedLength < len(values):
+            paddedLength *= 2
+        values += values[-1:] * (paddedLength - len(values))
+        queryParams.extend(values)
+        return ", ".join(["?"] * len(values))
+
     def generateRhymeGroups(self, songDef):
 
         # Need to pre-process the songDef to get some top level facts about each requested rhymeGroup
@@ -155,70 +655,30 @@ class song:
                                         [wordIndex + lineOption]\
                                             [lineDef[self.wordIndices[wordIndex]["options"][lineOption]]] = True
 
-        self.debugger.message("INFO", ".. Processed rhymeGroups: {}".format(rhymeGroups))
+        self.debugger.message("INFO", ".. Processed rhymeGroups: {}", rhymeGroups)
 
-        # Build and execute a rhymePoolId selection query
-        # The strategy is to INNER JOIN the tblRhymeWords table against the tblLines table
-        # so that it's possible to sum up actual available candidate line counts grouped by
-        # the rhymeWord's rhymePoolId.  Then, filter by the rest of the line and word options,
-        # select only rhymePools with enough of diversity to choose from, pick a unique pool ID
-        # for each rhymeGroup randomly.
-
-        # FIXME This is super slow.  The "Dual Position" situation in which a rhymeGroup is used both
-        # as a firstWord and a lastWord (possibly even in the same line) results in a double INNER JOIN 🌈 🌈
-        # so that it's possible to resolve the tblRhymePools ID for each firstWord and lastWord.
-        # Maybe a better strategy is just to store the appropriate tblRhymePools ID as a foreign key in
-        # the tblLines table itself.  Then there are no JOINS needed at all.
-        # BUT THIS appears to be working and I'm plowing forwards towards a working first version
+        # Pick candidate rhymePools for each rhymeGroup: only rhymePools with enough lines, with enough of
+        # diversity to choose from, and unique pool IDs for each rhymeGroup, picked randomly.
 
         for rhymeGroup in rhymeGroups:
-            # For each rhymegroup, start a new query to pick a rhymePool
-            rhymeGroupQuery = "SELECT COUNT(`tblLines`.`id`) as totalLines "
-
-            self.debugger.message("QRYBLD", "Building query for rhymeGroup: {}".format(rhymeGroup))
-
-            for wordIndex in self.wordIndices:
-                # SELECT COLUMNS FROM tblRhymeWords
-                # Loop through positions firstWord, lastWord..
-                if wordIndex in rhymeGroups[rhymeGroup]:
-                    # If it's been used in this position, SELECT that position within the query
-                    self.debugger.message("QRYBLD", ".. Adding SELECT for {} seen {} times".format(wordIndex,
-                                                                               rhymeGroups[rhymeGroup][wordIndex]))
-                    rhymeGroupQuery += ", `{}Words`.`rhymePool` as {}RhymeGroup ".format(wordIndex, wordIndex)
-
-            for wordIndex in self.wordIndices:
-                # SELECT DISTINCT counts of firstWords and/or lastWords
-                if wordIndex in rhymeGroups[rhymeGroup]:
-                    # If it's been used in this position, SELECT a DISTINCT COUNT within the query
-                    self.debugger.message("QRYBLD", ".. Adding DISTINCT COUNT for {}".format(wordIndex))
-                    rhymeGroupQuery += ", COUNT(DISTINCT(`tblLines`.`{}`)) as distinct{} ".format(wordIndex, wordIndex)
-
-            # Need a SUM CASE in the SELECT if:
-            #   There is a fullLine syllable count list specficied
-            #     This is because we gotta check that a diverse set of options exist in each selected rhymePool
-            #     and can do so at once across an arbitrary set of implied syllable counts, all at once, using
-            #     SUM CASE and then filtering with HAVING
+            # For each rhymegroup, work out what it needs from a rhymePool, then find the rhymePools that have it
+            self.debugger.message("QRYBLD", "Building query for rhymeGroup: {}", rhymeGroup)
 
-            # Add full line syllable count SELECTions to the query
+            # Which of tblPoolStats' word positions to pick from.  Used both as a firstWord and a lastWord, both
+            # positions have to come from the same rhymePool, and the firstWord and lastWord can't be the same.
+            if ("dualPosition" in rhymeGroups[rhymeGroup]):
+                wordPosition = self.poolStatsPositions["dualPosition"]
+            elif ("firstWord" in rhymeGroups[rhymeGroup]):
+                wordPosition = self.poolStatsPositions["firstWord"]
+            else:
+                wordPosition = self.poolStatsPositions["lastWord"]
+            self.debugger.message("QRYBLD", ".. Picking from wordPosition {}", wordPosition)
+
+            # Full line syllable count windows, (low, high) for each syllable count the rhymeGroup is used with
+            syllableWindows = []
             if ("fullLineSyllables" in rhymeGroups[rhymeGroup]):
                 for syllable in rhymeGroups[rhymeGroup]["fullLineSyllables"]:
-                    rhymeGroupQuery += ", sum(CASE WHEN ( "
-                    rhymeGroupQuery += "(`tblLines`.`syllables` >= {}) AND ".format(int(syllable)-self.syllablePadding)
-                    rhymeGroupQuery += "(`tblLines`.`syllables` <= {}) ) ".format(int(syllable)+self.syllablePadding)
-                    rhymeGroupQuery += "THEN 1 ELSE 0 END ) as syllables{} ".format(syllable)
-
-            # Always selecting from tblLines because need to filter by how many actual lines we have later on
-            rhymeGroupQuery += "FROM `tblLines` "
-
-            for wordIndex in self.wordIndices:
-                # INNER JOINING tblRhymeWords
-                # Loop through positions firstWord, lastWord..
-                if wordIndex in rhymeGroups[rhymeGroup]:
-                    # If it's been used in this position, INNER JOIN that position within the query
-                    self.debugger.message("QRYBLD", ".. Adding INNER JOIN for {} seen {} times".format(wordIndex,
-                                                                               rhymeGroups[rhymeGroup][wordIndex]))
-                    rhymeGroupQuery += "INNER JOIN `tblRhymeWords` {}Words ON `tblLines`.`{}` = `{}Words`.`word` ".\
-                        format(wordIndex, wordIndex, wordIndex)
+                    syllableWindows.append((int(syllable) - self.syllablePadding, int(syllable) + self.syllablePadding))
 
             pastRhymePoolIds = {}
 
@@ -230,114 +690,7 @@ class song:
                         pastRhymePoolIds[rhymePoolResult] = True
 
             if pastRhymePoolIds:
-                self.debugger.message("QRYBLD", ".. pastRhymePoolIds: {}".format(pastRhymePoolIds))
-
-            # Need a WHERE clause if:
-            #   There is a fullLine syllable count specficied,
-            #   TODO There is a firstWord and/or lastWord restriction specified,
-            #   TODO There is a firstWord and/or lastWord syllable count specified,
-            #   The rhymeGroup is used in both the firstWord and lastWord position, in which case firstWord != lastWord,
-            #   THere are past Rhyme Pool Ids we should exclude
-
-            if (
-                ("fullLineSyllables" in rhymeGroups[rhymeGroup]) or
-                ("firstWordIncludeOnly" in rhymeGroups[rhymeGroup]) or
-                ("lastWordIncludeOnly" in rhymeGroups[rhymeGroup]) or
-                ("dualPosition" in rhymeGroups[rhymeGroup]) or
-                (pastRhymePoolIds)
-                ):
-                rhymeGroupQuery += "WHERE ( "
-
-                firstWhereClause = True # track for the "AND"s ..
-
-                # Add full line syllable count restrictions to the query
-                if ("fullLineSyllables" in rhymeGroups[rhymeGroup]):
-                    rhymeGroupQuery += "( " # Open group for syllable count restrictions ((low) AND (high)) OR ((low)..
-                    first = True # track for the "OR"s ..
-                    for syllable in rhymeGroups[rhymeGroup]["fullLineSyllables"]:
-                        if not first:
-                            rhymeGroupQuery += "OR "
-                        else:
-                            first = False
-
-                        rhymeGroupQuery += "( (`tblLines`.`syllables` >= {}) AND (`tblLines`.`syllables` <= {}) ) ".\
-                                            format(int(syllable) - self.syllablePadding,
-                                                   int(syllable) + self.syllablePadding)
-
-                    firstWhereClause = False # We need an AND for the next WHERE clause, if there is one..
-                    rhymeGroupQuery += ") "
-
-                if ("dualPosition" in rhymeGroups[rhymeGroup]):
-                    # The rhymeGroup appears in both firstWord and lastWord positions, possibly even
-                    # in the same line.  So set a query WHERE condition that the firstWord and lastWord cannot
-                    # be the same
-                    if not firstWhereClause:
-                        rhymeGroupQuery += "AND "
-                    else:
-                        firstWhereClause = False
-                    rhymeGroupQuery += "(`tblLines`.`firstWord` != `tblLines`.`lastWord`) "
-
-                if (pastRhymePoolIds):
-                    # Need to exclude past chosen rhymePoolIds or else it's possible to select
-                    #   the same pool for multiple rhymeGroups.
-                    if not firstWhereClause:
-                        rhymeGroupQuery += "AND "
-                    else:
-                        firstWhereClause = False
-
-                    for wordIndex in self.wordIndices:
-                        # Need to put a NOT IN () clause in the WHERE section to exclude prior selected
-                        # rhymePool IDs.  Also need to do this specifically in the firstWord or lastWord or both
-                        # positions depending on how the rhymepool is implicated.
-                        # Loop through positions firstWord, lastWord..
-                        if wordIndex in rhymeGroups[rhymeGroup]:
-                            # If it's been used in this position, SELECT that position within the query
-                            self.debugger.message("QRYBLD", ".. Adding NOT IN on {} id {}".format(wordIndex,
-                                                                                                 pastRhymePoolIds))
-                            if (("dualPosition" in rhymeGroups[rhymeGroup]) and (wordIndex == "lastWord")):
-                                # If it's been used in BOTH positions, insert AND between the two WHERE clauses
-                                rhymeGroupQuery += "AND "
-                            rhymeGroupQuery += "( {}Words.rhymePool NOT IN (".format(wordIndex)
-                            first = True
-                            for poolId in pastRhymePoolIds:
-                                if not first:
-                                    rhymeGroupQuery += ", "
-                                else:
-                                    first = False
-                                rhymeGroupQuery += "{} ".format(poolId)
-                            rhymeGroupQuery += ") " # END OF NOT IN Number Group
-                            rhymeGroupQuery += ") " # END OF NOT IN Clause
-
-                # TODO if ("firstWordIncludeOnly" in rhymeGroups[rhymeGroup]):
-                # Implement later
-
-                # TODO if ("lastWordIncludeOnly" in rhymeGroups[rhymeGroup]):
-                # Implement later
-
-                # TODO if ("firstWordSyllables" in rhymeGroups[rhymeGroup]):
-                # Implement later
-
-                # TODO if ("lastWordSyllables" in rhymeGroups[rhymeGroup]):
-                # Implement later
-
-                rhymeGroupQuery += ") " # end of query WHERE
-
-            # GROUP BY
-            # Needs to be one or both of firstWord/lastWord
-            rhymeGroupQuery += "GROUP BY "
-            first = True # To track comma usage
-            for wordIndex in self.wordIndices:
-                if wordIndex in rhymeGroups[rhymeGroup]:
-                    if not first:
-                        rhymeGroupQuery += ", "
-                    else:
-                        first = False
-                    rhymeGroupQuery += "`{}RhymeGroup` ".format(wordIndex)
-
-            # HAVING
-            # At minimum, will be HAVING a minimum number of available lines that is candidatePoolMultiplier times the
-            # number of times the rhymegroup is referenced in the songDef
-            rhymeGroupQuery += "HAVING ( "
+                self.debugger.message("QRYBLD", ".. pastRhymePoolIds: {}", pastRhymePoolIds)
 
             # Find the larger of either firstWord or lastWord occurance count,
             # and multiply by candidatePoolMultiplier.  this is how many candidates that the pool we
@@ -350,66 +703,53 @@ class song:
                 if (wordIndex in rhymeGroups[rhymeGroup]):
                     if (rhymeGroups[rhymeGroup][wordIndex] > totLines):
                         totLines = rhymeGroups[rhymeGroup][wordIndex]
-                        self.debugger.message("QRYBLD", ".. Position {} seen {} times, totLines: {}".
-                                              format(wordIndex, rhymeGroups[rhymeGroup][wordIndex], totLines))
+                        self.debugger.message("QRYBLD", ".. Position {} seen {} times, totLines: {}",
+                                              wordIndex, rhymeGroups[rhymeGroup][wordIndex], totLines)
             totLines = int(totLines * self.candidatePoolMultiplier)
             if ("dualPosition" in rhymeGroups[rhymeGroup]):
                 totLines = totLines * 2
 
-            rhymeGroupQuery += "(totalLines >= {} ) ".format(totLines)
-
-            # Filter minimum distinct firstWord/and-or-lastWords
-            for wordIndex in self.wordIndices:
-                # HAVING DISTINCT counts of firstWords and/or lastWords
-                if wordIndex in rhymeGroups[rhymeGroup]:
-                    # If it's been used in this position, HAVING a DISTINCT COUNT within the query
-                    self.debugger.message("QRYBLD", ".. Adding HAVING DISTINCT for {}".format(wordIndex))
-                    rhymeGroupQuery += "AND (distinct{} >= {}) ".format(wordIndex, totLines)
-
-            # Filter minimum syllable count lines available
-                # Add full line syllable count SELECTions to the query
-                if ("fullLineSyllables" in rhymeGroups[rhymeGroup]):
-                    for syllable in rhymeGroups[rhymeGroup]["fullLineSyllables"]:
-                        rhymeGroupQuery += "AND (syllables{} >= {}) ".format(syllable, totLines)
-
-            if ("dualPosition" in rhymeGroups[rhymeGroup]):
-                rhymeGroupQuery += "AND (firstWordRhymeGroup = lastWordRhymeGroup) "
-
-            rhymeGroupQuery += ") " # End of HAVING
-
-            rhymeGroupQuery += "ORDER BY RAND() LIMIT {};".format(self.rhymeGroupPoolSize)
+            # The word positions that need enough distinct words
+            distinctWords = [wordIndex for wordIndex in self.wordIndices if wordIndex in rhymeGroups[rhymeGroup]]
 
-            self.debugger.message("QRYBLD", ".. QUERY: {}".format(rhymeGroupQuery))
+            # (totalLines, rhymePoolId) for every rhymePool that'll do, in rhymePoolId order.  From the corpusEngine
+            # if the song has one, otherwise the database.
+            if self.engine:
+                with self.metrics.timer("poolSelection"):
+                    rhymePoolIds = self.engine.poolCandidates(wordPosition, syllableWindows, pastRhymePoolIds,
+                                                              totLines, distinctWords)
+            else:
+                rhymePoolIds = self.poolSelectionQuery(wordPosition, syllableWindows, pastRhymePoolIds, totLines,
+                                                       distinctWords)
 
-            # Query's ready for rhymePool selection for each rhymeGroup
-            # First result, second column of the SELECT will be the assigned rhymePoolId
-            rhymePoolIds = self.rhymadexDB.query(rhymeGroupQuery).fetchall()
+            # Pick up to rhymeGroupPoolSize of them at random
+            rhymePoolIds = self.random.sample(rhymePoolIds, min(int(self.rhymeGroupPoolSize), len(rhymePoolIds)))
 
-            self.debugger.message("INFO", "Query returned candidate rhymePoolIds: {}".format(rhymePoolIds))
+            self.debugger.message("INFO", "Query returned candidate rhymePoolIds: {}", rhymePoolIds)
             rhymeGroups[rhymeGroup]["rhymePoolCandidates"] = []
             for rhymeGroupCandidate in rhymePoolIds:
-                rhymeGroups[rhymeGroup]["rhymePoolCandidates"].append(rhymeGroupCandidate[0])
+                rhymeGroups[rhymeGroup]["rhymePoolCandidates"].append(rhymeGroupCandidate[1])
 
         # Debugger summary of rhymeGroup / rhymePoolId processing
         self.debugger.message("INFO", "rhymeGroup processing complete.")
         for rhymeGroup in rhymeGroups:
-            self.debugger.message("INFO", "rhymeGroups[\"{}\"]:".format(rhymeGroup))
+            self.debugger.message("INFO", "rhymeGroups[\"{}\"]:", rhymeGroup)
             if "rhymePool" in rhymeGroups[rhymeGroup]:
-                self.debugger.message("INFO", "..[\"rhymePool\"]: {}".format(rhymeGroups[rhymeGroup]["rhymePool"]))
+                self.debugger.message("INFO", "..[\"rhymePool\"]: {}", rhymeGroups[rhymeGroup]["rhymePool"])
             if "rhymePoolCandidates" in rhymeGroups[rhymeGroup]:
-                self.debugger.message("INFO", "..[\"rhymePoolCandidates\"]: {}".format(
-                                                                   rhymeGroups[rhymeGroup]["rhymePoolCandidates"]))
+                self.debugger.message("INFO", "..[\"rhymePoolCandidates\"]: {}",
+                                                                   rhymeGroups[rhymeGroup]["rhymePoolCandidates"])
             if "fullLineSyllables" in rhymeGroups[rhymeGroup]:
-                self.debugger.message("INFO", "..[\"fullLineSyllables\"]: {}".format(
-                                                                     rhymeGroups[rhymeGroup]["fullLineSyllables"]))
+                self.debugger.message("INFO", "..[\"fullLineSyllables\"]: {}",
+                                                                     rhymeGroups[rhymeGroup]["fullLineSyllables"])
             for wordIndex in self.wordIndices:
                 if wordIndex in rhymeGroups[rhymeGroup]:
-                    self.debugger.message("INFO", "..[\"{}\"]: {} (line occurances)".format(wordIndex,
-                                                                               rhymeGroups[rhymeGroup][wordIndex]))
+                    self.debugger.message("INFO", "..[\"{}\"]: {} (line occurances)", wordIndex,
+                                                                               rhymeGroups[rhymeGroup][wordIndex])
                 for lineOption in self.wordIndices[wordIndex]["options"]:
                     if wordIndex + lineOption in rhymeGroups[rhymeGroup]:
-                        self.debugger.message("INFO", "..[\"{}\"]: {}".format(wordIndex + lineOption,
-                                                                  rhymeGroups[rhymeGroup][wordIndex + lineOption]))
+                        self.debugger.message("INFO", "..[\"{}\"]: {}", wordIndex + lineOption,
+                                                                  rhymeGroups[rhymeGroup][wordIndex + lineOption])
 
         # rhymeGroups contains ["rhymePoolCandidates"] for each rhymeGroup e.g. ["A"]
         #   which is the only important element needed per rhymeGroup.
@@ -418,15 +758,140 @@ class song:
         #   But doesn't hurt for now, so moving on.
         return rhymeGroups
 
+    def poolSelectionQuery(self, wordPosition, syllableWindows, pastRhymePoolIds, totLines, distinctWords):
+        # Build and execute a rhymePoolId selection query
+        # The strategy is to sum up actual available candidate line counts for each rhymePool.  Then, filter by
+        # the rest of the line and word options, and select only rhymePools with enough of diversity to choose from.
+
+        # This used to GROUP BY the firstPool/lastPool of every line in tblLines (and before that, INNER JOIN
+        # tblRhymeWords on to tblLines by word, twice for the "Dual Position" situation in which a rhymeGroup is
+        # used both as a firstWord and a lastWord 🌈 🌈), counting up the whole corpus for every rhymeGroup of every
+        # song.  Now the builder keeps those counts in tblPoolStats: for each word position and rhymePool, one small
+        # row per syllable count.  So it's an index range scan over the tblPoolStats rows for one word position,
+        # adding up the rows for the syllable counts that fit, and HAVING on the sums.
+        # The distinct firstWord/lastWord counts are for all of a rhymePool's lines, not just the ones with the
+        # syllable counts that fit.  So a rhymePool can get through with a little less diversity than asked for.
+        rhymeGroupQuery = "SELECT SUM(`tblPoolStats`.`lineCount`) as totalLines, `tblPoolStats`.`rhymePool` "
+        rhymeGroupParams = [] # Values for the query's ? placeholders, in order
+
+        for wordIndex in distinctWords:
+            # SELECT DISTINCT counts of firstWords and/or lastWords, for the positions it's been used in.  It's the
+            # same on every row of the rhymePool.
+            self.debugger.message("QRYBLD", ".. Adding DISTINCT COUNT for {}", wordIndex)
+            rhymeGroupQuery += ", MAX(`tblPoolStats`.`{}`) as distinct{} ".format(self.distinctColumns[wordIndex],
+                                                                                   wordIndex)
+
+        # Need a SUM CASE in the SELECT if:
+        #   There is a fullLine syllable count list specficied
+        #     This is because we gotta check that a diverse set of options exist in each selected rhymePool
+        #     and can do so at once across an arbitrary set of implied syllable counts, all at once, using
+        #     SUM CASE and then filtering with HAVING
+
+        # Add full line syllable count SELECTions to the query
+        # Named by position (syllables0, syllables1 ..) rather than by count so the query text doesn't change
+        # with the counts
+        for syllableIndex, syllableWindow in enumerate(syllableWindows):
+            rhymeGroupQuery += ", sum(CASE WHEN ( "
+            rhymeGroupQuery += "(`tblPoolStats`.`syllables` >= ?) AND "
+            rhymeGroupQuery += "(`tblPoolStats`.`syllables` <= ?) ) "
+            rhymeGroupQuery += "THEN `tblPoolStats`.`lineCount` ELSE 0 END ) as syllables{} ".format(syllableIndex)
+            rhymeGroupParams += list(syllableWindow)
+
+        rhymeGroupQuery += "FROM `tblPoolStats` "
+
+        # Always a WHERE for the word position
+        rhymeGroupQuery += "WHERE ( (`tblPoolStats`.`wordPosition` = ?) "
+        rhymeGroupParams.append(wordPosition)
+
+        # More WHERE if:
+        #   There is a fullLine syllable count specficied,
+        #   TODO There is a firstWord and/or lastWord restriction specified,
+        #   TODO There is a firstWord and/or lastWord syllable count specified,
+        #   THere are past Rhyme Pool Ids we should exclude
+
+        # Add full line syllable count restrictions to the query
+        if (syllableWindows):
+            rhymeGroupQuery += "AND ( " # Open group for syllable count restrictions ((low) AND (high)) OR ((low)..
+            first = True # track for the "OR"s ..
+            for syllableWindow in syllableWindows:
+                if not first:
+                    rhymeGroupQuery += "OR "
+                else:
+                    first = False
+
+                rhymeGroupQuery += "( (`tblPoolStats`.`syllables` >= ?) AND (`tblPoolStats`.`syllables` <= ?) ) "
+                rhymeGroupParams += list(syllableWindow)
+
+            rhymeGroupQuery += ") "
+
+        if (pastRhymePoolIds):
+            # Need to exclude past chosen rhymePoolIds or else it's possible to select
+            #   the same pool for multiple rhymeGroups.
+            self.debugger.message("QRYBLD", ".. Adding NOT IN on rhymePool id {}", pastRhymePoolIds)
+            rhymeGroupQuery += "AND ( `tblPoolStats`.`rhymePool` NOT IN ("
+            rhymeGroupQuery += self.inList(pastRhymePoolIds, rhymeGroupParams)
+            rhymeGroupQuery += ") " # END OF NOT IN Number Group
+            rhymeGroupQuery += ") " # END OF NOT IN Clause
+
+        # TODO if ("firstWordIncludeOnly" in rhymeGroups[rhymeGroup]):
+        # Implement later
+
+        # TODO if ("lastWordIncludeOnly" in rhymeGroups[rhymeGroup]):
+        # Implement later
+
+        # TODO if ("firstWordSyllables" in rhymeGroups[rhymeGroup]):
+        # Implement later
+
+        # TODO if ("lastWordSyllables" in rhymeGroups[rhymeGroup]):
+        # Implement later
+
+        rhymeGroupQuery += ") " # end of query WHERE
+
+        # GROUP BY
+        # The primary key's (wordPosition, rhymePool, syllables) order, so no sorting needed to group
+        rhymeGroupQuery += "GROUP BY `tblPoolStats`.`rhymePool` "
+
+        # HAVING
+        # At minimum, will be HAVING a minimum number of available lines that is candidatePoolMultiplier times the
+        # number of times the rhymegroup is referenced in the songDef: totLines
+        rhymeGroupQuery += "HAVING ( "
+        rhymeGroupQuery += "(totalLines >= ? ) "
+        rhymeGroupParams.append(totLines)
+
+        # Filter minimum distinct firstWord/and-or-lastWords
+        for wordIndex in distinctWords:
+            self.debugger.message("QRYBLD", ".. Adding HAVING DISTINCT for {}", wordIndex)
+            rhymeGroupQuery += "AND (distinct{} >= ?) ".format(wordIndex)
+            rhymeGroupParams.append(totLines)
+
+        # Filter minimum syllable count lines available
+        for syllableIndex in range(len(syllableWindows)):
+            rhymeGroupQuery += "AND (syllables{} >= ?) ".format(syllableIndex)
+            rhymeGroupParams.append(totLines)
+
+        rhymeGroupQuery += ") " # End of HAVING
+
+        # No ORDER BY RAND() LIMIT here.  There's one row per rhymePool that qualifies, so they all come back and
+        # the candidates are sampled from them, in rhymePool order so a seed always picks the same ones.
+        rhymeGroupQuery += ";"
+
+        self.debugger.message("QRYBLD", ".. QUERY: {}", rhymeGroupQuery)
+        self.debugger.message("QRYBLD", ".. PARAMETERS: {}", rhymeGroupParams)
+
+        # Second column of the SELECT is the rhymePoolId
+        return sorted(self.fetch(rhymeGroupQuery, rhymeGroupParams, "poolSelection"),
+                      key=lambda rhymeGroupCandidate: rhymeGroupCandidate[1])
+
     def generateSong(self, songDef, rhymeGroups):
-        # Build and execute a tblLine selection queries using the songDef, and build a song
+        # Pick lines using the songDef, and build a song
         # Iterate through the songDef.
         # Got a dict of self.rhymeGroups indexed by whatever's in the songDef rhymeGroup index.
-        #   So I know the rhymePoolId for this query's WHERE clause
+        #   So I know the rhymePoolId to pick each line from
         #   and that rhymePoolId should be fruitful for our use case per the selection process above
-        # Add appropriate filter options as they exist in the songDef
-        # NOT IN previously selected firstWords/lastWords ..
-        # Run the query
+        # Each rhymePool's lines are fetched once, in to the lineCache, and picked from there: one query per
+        #   rhymeGroup for a song, not one per line, and none at all for more songs from the same rhymePools.
+        # Filter by the options as they exist in the songDef
+        # NOT previously selected firstWords/lastWords ..
         # Build the song line-by-line.  If the rhymegroup sequence leads to a dead-end anywhere along the way,
         #   return FALSE
         # Or else, return a list containing the completed song.
@@ -446,141 +911,37 @@ class song:
         #   just return False now.
         for rhymeGroup in rhymeGroups:
             if not "rhymePool" in rhymeGroups[rhymeGroup]:
-                self.debugger.message("INFO", "rhymeGroup {} does not contain a [\"rhymePool\"].  Returning False.")
+                self.debugger.message("INFO", "rhymeGroup {} does not contain a [\"rhymePool\"].  Returning False.",
+                                      rhymeGroup)
                 return False
 
         for lineDef in songDef:
 
             if not lineDef[self.backRefIndices["fullLine"]]:
 
-                self.debugger.message("QRYBLD", "Building lineDef: {}".format(lineDef))
-
-                songQuery = "SELECT `tblLines`.`id`, `tblLines`.`line`, `tblLines`.`firstWord`, `tblLines`.`lastWord` "
-
-                # If we got a rhymeGroup in firstWord and/or lastWord, select the INNER JOINed rhymePool columns
-                for wordIndex in self.wordIndices:
-                    if lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]:
-                        self.debugger.message("QRYBLD", ".. Adding SELECT for {} rhymeGroup of {}".format(wordIndex,
-                                                                    lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]))
-                        songQuery += ", `{}Words`.`rhymePool` ".format(wordIndex)
-
-                songQuery += "FROM `tblLines` "
-
-                # If we got a rhymeGroup in firstWord and/or lastWord, INNER JOIN the rhymeWords table/s
-                for wordIndex in self.wordIndices:
-                    if lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]:
-                        self.debugger.message("QRYBLD", ".. Adding INNER JOIN for {} rhymeGroup of {}".format(wordIndex,
-                                                                    lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]))
-                        songQuery += "INNER JOIN "
-                        songQuery += "`tblRhymeWords` {}Words ON ".format(wordIndex)
-                        songQuery += "`tblLines`.`{}` = `{}Words`.`word` ".format(wordIndex, wordIndex)
-
-                self.debugger.message("INFO", "pastFirstWords: {}".format(pastFirstWords))
-                self.debugger.message("INFO", "pastLastWords: {}".format(pastLastWords))
-
-                # Need a WHERE clause if:
-                #   There is a fullLine syllable count specficied,
-                #   There is a firstWord and/or lastWord rhyme Group specified
-                #   TODO There is a firstWord and/or lastWord restriction specified,
-                #   TODO There is a firstWord and/or lastWord syllable count specified,
-                #   TODO A rhymeGroup is used in both the firstWord and lastWord position, when firstWord != lastWord,
-                #   There are past firstWord/lastWords we should exclude
-
-                if (
-                    (lineDef[self.fullLineIndices["Syllables"]]) or
-                    (lineDef[self.wordIndices["firstWord"]["rhymeGroup"]]) or
-                    (lineDef[self.wordIndices["lastWord"]["rhymeGroup"]]) or
-                    (lineDef[self.wordIndices["firstWord"]["rhymeGroup"]]) or
-                    (pastFirstWords) or
-                    (pastLastWords)
-                    ):
-                    songQuery += "WHERE ( "
-
-                    firstWhereClause = True # track for the "AND"s ...
-
-                    # Add WHERE clause for full line syllable count, if it's defined:
-                    if (lineDef[self.fullLineIndices["Syllables"]]):
-                        self.debugger.message("QRYBLD", ".. Adding WHERE full line syllable count {} +- {}".format(
-                                                       lineDef[self.fullLineIndices["Syllables"]],self.syllablePadding))
-                        songQuery += "( (`tblLines`.`syllables` >= {}) AND (`tblLines`.`syllables` <= {}) ) ".\
-                                          format(int(lineDef[self.fullLineIndices["Syllables"]]) - self.syllablePadding,
-                                                 int(lineDef[self.fullLineIndices["Syllables"]]) + self.syllablePadding)
-                        firstWhereClause = False # Need an AND for the next WHERE clause, if there is one..
-
-                    # Add WHERE clause/s for firstWord and/or lastWord rhymeGroup/rhymePoolId, if it's defined:
-                    for wordIndex in self.wordIndices:
-                        if (lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]):
-                            # Loop through firstWord, lastWord..
-                            if not firstWhereClause:
-                                songQuery += "AND "
-                            else:
-                                firstWhereClause = False
-
-                            self.debugger.message("QRYBLD", ".. wordIndex: {} rhymeGroup defined".format(wordIndex))
-                            self.debugger.message("QRYBLD", ".. lineDef[{}]: {}".format(
-                                                                              self.wordIndices[wordIndex]["rhymeGroup"],
-                                                                    lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]))
-                            self.debugger.message("QRYBLD", ".. rhymeGroups[lineDef[{}]][\"rhymePool\"]: {}".
-                                                                       format(self.wordIndices[wordIndex]["rhymeGroup"],
-                                     rhymeGroups[lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]]["rhymePool"]))
-                            self.debugger.message("QRYBLD", ".. Adding WHERE for {} rhymePool {}".format(wordIndex,
-                                     rhymeGroups[lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]]["rhymePool"]))
-                            songQuery += "({}Words.rhymePool = {}) ".format(wordIndex,
-                                      rhymeGroups[lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]]["rhymePool"])
-
-                    # Build exclude WHERE clauses for past rhymewords, so we don't continue getting the same word again
-                    #   and again (cause it technically rhymes with itself..)
-                    # Past seen firstWord rhymeWords to exclude ...
-                    if (pastFirstWords):
-                        if not firstWhereClause:
-                            songQuery += "AND "
-                        else:
-                            firstWhereClause = False
-
-                        songQuery += "(`tblLines`.`firstWord` NOT IN ( "
-                        first = True
-                        for firstWord in pastFirstWords:
-                            if not first:
-                                songQuery += ", "
-                            else:
-                                first = False
-                            songQuery += "'{}' ".format(firstWord)
-                        songQuery += ") "  # END of NOT IN group
-                        songQuery += ") "  # END of WHERE Clause
-                    # Past seen lastWord rhymeWords to exclude ...
-                    if (pastLastWords):
-                        if not firstWhereClause:
-                            songQuery += "AND "
-                        else:
-                            firstWhereClause = False
-
-                        songQuery += "(`tblLines`.`lastWord` NOT IN ( "
-                        first = True
-                        for lastWord in pastLastWords:
-                            if not first:
-                                songQuery += ", "
-                            else:
-                                first = False
-                            songQuery += "'{}' ".format(lastWord)
-                        songQuery += ") "  # END of NOT IN group
-                        songQuery += ") "  # END of WHERE Clause
-
-                    songQuery += ") " # END OF WHERE
-
-                # Final query options
-                # Random ORDERing and LIMIT
-                songQuery += "ORDER BY RAND() LIMIT 1;"
-
-                self.debugger.message("QRYBLD", ".. QUERY: {}".format(songQuery))
+                self.debugger.message("QRYBLD", "Building lineDef: {}", lineDef)
+                self.debugger.message("INFO", "pastFirstWords: {}", pastFirstWords)
+                self.debugger.message("INFO", "pastLastWords: {}", pastLastWords)
+
+                if self.engine:
+                    # Picked from the corpusEngine, no database at all
+                    with self.metrics.timer("lineSelection"):
+                        songLine = self.engine.pickLine(self.lineRhymePools(lineDef, rhymeGroups),
+                                                        self.syllableWindow(lineDef), pastFirstWords, pastLastWords,
+                                                        self.random)
+                elif (lineDef[self.wordIndices["firstWord"]["rhymeGroup"]] or
+                        lineDef[self.wordIndices["lastWord"]["rhymeGroup"]]):
+                    # Picked from the lines of its rhymePool, which are only queried for the first time they're needed
+                    songLine = self.pickLine(lineDef, rhymeGroups, pastFirstWords, pastLastWords)
+                else:
+                    # No rhymePool to go on, so it could be any line at all
+                    songLine = self.queryLine(lineDef, pastFirstWords, pastLastWords)
 
-                # Execute the query and store the result
-                songLine = self.rhymadexDB.query(songQuery).fetchall()
-                if (len(songLine) == 0):
-                    # Missed on this line selection query.  Too many restrictions to find a working line.
-                    self.debugger.message("INFO", "No lines returned for this line selection query.")
+                if not songLine:
+                    # Missed on this line selection.  Too many restrictions to find a working line.
+                    self.debugger.message("INFO", "No lines found for this line selection.")
                     return False
                 else:
-                    songLine = songLine[0]
                     # Add returned firstWord/lastWords associated with a rhymeGroup to the future exclude list
                     if lineDef[self.wordIndices["firstWord"]["rhymeGroup"]]:
                         pastFirstWords[songLine[2]] = True
@@ -592,11 +953,11 @@ class song:
                     songLine = song[lineDef[self.backRefIndices["fullLine"]]]
                 else:
                     # Invalid backreference.  there's nothing there
-                    self.debugger.message("INFO", "Invalid backreference for fullLine id {}".format(
-                                                                              lineDef[self.backRefIndices["fullLine"]]))
+                    self.debugger.message("INFO", "Invalid backreference for fullLine id {}",
+                                                                              lineDef[self.backRefIndices["fullLine"]])
                     return False
 
-            self.debugger.message("INFO", "Song Line: {}".format(songLine))
+            self.debugger.message("INFO", "Song Line: {}", songLine)
             song.append(songLine)
 
         self.debugger.message("INFO", "Completed building song.")
@@ -606,6 +967,109 @@ class song:
 
         return song
 
+    def poolLines(self, poolColumn, rhymePool):
+        # Every line in tblLines with rhymePool as its poolColumn (firstPool or lastPool), sorted by syllables, and
+        # a list of just their syllables to bisect for a syllable count window.
+        # Out of the lineCache if it's there, otherwise it's one query and then it's there for next time.
+        cachedPool = self.lineCache.get((self.databaseIdentity, poolColumn, rhymePool))
+        if cachedPool:
+            self.metrics.logStat("PoolLineCacheHits", 1)
+            return cachedPool[1], cachedPool[2]
+
+        self.metrics.logStat("PoolLineCacheMisses", 1)
+        poolQuery = "SELECT {} FROM `tblLines` WHERE (`tblLines`.`{}` = ?);".format(
+                                    ", ".join("`tblLines`.`{}`".format(column) for column in self.poolLineColumns),
+                                    poolColumn)
+        self.debugger.message("QRYBLD", ".. QUERY: {}", poolQuery)
+        self.debugger.message("QRYBLD", ".. PARAMETERS: {}", [rhymePool])
+
+        # Sorted by id within each syllable count too, so the same seed always picks the same lines
+        lines = sorted((tuple(line) for line in self.fetch(poolQuery, [rhymePool], "poolLines")),
+                       key=lambda line: (line[4], line[0]))
+        cachedPool = (time.monotonic(), [line[4] for line in lines], lines)
+        self.lineCache.put((self.databaseIdentity, poolColumn, rhymePool), cachedPool)
+        return cachedPool[1], cachedPool[2]
+
+    def lineRhymePools(self, lineDef, rhymeGroups):
+        # firstWord/lastWord -> the rhymePool picked for its rhymeGroup, for the word positions lineDef has one for
+        rhymePools = {}
+        for wordIndex in self.wordIndices:
+            if lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]:
+                rhymePools[wordIndex] = rhymeGroups[lineDef[self.wordIndices[wordIndex]["rhymeGroup"]]]["rhymePool"]
+                self.debugger.message("QRYBLD", ".. {} rhymePool {}", wordIndex, rhymePools[wordIndex])
+        return rhymePools
+
+    def syllableWindow(self, lineDef):
+        # (low, high) full line syllable counts for lineDef, or None if it doesn't say
+        if not lineDef[self.fullLineIndices["Syllables"]]:
+            return None
+        self.debugger.message("QRYBLD", ".. Full line syllable count {} +- {}",
+                              lineDef[self.fullLineIndices["Syllables"]], self.syllablePadding)
+        return (int(lineDef[self.fullLineIndices["Syllables"]]) - self.syllablePadding,
+                int(lineDef[self.fullLineIndices["Syllables"]]) + self.syllablePadding)
+
+    def pickLine(self, lineDef, rhymeGroups, pastFirstWords, pastLastWords):
+        # Pick a random line for lineDef from the lines of its rhymeGroup's rhymePool: the lastWord's if it has a
+        # lastWord rhymeGroup, narrowed down to the firstWord's rhymePool too if it has a firstWord one as well.
+        # The syllable count window, the rhymePools and the past firstWords/lastWords are all checked right here,
+        # no query needed once the rhymePool's lines are in the lineCache.
+        rhymePools = self.lineRhymePools(lineDef, rhymeGroups)
+        poolWord = "lastWord" if "lastWord" in rhymePools else "firstWord"
+        lineSyllables, lines = self.poolLines(self.poolColumns[poolWord], rhymePools[poolWord])
+
+        # Full line syllable count window, if it's defined
+        lowLine, highLine = 0, len(lines)
+        syllableWindow = self.syllableWindow(lineDef)
+        if syllableWindow:
+            lowLine = bisect.bisect_left(lineSyllables, syllableWindow[0])
+            highLine = bisect.bisect_right(lineSyllables, syllableWindow[1])
+
+        # Exclude past rhymewords, so we don't continue getting the same word again and again (cause it
+        #   technically rhymes with itself..)
+        candidateLines = [line for line in lines[lowLine:highLine]
+                          if (line[2] not in pastFirstWords) and (line[3] not in pastLastWords) and
+                             all(line[self.poolLineIndices[wordIndex]] == rhymePools[wordIndex]
+                                 for wordIndex in rhymePools)]
+        self.debugger.message("INFO", "Candidate lines: {} of {}", len(candidateLines), len(lines))
+
+        if not candidateLines:
+            return None
+        return self.random.choice(candidateLines)
+
+    def queryLine(self, lineDef, pastFirstWords, pastLastWords):
+        # Pick a random line for a lineDef with no rhymeGroup straight from tblLines, since it could be any of them.
+        # Seek to a random point along the randomKey index and take the first line from there on that fits.  If
+        # there's none after that point, wrap around and take the first one before it.  Either way it's an index
+        # seek and a short scan, not a sort of every line that fits.
+        songQuery = "SELECT {} FROM `tblLines` WHERE ( ".format(
+                                    ", ".join("`tblLines`.`{}`".format(column) for column in self.poolLineColumns))
+        songParams = [] # Values for the query's ? placeholders, in order
+
+        # Add WHERE clause for full line syllable count, if it's defined:
+        syllableWindow = self.syllableWindow(lineDef)
+        if syllableWindow:
+            songQuery += "( (`tblLines`.`syllables` >= ?) AND (`tblLines`.`syllables` <= ?) ) AND "
+            songParams += list(syllableWindow)
+
+        # Past seen firstWord/lastWord rhymeWords to exclude ...
+        if (pastFirstWords):
+            songQuery += "(`tblLines`.`firstWord` NOT IN ( " + self.inList(pastFirstWords, songParams) + ") ) AND "
+        if (pastLastWords):
+            songQuery += "(`tblLines`.`lastWord` NOT IN ( " + self.inList(pastLastWords, songParams) + ") ) AND "
+
+        songParams.append(self.random.getrandbits(31))
+        afterQuery = songQuery + "(`tblLines`.`randomKey` >= ?) ) ORDER BY `tblLines`.`randomKey` LIMIT 1;"
+        beforeQuery = songQuery + "(`tblLines`.`randomKey` < ?) ) ORDER BY `tblLines`.`randomKey` LIMIT 1;"
+
+        self.debugger.message("QRYBLD", ".. QUERY: {}", afterQuery)
+        self.debugger.message("QRYBLD", ".. PARAMETERS: {}", songParams)
+
+        # Execute the query and return the line, if there is one
+        songLine = self.fetch(afterQuery, songParams, "lineSelection")
+        if (len(songLine) == 0):
+            songLine = self.fetch(beforeQuery, songParams, "lineSelection")
+        return songLine[0] if songLine else None
+
     def printSongDef(self, songDef):
         lineNum = 0
         print("* Song Definition:")
@@ -661,6 +1125,55 @@ class song:
 
 
 
+def benchmark(songDef, runs=20, rhymeGroupPoolSize=10, songVariations=8):
+    # Time the same songs picked from the database and then from a corpusEngine: picking the rhymePools for
+    #   songDef (everything song() does), then songVariations songs from the first of them.  Seeded the same both
+    #   ways.  The database side gets a one connection rhymadexPool so it isn't timing connecting, and starts with
+    #   an empty sharedPoolLineCache.
+    # The corpusEngine's distinct word counts can pick it different rhymePools, so both sides make their songs
+    #   from the ones the database side picked.  Given the same rhymePools and seed, they should be the same songs
+    #   line for line, and it says how many are.
+    benchmarkDebugger = debugger()
+    benchmarkDebugger.printEnabled = False
+    dbPool = rhymadexPool(benchmarkDebugger, poolSize=1, readOnly=True)
+
+    started = time.perf_counter()
+    engine = corpusEngine(benchmarkDebugger)
+    print("corpusEngine loaded {} lines in {:.3f}s".format(len(engine.lines), time.perf_counter() - started))
+
+    sharedPoolLineCache.clear()
+    runRhymeGroups = {}
+    databaseSongs = {}
+    matchingSongs = 0
+    for engineName, songEngine in (("database", None), ("corpusEngine", engine)):
+        poolSeconds = songSeconds = 0.0
+        songCount = 0
+        for run in range(runs):
+            started = time.perf_counter()
+            benchmarkSong = song(songDef, rhymeGroupPoolSize, dbPool=dbPool, seed=run, engine=songEngine)
+            poolSeconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            rhymeGroups = runRhymeGroups.setdefault(run, benchmarkSong.rhymeGroups)
+            for rhymeGroup in rhymeGroups:
+                if rhymeGroups[rhymeGroup]["rhymePoolCandidates"]:
+                    rhymeGroups[rhymeGroup]["rhymePool"] = rhymeGroups[rhymeGroup]["rhymePoolCandidates"][0]
+            for variation in range(songVariations):
+                benchmarkSong.random.seed(run * songVariations + variation)
+                songLines = benchmarkSong.generateSong(songDef, rhymeGroups)
+                if songLines:
+                    songCount += 1
+                if songEngine is None:
+                    databaseSongs[run, variation] = songLines
+                elif songLines == databaseSongs[run, variation]:
+                    matchingSongs += 1
+            songSeconds += time.perf_counter() - started
+        print("{:>12}: rhymePool selection {:8.3f} ms/song, {} songs {:8.3f} ms/song ({} made)".format(engineName,
+                                                                 poolSeconds * 1000 / runs, songVariations,
+                                                                 songSeconds * 1000 / runs, songCount))
+    print("corpusEngine songs the same as the database's: {} of {}".format(matchingSongs, runs * songVariations))
+    dbPool.close()
+
 if __name__ == "__main__":
     songDef = [ [None, None, None, None, None,    9, None,  "A", None, None, None, None],
                 [None, None, None, None, None,    6, None,  "A", None, None, None, None],
@@ -677,6 +1190,11 @@ if __name__ == "__main__":
                 [None, None, None, None, None, None,    5, None, None, None, None, None],
                 [None, None, None, None, None, None,    5, None, None, None, None, None] ]
 
+    if "--benchmark" in sys.argv[1:]:
+        # python rhymadex_explorer.py --benchmark compares picking from the database with picking from a corpusEngine
+        benchmark(songDef)
+        sys.exit()
+
     song = song(songDef, 10)
     song.generateSongBook(song.songDef, song.rhymeGroups, 8)
 
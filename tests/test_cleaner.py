@@ -0,0 +1,81 @@
+# test_cleaner.py
+# Golden output checks for the builder's lineCleaner (rhymadex_builder.cleaner)
+#   python -m unittest discover tests   (or python -m pytest tests)
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rhymadex_builder import cleaner
+from rhymadex_builder import lineCleanerEngine
+
+# (fragment, what the original step-by-step re.sub lineCleaner made of it).  Recorded from that cleaner before it
+#   was replaced by the precompiled one, so any change to what comes out of cleaner shows up here.  If a change is
+#   meant to, update these and bump cleaner.version so incremental builds pick it up.
+goldenLines = [
+    ('In the beginning God created the heaven and the earth',
+     'in the beginning god created the heaven and the earth'),
+    ('  And the earth was without form  ', 'the earth was without form'),
+    ('and void', 'void'),
+    ('AND darkness', 'darkness'),
+    ('andrew went home', 'andrew went home'),
+    ('and', 'and'),
+    ('And ', 'and'),
+    ('"Let there be light"', 'let there be light'),
+    ("'tis the season", 'tis the season'),
+    ("he said 'no' twice", "he said 'no' twice"),
+    ('“Smart quotes” and ‘single ones’', 'smart quotes and single ones'),
+    ('well--maybe not', 'well maybe not'),
+    ('an en–dash here', 'an endash here'),
+    ('an em—dash here', 'an emdash here'),
+    ('trailing dash-', 'trailing dash'),
+    ('-- leading dashes', 'leading dashes'),
+    ('café au lait', 'caf au lait'),
+    ('naïve résumé', 'nave rsum'),
+    ('half ½ a loaf', 'half  a loaf'),
+    ('£5 for the €uro', 'for the uro'),
+    ('œuvre…', 'uvre'),
+    ('Ünïcödé ÉVERYWHERE', 'ncd verywhere'),
+    ('', None),
+    ('   ', None),
+    ('\t\n', None),
+    ('!!!', None),
+    ('123 456', None),
+    ('9 lives of a cat 9', 'lives of a cat'),
+    ('rock & roll', 'rock and roll'),
+    ('you @ home', 'you at home'),
+    ('2+2=4 is 100% true', 'is 100percent true'),
+    ('a + b = c', 'a plus b equals c'),
+    ('[bracketed] {braced} (parens) <angled>', 'bracketed braced parens angled'),
+    ('path/to\\file', 'pathtofile'),
+    ('$money$ ~tilde~ `tick` #hash ^caret *star* _under_ |pipe|', 'money tilde tick hash caret star under pipe'),
+    ('tab\tinside\tline', 'tab\tinside\tline'),
+    ('bell\x07char and\x0bvtab', 'bellchar and\x0bvtab'),
+    ('x', None),
+    ('xy', 'xy'),
+    ('  a  ', None),
+    ('one, two; three', 'one, two; three'),
+    ('Mixed CASE Words', 'mixed case words'),
+]
+
+class testCleaner(unittest.TestCase):
+    def testClean(self):
+        for fragment, expected in goldenLines:
+            with self.subTest(fragment=fragment):
+                self.assertEqual(lineCleanerEngine.clean(fragment), expected)
+
+    def testCleanBatch(self):
+        fragments = [fragment for fragment, expected in goldenLines]
+        self.assertEqual(lineCleanerEngine.cleanBatch(fragments), [expected for fragment, expected in goldenLines])
+
+    def testFreshCleaner(self):
+        # A cleaner built from scratch cleans, and fingerprints, the same as the shared one
+        freshCleaner = cleaner()
+        self.assertEqual(freshCleaner.signature, lineCleanerEngine.signature)
+        self.assertEqual(freshCleaner.cleanBatch([fragment for fragment, expected in goldenLines]),
+                         [expected for fragment, expected in goldenLines])
+
+if __name__ == "__main__":
+    unittest.main()
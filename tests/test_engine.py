@@ -0,0 +1,97 @@
+# test_engine.py
+# Checks that a corpusEngine makes the same seeded songs as the database does
+#   python -m unittest discover tests   (or python -m pytest tests)
+
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rhymadex_builder import debugger
+from rhymadex_builder import rhymadexPool
+from rhymadex_builder import rhymadexSQLite
+from rhymadex_explorer import corpusEngine
+from rhymadex_explorer import numpy
+from rhymadex_explorer import poolLineCache
+from rhymadex_explorer import song
+
+# A bit of everything a songDef can ask for: lastWord rhymeGroups, a firstWord one, one in both positions, lines with
+#   only a syllable count or nothing at all (picked by randomKey), and a fullLine backreference
+songDef = [ [None, None, None, None, None,    6, None,  "A", None, None, None, None],
+            [None, None, None, None, None,    7, None,  "A", None, None, None, None],
+            [ "B", None, None, None, None,    5, None, None, None, None, None, None],
+            [ "B", None, None, None, None, None, None,  "A", None, None, None, None],
+            [ "C", None, None, None, None, None, None,  "C", None, None, None, None],
+            [None, None, None, None, None,    4, None, None, None, None, None, None],
+            [None, None, None, None, None, None, None, None, None, None, None, None],
+            [None, None, None, None, None, None,    0, None, None, None, None, None] ]
+
+@unittest.skipIf(numpy is None, "the corpusEngine needs numpy")
+class testEngineSongs(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A made up rhymadex: poolCount rhymePools of poolWords words each, and lines with a random word from any
+        #   of them at each end.  Every 20th line's firstWord has no rhymePool yet.
+        poolCount, poolWords, lineCount = 12, 15, 4000
+        cls.tempDir = tempfile.TemporaryDirectory()
+        databasePath = os.path.join(cls.tempDir.name, "rhymadex.db")
+        cls.configfile = os.path.join(cls.tempDir.name, "rhymadex.cfg")
+        with open(cls.configfile, "w") as configfile:
+            configfile.write("[sqlite]\npath = {}\n".format(databasePath))
+
+        cls.debugger = debugger()
+        cls.debugger.printEnabled = False
+        rhymadexDB = rhymadexSQLite(cls.debugger, databasePath)
+        rhymadexDB.query("INSERT INTO `tblSources` (`id`, `sourceName`, `dtmInit`) VALUES (1, 'test', '2026-01-01')",
+                         None, "", True)
+
+        lineRandom = random.Random(0)
+        randomKeys = lineRandom.sample(range(2 ** 31), lineCount)
+        lines = []
+        for lineId in range(1, lineCount + 1):
+            firstPool, lastPool = lineRandom.randrange(poolCount), lineRandom.randrange(poolCount)
+            firstWord = "word{}x{}".format(firstPool, lineRandom.randrange(poolWords))
+            lastWord = "word{}x{}".format(lastPool, lineRandom.randrange(poolWords))
+            lines.append((lineId, firstWord, lastWord, "{} line {} {}".format(firstWord, lineId, lastWord),
+                          lineRandom.randint(2, 10), 1, lineId, None if lineId % 20 == 0 else firstPool, lastPool,
+                          randomKeys[lineId - 1]))
+        rhymadexDB.queryMany("INSERT INTO `tblLines` (`id`, `firstWord`, `lastWord`, `line`, `syllables`, `source`, \
+                              `lineHash`, `firstPool`, `lastPool`, `randomKey`) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             lines)
+        rhymadexDB.refreshPoolStats(range(poolCount))
+
+        cls.engine = corpusEngine(cls.debugger, rhymadexDB)
+        rhymadexDB.close()
+        cls.dbPool = rhymadexPool(cls.debugger, cls.configfile, poolSize=1, readOnly=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dbPool.close()
+        cls.tempDir.cleanup()
+
+    def testSameSongs(self):
+        # Given the same rhymePools and seed, the database and the corpusEngine pick the same lines
+        songsMade = 0
+        for seed in range(20):
+            seededSong = song(songDef, 3, dbPool=self.dbPool, seed=seed, lineCache=poolLineCache())
+            rhymeGroups = seededSong.rhymeGroups
+            for rhymeGroup in rhymeGroups:
+                if rhymeGroups[rhymeGroup]["rhymePoolCandidates"]:
+                    rhymeGroups[rhymeGroup]["rhymePool"] = rhymeGroups[rhymeGroup]["rhymePoolCandidates"][0]
+            for variation in range(4):
+                songs = []
+                for songEngine in (None, self.engine):
+                    seededSong.engine = songEngine
+                    seededSong.random.seed(seed * 4 + variation)
+                    songs.append(seededSong.generateSong(songDef, rhymeGroups))
+                with self.subTest(seed=seed, variation=variation):
+                    self.assertEqual(songs[0], songs[1])
+                songsMade += bool(songs[0])
+        # Not just the same because neither one could make a song
+        self.assertGreater(songsMade, 40)
+
+if __name__ == "__main__":
+    unittest.main()
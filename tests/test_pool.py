@@ -0,0 +1,86 @@
+# test_pool.py
+# Checks that songs on a rhymadexPool get through a pooled connection dropping mid-query
+#   python -m unittest discover tests   (or python -m pytest tests)
+
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rhymadex_builder import debugger
+from rhymadex_builder import rhymadexPool
+from rhymadex_builder import rhymadexSQLite
+from rhymadex_explorer import poolLineCache
+from rhymadex_explorer import song
+
+songDef = [ [None, None, None, None, None,    6, None,  "A", None, None, None, None],
+            [None, None, None, None, None,    7, None,  "A", None, None, None, None],
+            [None, None, None, None, None, None, None, None, None, None, None, None] ]
+
+class testPoolReconnect(unittest.TestCase):
+    def setUp(self):
+        # A small made up rhymadex: lines with a random word out of one of poolCount rhymePools at each end
+        poolCount, lineCount = 4, 400
+        self.tempDir = tempfile.TemporaryDirectory()
+        databasePath = os.path.join(self.tempDir.name, "rhymadex.db")
+        configfile = os.path.join(self.tempDir.name, "rhymadex.cfg")
+        with open(configfile, "w") as configFile:
+            configFile.write("[sqlite]\npath = {}\n".format(databasePath))
+
+        self.debugger = debugger()
+        self.debugger.printEnabled = False
+        rhymadexDB = rhymadexSQLite(self.debugger, databasePath)
+        rhymadexDB.query("INSERT INTO `tblSources` (`id`, `sourceName`, `dtmInit`) VALUES (1, 'test', '2026-01-01')",
+                         None, "", True)
+        lineRandom = random.Random(0)
+        lines = []
+        for lineId in range(1, lineCount + 1):
+            firstPool, lastPool = lineRandom.randrange(poolCount), lineRandom.randrange(poolCount)
+            firstWord = "word{}x{}".format(firstPool, lineRandom.randrange(10))
+            lastWord = "word{}x{}".format(lastPool, lineRandom.randrange(10))
+            lines.append((lineId, firstWord, lastWord, "{} line {} {}".format(firstWord, lineId, lastWord),
+                          lineRandom.randint(2, 10), 1, lineId, firstPool, lastPool, lineRandom.getrandbits(31)))
+        rhymadexDB.queryMany("INSERT INTO `tblLines` (`id`, `firstWord`, `lastWord`, `line`, `syllables`, `source`, \
+                              `lineHash`, `firstPool`, `lastPool`, `randomKey`) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             lines)
+        rhymadexDB.refreshPoolStats(range(poolCount))
+        rhymadexDB.close()
+
+        self.dbPool = rhymadexPool(self.debugger, configfile, poolSize=1, readOnly=True)
+
+    def tearDown(self):
+        self.dbPool.close()
+        self.tempDir.cleanup()
+
+    def killNextQuery(self):
+        # Take the pool's connection and have it close out from under its next query, like a server dropping it
+        rhymadexDB, lastUsed = self.dbPool.idle.get_nowait()
+        execute = rhymadexDB.execute
+        def killedExecute(*args, **kwargs):
+            rhymadexDB.connection.close()
+            return execute(*args, **kwargs)
+        rhymadexDB.execute = killedExecute
+        self.dbPool.idle.put((rhymadexDB, lastUsed))
+        return rhymadexDB
+
+    def makeSong(self):
+        songs = song(songDef, 2, dbPool=self.dbPool, seed=1, lineCache=poolLineCache())
+        songs.rhymeGroups["A"]["rhymePool"] = songs.rhymeGroups["A"]["rhymePoolCandidates"][0]
+        return songs.generateSong(songDef, songs.rhymeGroups)
+
+    def testDroppedConnection(self):
+        expected = self.makeSong()
+        self.assertTrue(expected)
+
+        killed = self.killNextQuery()
+        self.assertEqual(self.makeSong(), expected)
+        self.assertEqual(self.debugger.getStat("PoolReconnects"), 1)
+        # The dead connection was replaced, not put back or counted twice
+        self.assertEqual(self.dbPool.opened, 1)
+        self.assertIsNot(self.dbPool.acquire(), killed)
+
+if __name__ == "__main__":
+    unittest.main()